@@ -4,17 +4,58 @@ set -euo pipefail
 export DIST
 export SRC
 
+# optional stage cache, wired up by the grading worker:
+#   STAGE_CACHE:  read-only directory holding <stage>.tar for cache hits
+#   STAGE_EXPORT: directory where freshly built stages are archived
+STAGE_CACHE="${STAGE_CACHE:-}"
+STAGE_EXPORT="${STAGE_EXPORT:-}"
+
+# everything a stage may leave behind for later stages. stage archives hold
+# paths relative to / so they can be restored into all of these at once.
+STAGE_ROOTS=("$DIST" "$SRC" /tmp)
+
 cd /workspace
 
+# machine-readable stage timings for the grading worker's metrics
+report_timing() {
+  local label="$1"
+  local started="$2"
+  local ms=$((($(date +%s%N) - started) / 1000000))
+  printf '[fls-timing] stage.%s %d.%03d\n' "$label" $((ms / 1000)) $((ms % 1000))
+}
+
+# one line per path under the stage roots: path relative to /, type, mode,
+# size and mtime
+stage_snapshot() {
+  find "${STAGE_ROOTS[@]}" -mindepth 1 -printf '%p\t%y\t%m\t%s\t%T@\n' |
+    sed 's,^/,,' | sort
+}
+
 run_stage() {
   local label="$1"
   local limit="$2"
   local script="$3"
   local rootfs="$DIST/$label"
+  local started
+  started="$(date +%s%N)"
+
+  if [ -n "$STAGE_CACHE" ] && [ -f "$STAGE_CACHE/$label.tar" ]; then
+    echo "[fls] $label stage restored from cache"
+    tar -xpSf "$STAGE_CACHE/$label.tar" --numeric-owner -C /
+    report_timing "$label" "$started"
+    return 0
+  fi
+
   mkdir -p "$rootfs"
 
+  local before=""
+  if [ -n "$STAGE_EXPORT" ]; then
+    before="$(stage_snapshot)"
+  fi
+
   timeout --preserve-status "$limit" env ROOTFS="$rootfs" "$script"
   status=$?
+  report_timing "$label" "$started"
 
   if [ "$status" -eq 124 ]; then
     echo "[fls] ERROR: $label stage timed out after $limit" >&2
@@ -23,6 +64,42 @@ run_stage() {
     echo "[fls] ERROR: $label stage failed (exit $status)" >&2
     exit "$status"
   fi
+
+  if [ -n "$STAGE_EXPORT" ]; then
+    export_stage "$label" "$before"
+  fi
+}
+
+# archive everything a stage added to or changed in the stage roots,
+# including entries of earlier stages, so that restoring it reproduces the
+# stage exactly: later stages may rely on what it left in $SRC or /tmp as
+# much as on its output in $DIST. removals cannot be replayed from an
+# archive, so such stages are not cached.
+export_stage() {
+  local label="$1"
+  local before="$2"
+  local after
+  after="$(stage_snapshot)"
+
+  if [ -n "$(comm -23 <(cut -f1,2 <<<"$before") <(cut -f1,2 <<<"$after"))" ]; then
+    echo "[fls] $label stage removed or replaced files of earlier stages; not caching it"
+    return 0
+  fi
+
+  local changed
+  mapfile -t changed < <(
+    {
+      echo "${DIST#/}/$label"
+      comm -13 <(echo "$before") <(echo "$after") | cut -f1
+    } | sort -u
+  )
+  mkdir -p "$STAGE_EXPORT"
+  tar -cpSf "$STAGE_EXPORT/$label.tar.tmp" --numeric-owner --no-recursion -C / \
+    "${changed[@]}" &&
+    mv "$STAGE_EXPORT/$label.tar.tmp" "$STAGE_EXPORT/$label.tar" || {
+    rm -f "$STAGE_EXPORT/$label.tar.tmp"
+    echo "[fls] warning: failed to archive $label stage for the cache" >&2
+  }
 }
 
 run_stage busybox 5m  ./busybox/build.sh
@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
 
+import codecs
 import http.server
+import json
+import os
 import re
 import secrets
+import selectors
 import socketserver
 import subprocess
+import struct
 import sys
 import threading
 import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable, Sequence
+from typing import Callable, Iterator, Sequence
 
 # -------------------------
 # Configuration
@@ -23,6 +31,15 @@ LOGIN_RE = re.compile(r"login:")
 
 PID_RE = re.compile(r"^\d+$")
 
+# framing of guest commands; the quoted form is what the shell is sent
+SENTINEL = "FLSCMD"
+SENTINEL_QUOTED = 'FLS""CMD'
+
+# console reads; a pipe holds at most this much at a time anyway
+CONSOLE_READ_BYTES = 65536
+# prompts are matched against the unfinished last line; keep only its end
+MAX_PARTIAL_LINE = 4096
+
 NET_PORT = secrets.randbelow(10000) + 30000  # 30000–39999
 NET_TOKEN = secrets.token_hex(16)
 
@@ -31,53 +48,80 @@ NET_TOKEN = secrets.token_hex(16)
 # QEMU command
 # -------------------------
 
+# the worker sizes the VM to the grader container's limits
+VM_CPUS = max(1, int(os.environ.get("FLS_VM_CPUS", "1")))
+VM_MEM_MIB = max(256, int(os.environ.get("FLS_VM_MEM_MIB", "1024")))
+
+
+def kvm_available() -> bool:
+    """
+    Whether /dev/kvm was passed into the container and we may open it.
+    """
+    return os.access("/dev/kvm", os.R_OK | os.W_OK)
+
+
+def build_qemu_cmd(image: Path) -> tuple[list[str], dict]:
+    """
+    The QEMU command line that boots image, and the VM configuration it
+    picked, for the report.
+    """
+    kvm = kvm_available()
+    # multi-threaded TCG runs one host thread per vCPU
+    accel = "kvm" if kvm else "tcg,thread=multi"
 
-def build_qemu_cmd(image: Path) -> list[str]:
     if "x86" in ARCH:
-        return [
+        cpu = "host" if kvm else "qemu64"
+        cmd = [
             "qemu-system-x86_64",
             "-machine",
             "q35",
-            "-m",
-            "1024",
-            "-nographic",
+            "-cpu",
+            cpu,
             "-drive",
             "if=pflash,format=raw,readonly=on,file=/usr/share/OVMF/OVMF_CODE_4M.fd",
             "-drive",
             "if=pflash,format=raw,file=/usr/share/OVMF/OVMF_VARS_4M.fd",
-            "-drive",
-            f"if=virtio,format=raw,file={image}",
-            "-serial",
-            "mon:stdio",
-            "-netdev",
-            "user,id=net0",
-            "-device",
-            "virtio-net-pci,netdev=net0",
         ]
     else:
-        return [
+        cpu = "host" if kvm else "cortex-a72"
+        cmd = [
             "qemu-system-aarch64",
             "-machine",
-            "virt",
+            # KVM needs the GIC version of the host
+            "virt,gic-version=max" if kvm else "virt",
             "-cpu",
-            "cortex-a72",
-            "-m",
-            "1024",
-            "-nographic",
+            cpu,
             "-drive",
             "if=pflash,format=raw,readonly=on,file=/usr/share/AAVMF/AAVMF_CODE.fd",
             "-drive",
             "if=pflash,format=raw,file=/usr/share/AAVMF/AAVMF_VARS.fd",
-            "-drive",
-            f"if=virtio,format=raw,file={image}",
-            "-serial",
-            "mon:stdio",
-            "-netdev",
-            "user,id=net0",
-            "-device",
-            "virtio-net-pci,netdev=net0",
         ]
 
+    config = {
+        "accel": accel.split(",")[0],
+        "cpu": cpu,
+        "smp": VM_CPUS,
+        "memoryMiB": VM_MEM_MIB,
+    }
+
+    return cmd + [
+        "-accel",
+        accel,
+        "-smp",
+        str(VM_CPUS),
+        "-m",
+        str(VM_MEM_MIB),
+        "-nographic",
+        "-drive",
+        f"if=virtio,format=raw,file={image}",
+        "-serial",
+        "mon:stdio",
+        "-netdev",
+        "user,id=net0",
+        "-device",
+        "virtio-net-pci,netdev=net0",
+    ], config
+
 
 # -------------------------
 # Failure handling
@@ -92,6 +136,91 @@ def fail(msg: str) -> None:
     raise TestFailure(msg)
 
 
+class GuestFailure(TestFailure):
+    """
+    The guest printed something it never recovers from.
+    """
+
+
+# console lines that mean the VM is done for, with their diagnosis. they
+# are checked on every line as it arrives, so a broken boot fails in
+# seconds instead of running into the login timeout.
+FATAL_SIGNATURES = [
+    (re.compile(r"Kernel panic - not syncing: ?(.*)"), "kernel panic: {0}"),
+    (re.compile(r"Attempted to kill init"), "init exited (attempted to kill init)"),
+    (re.compile(r"No working init found"), "no working init found"),
+    (
+        re.compile(r"VFS: (?:Unable to mount root fs|Cannot open root device)(.*)"),
+        "cannot mount the root filesystem: {0}",
+    ),
+]
+
+# the same, for signs that boot ended up somewhere other than a login
+# prompt. these only apply until login, since a shell is expected after.
+BOOT_SIGNATURES = FATAL_SIGNATURES + [
+    (
+        re.compile(r"emergency mode|Give root password for maintenance"),
+        "boot dropped into an emergency shell",
+    ),
+    (
+        re.compile(r"can't access tty; job control turned off"),
+        "boot dropped into a shell instead of a login prompt",
+    ),
+]
+
+
+# -------------------------
+# Timing
+# -------------------------
+
+
+def report_timing(phase: str, started: float) -> None:
+    """
+    Print a timing marker for the grading worker's metrics.
+    """
+    print(f"\n[fls-timing] grade.{phase} {time.monotonic() - started:.3f}", flush=True)
+
+
+# -------------------------
+# Result report
+# -------------------------
+
+# read by the worker after we exit, and shown to students
+REPORT_PATH = IMAGE.parent / "report.json"
+MAX_MESSAGE_CHARS = 500
+
+report: dict = {
+    "version": 1,
+    "passed": False,
+    "failure": None,
+    "failedTest": None,
+    "qemu": None,
+    "bootSeconds": [],
+    "tests": [],
+}
+
+
+def record_test(
+    name: str, started: float, error: Exception | None = None, **extra
+) -> None:
+    entry = {
+        "name": name,
+        "passed": error is None,
+        "seconds": round(time.monotonic() - started, 3),
+        **extra,
+    }
+    if error is not None:
+        entry["message"] = str(error)[:MAX_MESSAGE_CHARS]
+        report["failedTest"] = name
+    report["tests"].append(entry)
+
+
+def write_report() -> None:
+    tmp = REPORT_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(report))
+    os.replace(tmp, REPORT_PATH)
+
+
 # -------------------------
 # HTTP Server
 # -------------------------
@@ -124,74 +253,248 @@ def start_http_server(
     return thread, httpd
 
 
+# -------------------------
+# Serial console
+# -------------------------
+
+
+class Console:
+    """
+    The guest's serial console, read in blocks as it arrives.
+
+    Output is echoed to our stdout one block at a time and split into lines
+    incrementally. Complete lines are queued until a wait consumes them;
+    prompts are matched against the unfinished last line. Waits end exactly
+    at their deadline.
+    """
+
+    def __init__(self, stream) -> None:
+        self.fd = stream.fileno()
+        os.set_blocking(self.fd, False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.fd, selectors.EVENT_READ)
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.lines: deque[str] = deque()
+        self.partial = ""
+        # a "\r" at the end of a block may be the first half of "\r\n"
+        self.carry = ""
+        self.closed = False
+        self.signatures = FATAL_SIGNATURES
+
+    def _read(self, timeout: float) -> str:
+        """
+        Wait up to timeout seconds for output and return it with newlines
+        normalized, or "" if there was none.
+        """
+        if not self.selector.select(timeout):
+            return ""
+        try:
+            data = os.read(self.fd, CONSOLE_READ_BYTES)
+        except BlockingIOError:
+            return ""
+
+        if not data:
+            self.closed = True
+        text = self.carry + self.decoder.decode(data, final=self.closed)
+        self.carry = ""
+        if text.endswith("\r") and not self.closed:
+            text, self.carry = text[:-1], "\r"
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        return text
+
+    def _fill(self, deadline: float, what: str) -> None:
+        """
+        Queue whatever output arrives before deadline.
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"timeout waiting for {what}")
+        if self.closed:
+            raise EOFError(f"console closed while waiting for {what}")
+
+        text = self._read(remaining)
+        if text:
+            *complete, partial = (self.partial + text).split("\n")
+            self.lines.extend(complete)
+            self.partial = partial[-MAX_PARTIAL_LINE:]
+            for line in complete:
+                self._check(line)
+
+    def _check(self, line: str) -> None:
+        for pattern, diagnosis in self.signatures:
+            match = pattern.search(line)
+            if match:
+                detail = match.group(1).strip() if pattern.groups else ""
+                raise GuestFailure(diagnosis.format(detail).rstrip(": "))
+
+    def wait_for(
+        self, pattern: re.Pattern, timeout: float, lines: list[str] | None = None
+    ) -> None:
+        """
+        Read until pattern shows up on the unfinished last line, collecting
+        the complete lines before it. The matched line is consumed.
+        """
+        deadline = time.monotonic() + timeout
+
+        while True:
+            if lines is not None:
+                lines.extend(self.lines)
+            self.lines.clear()
+
+            if pattern.search(self.partial):
+                self.partial = ""
+                return
+
+            self._fill(deadline, pattern.pattern)
+
+    def wait_for_line(
+        self, pattern: re.Pattern, timeout: float, lines: list[str] | None = None
+    ) -> re.Match:
+        """
+        Read until a complete line matches pattern, collecting the lines
+        before it. Lines after it stay queued for the next wait.
+        """
+        deadline = time.monotonic() + timeout
+
+        while True:
+            while self.lines:
+                line = self.lines.popleft()
+                match = pattern.search(line)
+                if match:
+                    return match
+                if lines is not None:
+                    lines.append(line)
+
+            self._fill(deadline, pattern.pattern)
+
+    def close(self) -> None:
+        self.selector.close()
+
+
 # -------------------------
 # VM abstraction
 # -------------------------
 
 
+@dataclass
+class CommandResult:
+    output: list[str]
+    status: int
+
+
 class VM:
     def __init__(self, image: Path):
         self.image = image
         self.proc: subprocess.Popen | None = None
+        self.console: Console | None = None
 
     def start(self) -> None:
+        cmd, qemu = build_qemu_cmd(self.image)
+        print(
+            f"[fls] qemu: accel={qemu['accel']} cpu={qemu['cpu']} "
+            f"smp={qemu['smp']} memory={qemu['memoryMiB']}M",
+            flush=True,
+        )
+        report["qemu"] = qemu
+
         self.proc = subprocess.Popen(
-            build_qemu_cmd(self.image),
+            cmd,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True,
+            bufsize=0,
         )
         assert self.proc.stdin and self.proc.stdout
+        self.console = Console(self.proc.stdout)
 
+        started = time.monotonic()
         boot_lines: list[str] = []
-        self._wait_for(LOGIN_RE, 30, boot_lines)
+        self.console.signatures = BOOT_SIGNATURES
+        try:
+            self._wait_for(LOGIN_RE, 30, boot_lines)
+        except TimeoutError:
+            fail("no login prompt within 30s of starting the VM")
+        self.console.signatures = FATAL_SIGNATURES
+        report_timing("boot", started)
+        report["bootSeconds"].append(round(time.monotonic() - started, 3))
         test_kernel_logs(boot_lines)
 
-        self.getoutput("root")
-        self.getoutput("export TERM=dumb")
-        self.getoutput("unset LS_COLORS")
+        # the shell is ready once it prompts; everything after that is framed
+        self._send("root")
+        try:
+            self._wait_for(PROMPT_RE, 5)
+        except TimeoutError:
+            fail("no shell prompt within 5s of logging in as root")
+        self.run("export TERM=dumb")
+        self.run("unset LS_COLORS")
 
     def _wait_for(
         self, pattern: re.Pattern, timeout: int, lines: list[str] | None = None
     ) -> None:
-        assert self.proc and self.proc.stdout
-        start = time.time()
-        buf = ""
-
-        while True:
-            if time.time() - start > timeout:
-                raise TimeoutError(f"timeout waiting for {pattern.pattern}")
-
-            ch = self.proc.stdout.read(1)
-            if not ch:
-                continue
-
-            sys.stdout.write(ch)
-            sys.stdout.flush()
-
-            buf += ch
-
-            while "\n" in buf:
-                line, buf = buf.split("\n", 1)
-                if lines is not None:
-                    lines.append(line)
-
-            if pattern.search(buf):
-                return
-
-    def getoutput(self, cmd: str, timeout: int = 5) -> list[str]:
+        assert self.console
+        with self._guest():
+            self.console.wait_for(pattern, timeout, lines)
+
+    @contextmanager
+    def _guest(self) -> Iterator[None]:
+        """
+        Turn QEMU exiting under a console wait into a test failure.
+        """
+        assert self.proc
+        try:
+            yield
+        except EOFError:
+            try:
+                status = self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                fail("the VM's console closed")
+            fail(f"the VM shut down unexpectedly (QEMU exit status {status})")
+
+    def _send(self, line: str) -> None:
         assert self.proc and self.proc.stdin
-        lines: list[str] = []
-        self.proc.stdin.write(cmd + "\n")
+        self.proc.stdin.write((line + "\n").encode())
         self.proc.stdin.flush()
-        self._wait_for(PROMPT_RE, timeout, lines)
-        return lines[1:]  # drop echoed command
+
+    def run(self, cmd: str, timeout: float = 5) -> CommandResult:
+        """
+        Run cmd in the guest shell and return its output and exit status.
+
+        The command is framed by sentinel lines carrying a fresh token, so
+        its output is known to be complete as soon as the end sentinel
+        arrives, whatever it contains. The sentinels are split by quotes in
+        the command line itself, so the shell's echo never matches.
+        """
+        assert self.console
+        token = secrets.token_hex(8)
+        begin = re.compile(f"{SENTINEL}BEGIN{token}$")
+        end = re.compile(f"^(.*){SENTINEL}END{token} (\\d+)$")
+
+        self._send(
+            f'echo "{SENTINEL_QUOTED}BEGIN{token}"; {cmd}; '
+            f'echo "{SENTINEL_QUOTED}END{token} $?"'
+        )
+
+        deadline = time.monotonic() + timeout
+        try:
+            with self._guest():
+                self.console.wait_for_line(begin, timeout)
+                output: list[str] = []
+                match = self.console.wait_for_line(
+                    end, max(0.0, deadline - time.monotonic()), output
+                )
+        except TimeoutError:
+            fail(f"`{cmd}` did not finish within {timeout:g}s")
+        # output without a trailing newline ends up on the sentinel's line
+        if match[1]:
+            output.append(match[1])
+        return CommandResult(output, int(match[2]))
 
     def shutdown(self) -> None:
-        assert self.proc and self.proc.stdin
-        self.proc.stdin.write("poweroff\n")
-        self.proc.stdin.flush()
+        assert self.proc
+        self._send("poweroff")
         self.proc.wait(timeout=20)
 
     def close(self) -> None:
@@ -199,16 +502,23 @@ class VM:
             self.proc.kill()
             self.proc.wait()
             self.proc = None
+        if self.console:
+            self.console.close()
+            self.console = None
 
     def __enter__(self):
         self.start()
         return self
 
     def __exit__(self, exc_type, exc, tb):
+        # a failed suite has nothing left to keep; don't wait on a guest
+        # that may be wedged
         try:
-            if self.proc:
+            if self.proc and exc_type is None:
                 self.shutdown()
         except Exception:
+            pass
+        finally:
             self.close()
 
 
@@ -218,22 +528,32 @@ class VM:
 
 
 class Test:
+    name = "test"
+
     def run(self, vm: VM) -> None:
         raise NotImplementedError
 
 
 class CommandTest(Test):
-    def __init__(self, cmd: str, check: Callable[[list[str]], None]):
+    def __init__(
+        self,
+        name: str,
+        cmd: str,
+        check: Callable[[CommandResult], None],
+        timeout: float = 5,
+    ):
+        self.name = name
         self.cmd = cmd
         self.check = check
+        self.timeout = timeout
 
     def run(self, vm: VM) -> None:
-        out = vm.getoutput(self.cmd)
-        self.check(out)
+        self.check(vm.run(self.cmd, self.timeout))
 
 
 class SyncPoint(Test):
-    def __init__(self, fn: Callable[[VM], None]):
+    def __init__(self, name: str, fn: Callable[[VM], None]):
+        self.name = name
         self.fn = fn
 
     def run(self, vm: VM) -> None:
@@ -253,14 +573,21 @@ def test_kernel_logs(lines: list[str]) -> None:
         fail("no kernel boot logs detected before login")
 
 
-def test_ls(out: list[str]) -> None:
+def require_success(result: CommandResult) -> None:
+    if result.status != 0:
+        fail(f"command exited with status {result.status}")
+
+
+def test_ls(result: CommandResult) -> None:
     required = {"bin", "usr", "etc", "proc", "sys", "dev"}
-    missing = required - set(out)
+    missing = required - set(result.output)
     if missing:
         fail(f"missing directories in /: {', '.join(sorted(missing))}")
 
 
-def test_mount(out: list[str]) -> None:
+def test_mount(result: CommandResult) -> None:
+    out = result.output
+
     def has(fs: str, mp: str) -> bool:
         return any(fs in l and mp in l for l in out)
 
@@ -272,36 +599,38 @@ def test_mount(out: list[str]) -> None:
         fail("/dev not mounted")
 
 
-def require_pids(out: list[str], name: str) -> None:
-    if not any(PID_RE.fullmatch(l) for l in out):
+def require_pids(result: CommandResult, name: str) -> None:
+    if not any(PID_RE.fullmatch(l) for l in result.output):
         fail(f"{name} not running")
 
 
 def wait_for_default_route(vm: VM, timeout: int = 20) -> None:
-    start = time.time()
-    while time.time() - start < timeout:
-        out = vm.getoutput("ip route show")
-        if any(l.startswith("default ") for l in out):
-            return
-        time.sleep(2)
-    fail("no default route installed")
-
-
-def test_http_fetch(out: list[str]) -> None:
-    if out != [NET_TOKEN]:
+    # poll inside the guest, so the route is noticed within 0.1s of showing up
+    has_route = 'ip route show | grep -q "^default "'
+    result = vm.run(
+        f"i=0; until {has_route} || [ $i -ge {timeout * 10} ]; do "
+        f"i=$((i+1)); sleep 0.1 2>/dev/null || sleep 1; done; {has_route}",
+        timeout=timeout + 5,
+    )
+    if result.status != 0:
+        fail("no default route installed")
+
+
+def test_http_fetch(result: CommandResult) -> None:
+    if result.output != [NET_TOKEN]:
         fail("failed to fetch network test payload")
 
 
-def test_time(out: list[str]) -> None:
+def test_time(result: CommandResult) -> None:
     try:
-        if int(out[0]) < 2025:
+        if int(result.output[0]) < 2025:
             fail("system time not set")
     except Exception:
         fail("failed to read system time")
 
 
-def test_persistence(out: list[str]) -> None:
-    if out != ["hello"]:
+def test_persistence(result: CommandResult) -> None:
+    if result.output != ["hello"]:
         fail("persistence test failed")
 
 
@@ -311,23 +640,132 @@ def test_persistence(out: list[str]) -> None:
 
 filename = f"{secrets.token_hex(5)}.txt"
 
+# test names show up in timing markers; keep them in sync with
+# TIMING_MARKER_RE in the worker's metrics module.
 test1 = [
-    CommandTest("ls -1 /", test_ls),
-    CommandTest("mount", test_mount),
-    CommandTest("pgrep udevd", lambda o: require_pids(o, "eudev")),
-    CommandTest("pgrep dhcpcd", lambda o: require_pids(o, "dhcpcd")),
-    CommandTest("pgrep chronyd || pgrep chrony", lambda o: require_pids(o, "chrony")),
-    SyncPoint(wait_for_default_route),
+    CommandTest("ls", "ls -1 /", test_ls),
+    CommandTest("mount", "mount", test_mount),
+    CommandTest("udevd", "pgrep udevd", lambda o: require_pids(o, "eudev")),
+    CommandTest("dhcpcd", "pgrep dhcpcd", lambda o: require_pids(o, "dhcpcd")),
+    CommandTest(
+        "chrony",
+        "pgrep chronyd || pgrep chrony",
+        lambda o: require_pids(o, "chrony"),
+    ),
+    SyncPoint("route", wait_for_default_route),
     CommandTest(
+        "http",
         f"wget -qO- http://10.0.2.2:{NET_PORT}/net-test",
         test_http_fetch,
+        timeout=10,
     ),
-    CommandTest("date +%Y", test_time),
-    CommandTest(f"echo hello > /{filename}", lambda _: None),
-    CommandTest("sync", lambda _: None),
+    CommandTest("time", "date +%Y", test_time),
+    CommandTest("write", f"echo hello > /{filename}", require_success),
+    CommandTest("sync", "sync", require_success, timeout=15),
 ]
 
-test2 = [CommandTest(f"grep -x hello /{filename}", test_persistence)]
+test2 = [CommandTest("persistence", f"grep -x hello /{filename}", test_persistence)]
+
+
+# -------------------------
+# Offline persistence check
+# -------------------------
+
+GPT_SIGNATURE = b"EFI PART"
+# the header comes from the student's image: entries must be at least as
+# large as the spec's, and the table no larger than a generous 1 MiB (the
+# usual one is 128 entries of 128 bytes)
+GPT_MIN_ENTRY_SIZE = 128
+GPT_MAX_TABLE_BYTES = 1024 * 1024
+EXT_MAGIC = 0xEF53
+EXT_SUPERBLOCK_OFFSET = 1024
+# incompat feature: the journal must be replayed before the fs is current
+EXT_INCOMPAT_RECOVER = 0x0004
+
+
+@dataclass
+class Partition:
+    offset: int
+    size: int
+
+
+def read_gpt_partitions(image: Path) -> list[Partition]:
+    """
+    The partitions in image's GPT, or [] if it has none or its header is
+    implausible.
+    """
+    with image.open("rb") as f:
+        for sector in (512, 4096):
+            f.seek(sector)
+            header = f.read(92)
+            if header[:8] == GPT_SIGNATURE:
+                break
+        else:
+            return []
+
+        entries_lba, count, entry_size = struct.unpack_from("<QII", header, 72)
+        if entry_size < GPT_MIN_ENTRY_SIZE or count * entry_size > GPT_MAX_TABLE_BYTES:
+            print(f"\n[fls] ignoring a GPT of {count} entries of {entry_size} bytes")
+            return []
+        f.seek(entries_lba * sector)
+        table = f.read(count * entry_size)
+
+    partitions = []
+    for i in range(count):
+        entry = table[i * entry_size : (i + 1) * entry_size]
+        if len(entry) < 48 or entry[:16] == bytes(16):
+            continue
+        first, last = struct.unpack_from("<QQ", entry, 32)
+        partitions.append(Partition(first * sector, (last - first + 1) * sector))
+    return partitions
+
+
+def clean_ext_filesystem(image: Path, part: Partition) -> bool:
+    """
+    Whether part holds an ext2/3/4 filesystem that needs no journal replay.
+    """
+    with image.open("rb") as f:
+        f.seek(part.offset + EXT_SUPERBLOCK_OFFSET)
+        sb = f.read(1024)
+    if len(sb) < 1024 or struct.unpack_from("<H", sb, 56)[0] != EXT_MAGIC:
+        return False
+    incompat = struct.unpack_from("<I", sb, 96)[0]
+    return not incompat & EXT_INCOMPAT_RECOVER
+
+
+def read_file_offline(image: Path, part: Partition, path: str) -> str | None:
+    """
+    Read path from the ext filesystem in part without mounting it or
+    writing to the image. Returns None if it cannot be read.
+    """
+    try:
+        proc = subprocess.run(
+            ["debugfs", "-R", f"cat {path}", f"{image}?offset={part.offset}"],
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if proc.returncode != 0 or "not found" in proc.stderr:
+        return None
+    return proc.stdout
+
+
+def persisted_offline(image: Path, path: str, line: str) -> bool:
+    """
+    Whether a file holding line can be seen in the image after the VM shut
+    down. Only a positive answer is final: anything unusual (no GPT, no
+    clean ext filesystem, no debugfs, a missing file) returns False, and
+    the caller checks inside a booted VM instead.
+    """
+    for part in read_gpt_partitions(image):
+        if not clean_ext_filesystem(image, part):
+            continue
+        content = read_file_offline(image, part, path)
+        if content is not None and line in content.splitlines():
+            return True
+    return False
 
 
 # -------------------------
@@ -338,19 +776,41 @@ test2 = [CommandTest(f"grep -x hello /{filename}", test_persistence)]
 def run_suite(tests: Sequence[Test]) -> None:
     with VM(IMAGE) as vm:
         for t in tests:
-            t.run(vm)
+            started = time.monotonic()
+            try:
+                t.run(vm)
+            except Exception as e:
+                record_test(t.name, started, e)
+                raise
+            report_timing(f"test.{t.name}", started)
+            record_test(t.name, started)
 
 
 if __name__ == "__main__":
     thread, httpd = start_http_server(NET_PORT)
     try:
         run_suite(test1)
-        run_suite(test2)
+
+        # a second boot is only needed when the image cannot be read here
+        started = time.monotonic()
+        if persisted_offline(IMAGE, f"/{filename}", "hello"):
+            print("\n[fls] persistence verified in the image without booting it again")
+            report_timing("test.persistence", started)
+            record_test("persistence", started, offline=True)
+        else:
+            print("\n[fls] checking persistence in a second boot")
+            run_suite(test2)
+        report["passed"] = True
         print("\n>>>> PASSED!")
     except TestFailure as e:
+        report["failure"] = str(e)[:MAX_MESSAGE_CHARS]
         print(f"\n>>>> FAIL: {e}")
         sys.exit(1)
+    except Exception as e:
+        report["failure"] = f"grader error: {e}"[:MAX_MESSAGE_CHARS]
+        raise
     finally:
+        write_report()
         httpd.shutdown()
         httpd.server_close()
         thread.join()
@@ -1,8 +1,16 @@
 import { db } from "@/app/db";
-import { apiKeyTable } from "@/app/db/schema";
+import { submissionTable } from "@/app/db/schema";
+import { SubmissionStatus } from "@/app/db/types";
 import { requireAdmin } from "@/app/lib/apikey";
-import { eq } from "drizzle-orm";
+import {
+  pingWorker,
+  renewLease,
+  withGraderFeatures,
+} from "@/app/lib/grader";
+import { and, eq } from "drizzle-orm";
 
+// Heartbeat of workers that do not report their jobs: renews the lease of
+// every submission the worker holds.
 export async function GET(req: Request) {
   const auth = await requireAdmin(req);
   if (!auth.ok) {
@@ -11,12 +19,56 @@ export async function GET(req: Request) {
   if (!auth.key) {
     throw Error("Impossible, auth.ok is true but auth.key doesn't exist");
   }
+  await pingWorker(auth.key.keyId);
   await db
-    .update(apiKeyTable)
-    .set({ pingedAt: Date.now(), isGrading: 1 })
-    .where(eq(apiKeyTable.id, auth.key.keyId));
+    .update(submissionTable)
+    .set({ leaseAt: Date.now() })
+    .where(
+      and(
+        eq(submissionTable.pending, SubmissionStatus.GRADING),
+        eq(submissionTable.graderKeyId, auth.key.keyId),
+      ),
+    );
 
-  // we need to consume the worker
+  return withGraderFeatures(new Response("Pong"));
+}
+
+type Lease = { id: number; stage?: string; logBytes?: number };
+
+// Heartbeat carrying the lease of every job the worker holds:
+// { jobs: [{ id, stage, logBytes }] }. Responds with { lost: [id, ...] },
+// the jobs the worker no longer holds, e.g. because their lease expired.
+export async function POST(req: Request) {
+  const auth = await requireAdmin(req);
+  if (!auth.ok) {
+    return new Response("Unauthorized", { status: auth.status });
+  }
+  if (!auth.key) {
+    throw Error("Impossible, auth.ok is true but auth.key doesn't exist");
+  }
+
+  let jobs: Lease[];
+  try {
+    const body = await req.json();
+    jobs = Array.isArray(body?.jobs) ? body.jobs : [];
+  } catch {
+    return new Response("invalid body", { status: 400 });
+  }
+
+  await pingWorker(auth.key.keyId);
+
+  const lost: number[] = [];
+  for (const job of jobs) {
+    const id = Number(job.id);
+    if (!Number.isFinite(id)) continue;
+    const renewed = await renewLease(
+      id,
+      auth.key.keyId,
+      typeof job.stage === "string" ? job.stage : null,
+      Number.isFinite(job.logBytes) ? Number(job.logBytes) : null,
+    );
+    if (!renewed) lost.push(id);
+  }
 
-  return new Response("Pong");
+  return withGraderFeatures(Response.json({ lost }));
 }
@@ -1,7 +1,10 @@
 import { db } from "@/app/db";
-import { apiKeyTable, submissionTable } from "@/app/db/schema";
+import { submissionTable } from "@/app/db/schema";
 import { SubmissionStatus } from "@/app/db/types";
 import { requireAdmin } from "@/app/lib/apikey";
+import { notifySubmission } from "@/app/lib/dispatch";
+import { pingWorker } from "@/app/lib/grader";
+import { clearLiveLog } from "@/app/lib/livelogs";
 import { eq, and } from "drizzle-orm";
 
 export async function POST(
@@ -20,11 +23,14 @@ export async function POST(
     .update(submissionTable)
     .set({
       pending: SubmissionStatus.WAITING,
+      graderKeyId: null,
+      gradingStage: null,
     })
     .where(
       and(
         eq(submissionTable.id, Number((await params).id)),
         eq(submissionTable.pending, SubmissionStatus.GRADING),
+        eq(submissionTable.graderKeyId, auth.key.keyId),
       ),
     )
     .returning();
@@ -32,12 +38,9 @@ export async function POST(
   if (updated.length === 0) {
     return new Response("Nothing in grading status", { status: 200 });
   }
-  //
-  // only here do we do grading.
-  await db
-    .update(apiKeyTable)
-    .set({ pingedAt: Date.now(), isGrading: 0 })
-    .where(eq(apiKeyTable.id, auth.key.keyId));
+  notifySubmission(updated[0].arch);
+  await clearLiveLog(updated[0].id);
+  await pingWorker(auth.key.keyId);
 
   return Response.json(updated[0]);
 }
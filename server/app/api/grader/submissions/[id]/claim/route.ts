@@ -1,7 +1,9 @@
 import { db } from "@/app/db";
-import { apiKeyTable, submissionTable } from "@/app/db/schema";
+import { submissionTable } from "@/app/db/schema";
 import { SubmissionStatus } from "@/app/db/types";
 import { requireAdmin } from "@/app/lib/apikey";
+import { pingWorker } from "@/app/lib/grader";
+import { clearLiveLog } from "@/app/lib/livelogs";
 import { eq, and } from "drizzle-orm";
 
 export async function POST(
@@ -18,6 +20,10 @@ export async function POST(
     .update(submissionTable)
     .set({
       pending: SubmissionStatus.GRADING,
+      graderKeyId: auth.key.keyId,
+      leaseAt: Date.now(),
+      gradingStage: null,
+      report: null,
     })
     .where(
       and(
@@ -30,12 +36,10 @@ export async function POST(
   if (updated.length === 0) {
     return new Response("Already claimed", { status: 409 });
   }
+  // drop whatever an earlier, cancelled attempt streamed
+  await clearLiveLog(updated[0].id);
 
-  // only here do we do grading.
-  await db
-    .update(apiKeyTable)
-    .set({ pingedAt: Date.now(), isGrading: 1 })
-    .where(eq(apiKeyTable.id, auth.key.keyId));
+  await pingWorker(auth.key.keyId);
 
   return Response.json(updated[0]);
 }
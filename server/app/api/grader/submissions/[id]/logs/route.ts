@@ -0,0 +1,55 @@
+import { db } from "@/app/db";
+import { submissionTable } from "@/app/db/schema";
+import { SubmissionStatus } from "@/app/db/types";
+import { requireAdmin } from "@/app/lib/apikey";
+import { appendLiveLog } from "@/app/lib/livelogs";
+import { and, eq } from "drizzle-orm";
+
+// workers send what was added to the log since the last append
+const MAX_APPEND_BYTES = 1024 * 1024;
+
+// POST /api/grader/submissions/[id]/logs?offset=N
+// body: log bytes starting at offset N. Responds with { size }, the number
+// of bytes the server holds; the next append should start there.
+export async function POST(
+  req: Request,
+  { params }: { params: Promise<{ id: string }> },
+) {
+  const auth = await requireAdmin(req);
+  if (!auth.ok) {
+    return new Response("Unauthorized", { status: auth.status });
+  }
+  if (!auth.key) {
+    return new Response("Impossible", { status: 500 });
+  }
+
+  const submissionId = Number((await params).id);
+  const offset = Number(new URL(req.url).searchParams.get("offset"));
+  if (!Number.isInteger(offset) || offset < 0) {
+    return new Response("offset required", { status: 400 });
+  }
+
+  const [row] = await db
+    .select({ id: submissionTable.id })
+    .from(submissionTable)
+    .where(
+      and(
+        eq(submissionTable.id, submissionId),
+        eq(submissionTable.pending, SubmissionStatus.GRADING),
+        eq(submissionTable.graderKeyId, auth.key.keyId),
+      ),
+    )
+    .limit(1);
+
+  if (!row) {
+    return new Response("Forbidden", { status: 403 });
+  }
+
+  const data = Buffer.from(await req.arrayBuffer());
+  if (data.length > MAX_APPEND_BYTES) {
+    return new Response("Too large", { status: 413 });
+  }
+
+  const size = await appendLiveLog(submissionId, offset, data);
+  return Response.json({ size });
+}
@@ -0,0 +1,62 @@
+import { db } from "@/app/db";
+import { submissionTable } from "@/app/db/schema";
+import { SubmissionStatus } from "@/app/db/types";
+import { requireAdmin } from "@/app/lib/apikey";
+import { and, eq } from "drizzle-orm";
+
+// a handful of tests with short messages; anything bigger is not a report
+const MAX_REPORT_BYTES = 256 * 1024;
+
+// POST /api/grader/submissions/[id]/report
+// json: the grader's per-test report. Sent right before the result.
+export async function POST(
+  req: Request,
+  { params }: { params: Promise<{ id: string }> },
+) {
+  const auth = await requireAdmin(req);
+  if (!auth.ok) {
+    return new Response("Unauthorized", { status: auth.status });
+  }
+  if (!auth.key) {
+    return new Response("Impossible", { status: 500 });
+  }
+
+  const submissionId = Number((await params).id);
+
+  const body = await req.text();
+  if (body.length > MAX_REPORT_BYTES) {
+    return new Response("Too large", { status: 413 });
+  }
+
+  let report: unknown;
+  try {
+    report = JSON.parse(body);
+  } catch {
+    return new Response("Invalid report", { status: 400 });
+  }
+  if (
+    typeof report !== "object" ||
+    report === null ||
+    !Array.isArray((report as { tests?: unknown }).tests)
+  ) {
+    return new Response("Invalid report", { status: 400 });
+  }
+
+  const updated = await db
+    .update(submissionTable)
+    .set({ report: JSON.stringify(report) })
+    .where(
+      and(
+        eq(submissionTable.id, submissionId),
+        eq(submissionTable.pending, SubmissionStatus.GRADING),
+        eq(submissionTable.graderKeyId, auth.key.keyId),
+      ),
+    )
+    .returning({ id: submissionTable.id });
+
+  if (updated.length === 0) {
+    return new Response("Forbidden", { status: 403 });
+  }
+
+  return new Response("ok");
+}
@@ -1,14 +1,23 @@
 import { db } from "@/app/db";
-import { apiKeyTable, submissionTable } from "@/app/db/schema";
+import { submissionTable } from "@/app/db/schema";
 import { SubmissionStatus } from "@/app/db/types";
 import { eq, and } from "drizzle-orm";
-import fs from "fs/promises";
-import path from "path";
-import { FILESDIR } from "@/app/lib/env";
 import { gradeSubmission } from "@/app/lib/users";
 import { requireAdmin } from "@/app/lib/apikey";
+import { pingWorker, withGraderFeatures } from "@/app/lib/grader";
+import { MAX_LOG_BYTES, saveCompressedLog, saveLog } from "@/app/lib/logs";
+import { clearLiveLog } from "@/app/lib/livelogs";
 
+// Every answer, errors included, says which uploads this server takes, so a
+// worker can tell a rejected encoding from a failed upload.
 export async function POST(
+  req: Request,
+  ctx: { params: Promise<{ id: string }> },
+) {
+  return withGraderFeatures(await saveResult(req, ctx));
+}
+
+async function saveResult(
   req: Request,
   { params }: { params: Promise<{ id: string }> },
 ) {
@@ -20,11 +29,17 @@ export async function POST(
     return new Response("Impossible", { status: 500 });
   }
 
-  const form = await req.formData();
   const submissionId = Number((await params).id);
 
-  const passed = form.get("passed") === "true";
-  const logs = form.get("logs") as File;
+  // current workers send the gzipped log as the body; older ones send a
+  // multipart form with the plain log.
+  const compressed = (req.headers.get("content-type") ?? "").startsWith(
+    "application/gzip",
+  );
+  const form = compressed ? null : await req.formData();
+  const passed = compressed
+    ? new URL(req.url).searchParams.get("passed") === "true"
+    : form!.get("passed") === "true";
 
   const [row] = await db
     .select()
@@ -33,6 +48,7 @@ export async function POST(
       and(
         eq(submissionTable.id, submissionId),
         eq(submissionTable.pending, SubmissionStatus.GRADING),
+        eq(submissionTable.graderKeyId, auth.key.keyId),
       ),
     )
     .limit(1);
@@ -41,14 +57,28 @@ export async function POST(
     return new Response("Forbidden", { status: 403 });
   }
 
-  const logsDir = path.join(FILESDIR, "logs");
-  await fs.mkdir(logsDir, { recursive: true });
-  const logName = `submission-${submissionId}.log`;
-
-  const logPath = path.join(logsDir, logName);
-  await fs.writeFile(logPath, Buffer.from(await logs.arrayBuffer()));
+  let logName: string | null;
+  if (compressed) {
+    if (!req.body) {
+      return new Response("Missing logs", { status: 400 });
+    }
+    logName = await saveCompressedLog(submissionId, req.body);
+  } else {
+    const logs = form!.get("logs") as File;
+    if (logs.size > MAX_LOG_BYTES) {
+      return new Response("Too large", { status: 413 });
+    }
+    logName = await saveLog(
+      submissionId,
+      Buffer.from(await logs.arrayBuffer()),
+    );
+  }
+  if (logName === null) {
+    return new Response("Too large", { status: 413 });
+  }
 
   await gradeSubmission(submissionId, passed);
+  await clearLiveLog(submissionId);
 
   // update the db with the actual path to the logs.
   await db
@@ -58,10 +88,7 @@ export async function POST(
     })
     .where(eq(submissionTable.id, Number(submissionId)));
 
-  await db
-    .update(apiKeyTable)
-    .set({ pingedAt: Date.now(), isGrading: 0 })
-    .where(eq(apiKeyTable.id, auth.key.keyId));
+  await pingWorker(auth.key.keyId);
 
   return new Response("ok");
 }
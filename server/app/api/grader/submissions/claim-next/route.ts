@@ -0,0 +1,72 @@
+import { db } from "@/app/db";
+import { submissionTable } from "@/app/db/schema";
+import { SubmissionStatus } from "@/app/db/types";
+import { requireAdmin } from "@/app/lib/apikey";
+import { notifySubmission, waitForSubmission } from "@/app/lib/dispatch";
+import {
+  claimNextSubmission,
+  pingWorker,
+  withGraderFeatures,
+} from "@/app/lib/grader";
+import { eq } from "drizzle-orm";
+
+export const dynamic = "force-dynamic";
+
+const MAX_WAIT_MS = 30_000;
+// safety net for submissions made WAITING outside this process
+const RECHECK_MS = 5_000;
+
+// Claims the oldest waiting submission for `arch`. With `wait`, blocks for up
+// to that many seconds until one is available. Responds 204 if nothing was
+// claimed.
+export async function POST(req: Request) {
+  const auth = await requireAdmin(req);
+  if (!auth.ok) {
+    return new Response("Unauthorized", { status: auth.status });
+  }
+  if (!auth.key) {
+    return new Response("Impossible", { status: 500 });
+  }
+
+  const params = new URL(req.url).searchParams;
+  const arch = params.get("arch");
+  if (!arch) {
+    return new Response("arch required", { status: 400 });
+  }
+  const waitMs = Math.min(
+    Math.max(Number(params.get("wait") ?? 0) * 1000 || 0, 0),
+    MAX_WAIT_MS,
+  );
+
+  await pingWorker(auth.key.keyId);
+
+  const deadline = Date.now() + waitMs;
+  let claimed = await claimNextSubmission(arch, auth.key.keyId);
+
+  while (!claimed && !req.signal.aborted) {
+    const remaining = deadline - Date.now();
+    if (remaining <= 0) break;
+    await waitForSubmission(arch, Math.min(remaining, RECHECK_MS), req.signal);
+    claimed = await claimNextSubmission(arch, auth.key.keyId);
+  }
+
+  if (!claimed) {
+    return withGraderFeatures(new Response(null, { status: 204 }));
+  }
+
+  if (req.signal.aborted) {
+    // the worker gave up on this request and will never see the claim
+    await db
+      .update(submissionTable)
+      .set({
+        pending: SubmissionStatus.WAITING,
+        graderKeyId: null,
+        gradingStage: null,
+      })
+      .where(eq(submissionTable.id, claimed.id));
+    notifySubmission(arch);
+    return withGraderFeatures(new Response(null, { status: 204 }));
+  }
+
+  return withGraderFeatures(Response.json(claimed));
+}
@@ -1,8 +1,5 @@
-import { db } from "@/app/db";
-import { apiKeyTable, submissionTable } from "@/app/db/schema";
-import { SubmissionStatus } from "@/app/db/types";
 import { requireAdmin } from "@/app/lib/apikey";
-import { eq, and } from "drizzle-orm";
+import { listWaitingSubmissions, pingWorker } from "@/app/lib/grader";
 
 export async function GET(req: Request) {
   const auth = await requireAdmin(req);
@@ -12,10 +9,7 @@ export async function GET(req: Request) {
   if (!auth.key) {
     throw Error("Impossible, auth.ok is true but auth.key doesn't exist");
   }
-  await db
-    .update(apiKeyTable)
-    .set({ pingedAt: Date.now(), isGrading: 0 })
-    .where(eq(apiKeyTable.id, auth.key.keyId));
+  await pingWorker(auth.key.keyId);
 
   // we need to consume the worker
 
@@ -24,22 +18,7 @@ export async function GET(req: Request) {
     return new Response("arch required", { status: 400 });
   }
 
-  const rows = await db
-    .select({
-      id: submissionTable.id,
-      userId: submissionTable.userId,
-      tarball: submissionTable.tarball,
-      arch: submissionTable.arch,
-      createdAt: submissionTable.createdAt,
-    })
-    .from(submissionTable)
-    .where(
-      and(
-        eq(submissionTable.pending, SubmissionStatus.WAITING),
-        eq(submissionTable.arch, arch),
-      ),
-    )
-    .limit(10);
+  const rows = await listWaitingSubmissions(arch);
 
   return Response.json(rows);
 }
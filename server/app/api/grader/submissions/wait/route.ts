@@ -0,0 +1,45 @@
+import { requireAdmin } from "@/app/lib/apikey";
+import { waitForSubmission } from "@/app/lib/dispatch";
+import { listWaitingSubmissions, pingWorker } from "@/app/lib/grader";
+
+export const dynamic = "force-dynamic";
+
+const MAX_WAIT_MS = 30_000;
+// safety net for submissions made WAITING outside this process
+const RECHECK_MS = 5_000;
+
+// Long-poll variant of GET /api/grader/submissions: blocks until a submission
+// for `arch` is waiting or `timeout` seconds pass, then returns the list
+// (possibly empty).
+export async function GET(req: Request) {
+  const auth = await requireAdmin(req);
+  if (!auth.ok) {
+    return new Response("Unauthorized", { status: auth.status });
+  }
+  if (!auth.key) {
+    throw Error("Impossible, auth.ok is true but auth.key doesn't exist");
+  }
+  await pingWorker(auth.key.keyId);
+
+  const params = new URL(req.url).searchParams;
+  const arch = params.get("arch");
+  if (!arch) {
+    return new Response("arch required", { status: 400 });
+  }
+  const timeoutMs = Math.min(
+    Math.max(Number(params.get("timeout") ?? 25) * 1000 || 0, 0),
+    MAX_WAIT_MS,
+  );
+
+  const deadline = Date.now() + timeoutMs;
+  let rows = await listWaitingSubmissions(arch);
+
+  while (rows.length === 0 && !req.signal.aborted) {
+    const remaining = deadline - Date.now();
+    if (remaining <= 0) break;
+    await waitForSubmission(arch, Math.min(remaining, RECHECK_MS), req.signal);
+    rows = await listWaitingSubmissions(arch);
+  }
+
+  return Response.json(rows);
+}
@@ -1,6 +1,7 @@
 import { db } from "@/app/db";
-import { apiKeyTable } from "@/app/db/schema";
-import { and, gte, isNotNull, isNull } from "drizzle-orm";
+import { apiKeyTable, submissionTable } from "@/app/db/schema";
+import { SubmissionStatus } from "@/app/db/types";
+import { and, count, eq, gte, isNotNull, isNull } from "drizzle-orm";
 import LoadingSpinner from "./LoadingSpinner";
 
 export const dynamic = "force-dynamic";
@@ -11,7 +12,6 @@ export async function AvailableWorkers() {
     .select({
       id: apiKeyTable.id,
       name: apiKeyTable.name,
-      isGrading: apiKeyTable.isGrading,
     })
     .from(apiKeyTable)
     .where(
@@ -22,6 +22,17 @@ export async function AvailableWorkers() {
       ),
     );
 
+  // a worker may grade several submissions at once
+  const grading = new Map(
+    (
+      await db
+        .select({ keyId: submissionTable.graderKeyId, jobs: count() })
+        .from(submissionTable)
+        .where(eq(submissionTable.pending, SubmissionStatus.GRADING))
+        .groupBy(submissionTable.graderKeyId)
+    ).map((row) => [row.keyId, row.jobs]),
+  );
+
   return (
     <div className="p-4 bg-white border">
       <div className="text-sm text-gray-600">
@@ -35,10 +46,11 @@ export async function AvailableWorkers() {
               key={key.id}
             >
               {key.name || "Unnamed"}
-              {key.isGrading ? (
+              {grading.get(key.id) ? (
                 <span className="flex gap-1 items-center text-yellow-500">
                   <LoadingSpinner className="w-3 h-3" />
                   Grading
+                  {grading.get(key.id)! > 1 ? ` (${grading.get(key.id)})` : ""}
                 </span>
               ) : (
                 <span className="flex gap-1 items-center text-green-600">
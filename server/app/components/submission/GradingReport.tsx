@@ -0,0 +1,73 @@
+// The grader's per-test report, as uploaded by the worker next to the log.
+type ReportTest = {
+  name: string;
+  passed: boolean;
+  seconds: number;
+  message?: string;
+  offline?: boolean;
+};
+
+type Report = {
+  passed: boolean;
+  failure: string | null;
+  failedTest: string | null;
+  bootSeconds: number[];
+  tests: ReportTest[];
+};
+
+function parseReport(raw: string): Report | null {
+  try {
+    const report = JSON.parse(raw);
+    return Array.isArray(report?.tests) ? (report as Report) : null;
+  } catch {
+    return null;
+  }
+}
+
+export function GradingReport({ report: raw }: { report: string }) {
+  const report = parseReport(raw);
+  if (!report) {
+    return null;
+  }
+
+  return (
+    <div className="space-y-1 text-sm">
+      {report.failure && (
+        <div className="p-2 text-red-700 bg-red-50 border border-red-200">
+          <strong>
+            {report.failedTest
+              ? `Failed check "${report.failedTest}":`
+              : "Failed before the checks ran:"}
+          </strong>{" "}
+          <span className="font-mono">{report.failure}</span>
+        </div>
+      )}
+
+      <table className="text-xs font-mono">
+        <tbody>
+          {report.bootSeconds?.map((seconds, i) => (
+            <tr key={`boot-${i}`}>
+              <td className="pr-4">boot to login</td>
+              <td className="pr-4 text-green-600">ok</td>
+              <td className="text-right">{seconds.toFixed(1)}s</td>
+            </tr>
+          ))}
+          {report.tests.map((test, i) => (
+            <tr key={i}>
+              <td className="pr-4">
+                {test.name}
+                {test.offline ? " (checked in the image)" : ""}
+              </td>
+              <td
+                className={`pr-4 ${test.passed ? "text-green-600" : "text-red-600"}`}
+              >
+                {test.passed ? "ok" : "FAILED"}
+              </td>
+              <td className="text-right">{test.seconds.toFixed(1)}s</td>
+            </tr>
+          ))}
+        </tbody>
+      </table>
+    </div>
+  );
+}
@@ -0,0 +1,61 @@
+"use client";
+
+import { useRouter } from "next/navigation";
+import { useEffect, useRef, useState } from "react";
+
+// the page only shows the end of a long build
+const MAX_SHOWN_CHARS = 200_000;
+
+export function LiveLogs({ submissionId }: { submissionId: number }) {
+  const router = useRouter();
+  const [text, setText] = useState("");
+  const [connected, setConnected] = useState(false);
+  const bottom = useRef<HTMLPreElement>(null);
+
+  useEffect(() => {
+    const source = new EventSource(`/submission/${submissionId}/logs/live`);
+
+    source.onopen = () => setConnected(true);
+    source.onerror = () => setConnected(false);
+
+    source.addEventListener("log", (e) => {
+      const { text } = JSON.parse((e as MessageEvent).data) as {
+        offset: number;
+        text: string;
+      };
+      setText((prev) => (prev + text).slice(-MAX_SHOWN_CHARS));
+    });
+
+    source.addEventListener("done", () => {
+      source.close();
+      // pick up the final status and the full log
+      router.refresh();
+    });
+
+    return () => source.close();
+  }, [submissionId, router]);
+
+  useEffect(() => {
+    const el = bottom.current;
+    if (el) {
+      el.scrollTop = el.scrollHeight;
+    }
+  }, [text]);
+
+  return (
+    <div className="space-y-1">
+      <div className="text-sm">
+        <strong>Live log</strong>{" "}
+        <span className="text-gray-600">
+          {connected ? "(updating)" : "(reconnecting…)"}
+        </span>
+      </div>
+      <pre
+        ref={bottom}
+        className="p-2 max-h-96 overflow-auto text-xs font-mono bg-gray-50 border whitespace-pre-wrap"
+      >
+        {text || "Waiting for output…"}
+      </pre>
+    </div>
+  );
+}
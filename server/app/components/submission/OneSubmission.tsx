@@ -2,6 +2,9 @@ import Link from "next/link";
 import { SubmissionView } from "./types";
 import { isAdminQuery } from "@/app/lib/is-admin";
 import RenderStatus from "./RenderStatus";
+import { LiveLogs } from "./LiveLogs";
+import { GradingReport } from "./GradingReport";
+import { SubmissionStatus } from "@/app/db/types";
 
 export async function OneSubmission({
   submission: { submission, user },
@@ -47,8 +50,21 @@ export async function OneSubmission({
       <div className="text-sm">
         <strong>Status:</strong>{" "}
         <RenderStatus status={submission.pending} passed={submission.passed} />
+        {submission.pending === SubmissionStatus.GRADING &&
+          submission.gradingStage && (
+            <span className="text-gray-600">({submission.gradingStage})</span>
+          )}
       </div>
 
+      {submission.report &&
+        submission.pending !== SubmissionStatus.GRADING && (
+          <GradingReport report={submission.report} />
+        )}
+
+      {showUserActions && submission.pending === SubmissionStatus.GRADING && (
+        <LiveLogs submissionId={submission.id} />
+      )}
+
       {showUserActions && (
         <div className="flex gap-4 pt-2 text-sm">
           {submission.tarball && (
@@ -15,6 +15,8 @@ export type SubmissionView = {
     tarball: string | null;
     logs: string | null;
     passed: number | null;
+    report: string | null;
+    gradingStage: string | null;
     arch: string;
     pending: number;
     createdAt: Date;
@@ -1,4 +1,5 @@
 import {
+  index,
   int,
   integer,
   primaryKey,
@@ -35,21 +36,40 @@ export const usersTable = sqliteTable("user", {
     .$defaultFn(() => new Date()),
 });
 
-export const submissionTable = sqliteTable("submission", {
-  id: int().primaryKey({ autoIncrement: true }),
-  userId: text("user_id")
-    .notNull()
-    .references(() => usersTable.id, { onDelete: "cascade" }),
-  tarball: text(), // name of the tarball (we'll probably rename the tarball)
-  logs: text(), // where the log file is (uploaded by admin only)
-  passed: int(), // did the submission clear the tests (admin only)?
-  arch: text().notNull(), // is it x86_64 or aarch64?
-  pending: int().notNull().default(SubmissionStatus.WAITING),
+export const submissionTable = sqliteTable(
+  "submission",
+  {
+    id: int().primaryKey({ autoIncrement: true }),
+    userId: text("user_id")
+      .notNull()
+      .references(() => usersTable.id, { onDelete: "cascade" }),
+    tarball: text(), // name of the tarball (we'll probably rename the tarball)
+    logs: text(), // where the log file is (uploaded by admin only)
+    passed: int(), // did the submission clear the tests (admin only)?
+    report: text(), // the grader's per-test report as JSON, if it sent one
+    arch: text().notNull(), // is it x86_64 or aarch64?
+    pending: int().notNull().default(SubmissionStatus.WAITING),
+    // the api key of the worker that claimed it
+    graderKeyId: text("grader_key_id"),
 
-  createdAt: integer("createdAt", {
-    mode: "timestamp_ms",
-  }).notNull(),
-});
+    // lease renewed by the grading worker while the submission is GRADING
+    leaseAt: integer("lease_at"),
+    gradingStage: text("grading_stage"),
+    logBytes: integer("log_bytes"),
+
+    createdAt: integer("createdAt", {
+      mode: "timestamp_ms",
+    }).notNull(),
+  },
+  (submission) => [
+    // graders claim the oldest waiting submission of their arch
+    index("submission_pending_arch_created_idx").on(
+      submission.pending,
+      submission.arch,
+      submission.createdAt,
+    ),
+  ],
+);
 
 export const apiKeyTable = sqliteTable("api_key", {
   id: text("id").primaryKey(),
@@ -63,7 +83,6 @@ export const apiKeyTable = sqliteTable("api_key", {
     mode: "timestamp_ms",
   }).notNull(),
   pingedAt: integer("pinged_at"),
-  isGrading: integer("is_grading"),
 });
 
 // ripped from auth.js
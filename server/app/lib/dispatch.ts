@@ -0,0 +1,43 @@
+import { EventEmitter } from "events";
+
+// In-process wakeups for graders long-polling for work. Every path that makes
+// a submission WAITING calls notifySubmission so blocked workers can pick it
+// up immediately instead of on their next poll.
+
+const globalForDispatch = globalThis as unknown as {
+  submissionDispatch?: EventEmitter;
+};
+
+const dispatch = (globalForDispatch.submissionDispatch ??= (() => {
+  const emitter = new EventEmitter();
+  // one listener per blocked worker slot
+  emitter.setMaxListeners(0);
+  return emitter;
+})());
+
+export function notifySubmission(arch: string) {
+  dispatch.emit("submission", arch);
+}
+
+// Resolves when a submission for `arch` becomes available, after `timeoutMs`,
+// or when `signal` aborts, whichever comes first.
+export function waitForSubmission(
+  arch: string,
+  timeoutMs: number,
+  signal?: AbortSignal,
+): Promise<void> {
+  return new Promise((resolve) => {
+    const done = () => {
+      clearTimeout(timer);
+      dispatch.off("submission", onSubmission);
+      signal?.removeEventListener("abort", done);
+      resolve();
+    };
+    const onSubmission = (a: string) => {
+      if (a === arch) done();
+    };
+    const timer = setTimeout(done, timeoutMs);
+    dispatch.on("submission", onSubmission);
+    signal?.addEventListener("abort", done);
+  });
+}
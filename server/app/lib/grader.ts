@@ -0,0 +1,146 @@
+import { db } from "@/app/db";
+import { apiKeyTable, submissionTable } from "@/app/db/schema";
+import { SubmissionStatus } from "@/app/db/types";
+import { eq, and, asc, inArray, lt } from "drizzle-orm";
+import { clearLiveLog } from "@/app/lib/livelogs";
+import { notifySubmission } from "@/app/lib/dispatch";
+
+// Workers renew the lease of every submission they hold with each heartbeat
+// (every 20 seconds). A submission whose lease has not been renewed for this
+// long belongs to a worker that died, and goes back to the queue.
+export const LEASE_TIMEOUT_MS = 5 * 60 * 1000;
+
+// Sent with grader API responses so that workers only use what this server
+// understands. "gzip-logs": the result route takes a gzipped log as its body.
+export const GRADER_FEATURES_HEADER = "X-FLS-Features";
+const GRADER_FEATURES = "gzip-logs";
+
+export function withGraderFeatures(res: Response): Response {
+  res.headers.set(GRADER_FEATURES_HEADER, GRADER_FEATURES);
+  return res;
+}
+
+// Marks the worker behind `keyId` as alive. Whether it is grading follows
+// from the submissions it holds, since one worker may grade several at once.
+export async function pingWorker(keyId: string) {
+  await db
+    .update(apiKeyTable)
+    .set({ pingedAt: Date.now() })
+    .where(eq(apiKeyTable.id, keyId));
+}
+
+// Hands submissions whose lease expired back to the queue. Runs whenever a
+// worker looks for work, which is often enough to reclaim them promptly.
+export async function requeueExpiredLeases() {
+  const requeued = await db
+    .update(submissionTable)
+    .set({
+      pending: SubmissionStatus.WAITING,
+      graderKeyId: null,
+      gradingStage: null,
+    })
+    .where(
+      and(
+        eq(submissionTable.pending, SubmissionStatus.GRADING),
+        lt(submissionTable.leaseAt, Date.now() - LEASE_TIMEOUT_MS),
+      ),
+    )
+    .returning({ id: submissionTable.id, arch: submissionTable.arch });
+
+  for (const submission of requeued) {
+    await clearLiveLog(submission.id);
+    notifySubmission(submission.arch);
+  }
+}
+
+// Renews the lease of a submission held by the worker behind `keyId`.
+// Returns false if that worker does not hold it (any more).
+export async function renewLease(
+  submissionId: number,
+  keyId: string,
+  stage: string | null,
+  logBytes: number | null,
+) {
+  const renewed = await db
+    .update(submissionTable)
+    .set({ leaseAt: Date.now(), gradingStage: stage, logBytes })
+    .where(
+      and(
+        eq(submissionTable.id, submissionId),
+        eq(submissionTable.pending, SubmissionStatus.GRADING),
+        eq(submissionTable.graderKeyId, keyId),
+      ),
+    )
+    .returning({ id: submissionTable.id });
+  return renewed.length > 0;
+}
+
+export async function listWaitingSubmissions(arch: string, limit = 10) {
+  await requeueExpiredLeases();
+  return db
+    .select({
+      id: submissionTable.id,
+      userId: submissionTable.userId,
+      tarball: submissionTable.tarball,
+      arch: submissionTable.arch,
+      createdAt: submissionTable.createdAt,
+    })
+    .from(submissionTable)
+    .where(
+      and(
+        eq(submissionTable.pending, SubmissionStatus.WAITING),
+        eq(submissionTable.arch, arch),
+      ),
+    )
+    .orderBy(asc(submissionTable.createdAt))
+    .limit(limit);
+}
+
+// Atomically moves the oldest WAITING submission for `arch` to GRADING and
+// returns it, or returns undefined if there is none. This is a single UPDATE,
+// so concurrent workers never claim the same row. The row is recorded as
+// held by the worker behind `keyId`.
+export async function claimNextSubmission(arch: string, keyId: string) {
+  await requeueExpiredLeases();
+
+  const next = db
+    .select({ id: submissionTable.id })
+    .from(submissionTable)
+    .where(
+      and(
+        eq(submissionTable.pending, SubmissionStatus.WAITING),
+        eq(submissionTable.arch, arch),
+      ),
+    )
+    .orderBy(asc(submissionTable.createdAt), asc(submissionTable.id))
+    .limit(1);
+
+  const [claimed] = await db
+    .update(submissionTable)
+    .set({
+      pending: SubmissionStatus.GRADING,
+      graderKeyId: keyId,
+      leaseAt: Date.now(),
+      gradingStage: null,
+      report: null,
+    })
+    .where(
+      and(
+        inArray(submissionTable.id, next),
+        eq(submissionTable.pending, SubmissionStatus.WAITING),
+      ),
+    )
+    .returning({
+      id: submissionTable.id,
+      userId: submissionTable.userId,
+      tarball: submissionTable.tarball,
+      arch: submissionTable.arch,
+      createdAt: submissionTable.createdAt,
+    });
+
+  if (claimed) {
+    // drop whatever an earlier, cancelled attempt streamed
+    await clearLiveLog(claimed.id);
+  }
+  return claimed;
+}
@@ -0,0 +1,154 @@
+import { EventEmitter } from "events";
+import { FILESDIR } from "@/app/lib/env";
+import fs from "fs";
+import path from "path";
+
+// Logs of submissions that are still grading. Workers append to them as the
+// build runs; viewers tail them. They are dropped once the submission leaves
+// GRADING, when the full log arrives with the result.
+
+export const LIVE_LOGS_DIR = path.join(FILESDIR, "live");
+
+// the live view only needs the start of a long build; the rest is in the
+// final log.
+export const MAX_LIVE_LOG_BYTES = 32 * 1024 * 1024;
+
+const globalForLiveLogs = globalThis as unknown as {
+  liveLogEvents?: EventEmitter;
+  liveLogQueues?: Map<number, Promise<unknown>>;
+};
+
+const events = (globalForLiveLogs.liveLogEvents ??= (() => {
+  const emitter = new EventEmitter();
+  // one listener per open viewer
+  emitter.setMaxListeners(0);
+  return emitter;
+})());
+
+// the last pending write of each live log. appends read the size before
+// writing, so overlapping ones would write the same bytes twice.
+const queues = (globalForLiveLogs.liveLogQueues ??= new Map());
+
+function serialized<T>(
+  submissionId: number,
+  fn: () => Promise<T>,
+): Promise<T> {
+  const next = (queues.get(submissionId) ?? Promise.resolve()).then(fn);
+  const tail = next.catch(() => {});
+  queues.set(submissionId, tail);
+  void tail.then(() => {
+    if (queues.get(submissionId) === tail) {
+      queues.delete(submissionId);
+    }
+  });
+  return next;
+}
+
+function liveLogPath(submissionId: number) {
+  return path.join(LIVE_LOGS_DIR, `submission-${submissionId}.log`);
+}
+
+async function liveLogSize(submissionId: number): Promise<number> {
+  try {
+    return (await fs.promises.stat(liveLogPath(submissionId))).size;
+  } catch {
+    return 0;
+  }
+}
+
+// Append the bytes a worker read from `offset` onwards. Bytes the server
+// already has are skipped, so retried appends are harmless. Returns the size
+// of the live log afterwards; nothing is written if `offset` is past its end,
+// and the worker is expected to resend from there.
+export function appendLiveLog(
+  submissionId: number,
+  offset: number,
+  data: Buffer,
+): Promise<number> {
+  return serialized(submissionId, () =>
+    appendLiveLogNow(submissionId, offset, data),
+  );
+}
+
+async function appendLiveLogNow(
+  submissionId: number,
+  offset: number,
+  data: Buffer,
+): Promise<number> {
+  const size = await liveLogSize(submissionId);
+  if (offset > size) {
+    return size;
+  }
+
+  const fresh = data.subarray(
+    size - offset,
+    Math.max(size - offset, MAX_LIVE_LOG_BYTES - offset),
+  );
+  if (fresh.length === 0) {
+    return size;
+  }
+
+  await fs.promises.mkdir(LIVE_LOGS_DIR, { recursive: true });
+  await fs.promises.appendFile(liveLogPath(submissionId), fresh);
+  events.emit("append", submissionId);
+  return size + fresh.length;
+}
+
+// Read what was appended after `offset`, at most `limit` bytes.
+export async function readLiveLog(
+  submissionId: number,
+  offset: number,
+  limit: number,
+): Promise<Buffer> {
+  let handle: fs.promises.FileHandle;
+  try {
+    handle = await fs.promises.open(liveLogPath(submissionId), "r");
+  } catch {
+    return Buffer.alloc(0);
+  }
+  try {
+    const buffer = Buffer.alloc(limit);
+    const { bytesRead } = await handle.read(buffer, 0, limit, offset);
+    return buffer.subarray(0, bytesRead);
+  } finally {
+    await handle.close();
+  }
+}
+
+// Forget the live log, e.g. because the submission was claimed again or
+// finished. Viewers are told to stop tailing.
+export async function clearLiveLog(submissionId: number) {
+  await serialized(submissionId, () =>
+    fs.promises.rm(liveLogPath(submissionId), { force: true }),
+  );
+  events.emit("done", submissionId);
+}
+
+// Resolves with "append" when the live log grows, "done" when it is
+// cleared, or "timeout" after `timeoutMs` or when `signal` aborts.
+export function waitForLiveLog(
+  submissionId: number,
+  timeoutMs: number,
+  signal?: AbortSignal,
+): Promise<"append" | "done" | "timeout"> {
+  return new Promise((resolve) => {
+    const finish = (how: "append" | "done" | "timeout") => {
+      clearTimeout(timer);
+      events.off("append", onAppend);
+      events.off("done", onDone);
+      signal?.removeEventListener("abort", onAbort);
+      resolve(how);
+    };
+    const onAppend = (id: number) => {
+      if (id === submissionId) finish("append");
+    };
+    const onDone = (id: number) => {
+      if (id === submissionId) finish("done");
+    };
+    const onAbort = () => finish("timeout");
+    const timer = setTimeout(onAbort, timeoutMs);
+    events.on("append", onAppend);
+    events.on("done", onDone);
+    signal?.addEventListener("abort", onAbort);
+  });
+}
@@ -0,0 +1,103 @@
+import { FILESDIR } from "@/app/lib/env";
+import fs from "fs";
+import path from "path";
+import { Readable, Transform } from "stream";
+import { pipeline } from "stream/promises";
+import type { ReadableStream as WebReadableStream } from "stream/web";
+import zlib from "zlib";
+
+export const LOGS_DIR = path.join(FILESDIR, "logs");
+
+// workers bound their job logs well below this, compressed or not
+export const MAX_LOG_BYTES = 64 * 1024 * 1024;
+
+class LogTooLarge extends Error {}
+
+/**
+ * Stream a gzipped log from the request body to disk without buffering it.
+ * Returns the stored file name, or null if the body is larger than
+ * MAX_LOG_BYTES.
+ */
+export async function saveCompressedLog(
+  submissionId: number,
+  body: ReadableStream<Uint8Array>,
+): Promise<string | null> {
+  await fs.promises.mkdir(LOGS_DIR, { recursive: true });
+
+  const logName = `submission-${submissionId}.log.gz`;
+  const logPath = path.join(LOGS_DIR, logName);
+  const tmpPath = `${logPath}.tmp`;
+
+  let received = 0;
+  const limit = new Transform({
+    transform(chunk: Buffer, _encoding, callback) {
+      received += chunk.length;
+      if (received > MAX_LOG_BYTES) {
+        callback(new LogTooLarge());
+      } else {
+        callback(null, chunk);
+      }
+    },
+  });
+
+  try {
+    await pipeline(
+      Readable.fromWeb(body as WebReadableStream<Uint8Array>),
+      limit,
+      fs.createWriteStream(tmpPath),
+    );
+    await fs.promises.rename(tmpPath, logPath);
+  } catch (e) {
+    await fs.promises.rm(tmpPath, { force: true });
+    if (e instanceof LogTooLarge) {
+      return null;
+    }
+    throw e;
+  }
+
+  return logName;
+}
+
+/**
+ * Store an uncompressed log uploaded by older workers.
+ */
+export async function saveLog(
+  submissionId: number,
+  data: Buffer,
+): Promise<string> {
+  await fs.promises.mkdir(LOGS_DIR, { recursive: true });
+
+  const logName = `submission-${submissionId}.log`;
+  await fs.promises.writeFile(path.join(LOGS_DIR, logName), data);
+  return logName;
+}
+
+/**
+ * Serve a stored log. Compressed logs are sent as-is with a gzip
+ * content-encoding when the client accepts it, and decompressed otherwise.
+ */
+export function logResponse(req: Request, logName: string): Response {
+  const filePath = path.join(LOGS_DIR, logName);
+  if (!fs.existsSync(filePath)) {
+    return new Response("Not found", { status: 404 });
+  }
+
+  const headers: Record<string, string> = {
+    "Content-Type": "text/plain; charset=utf-8",
+  };
+
+  let stream: Readable = fs.createReadStream(filePath);
+  if (logName.endsWith(".gz")) {
+    const accepted = req.headers.get("accept-encoding") ?? "";
+    if (/\bgzip\b/.test(accepted)) {
+      headers["Content-Encoding"] = "gzip";
+      headers["Vary"] = "Accept-Encoding";
+    } else {
+      stream = stream.pipe(zlib.createGunzip());
+    }
+  }
+
+  return new Response(Readable.toWeb(stream) as unknown as BodyInit, {
+    headers,
+  });
+}
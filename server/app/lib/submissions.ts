@@ -1,4 +1,6 @@
 import { FILESDIR } from "@/app/lib/env";
+import { clearLiveLog } from "@/app/lib/livelogs";
+import { LOGS_DIR } from "@/app/lib/logs";
 import path from "path";
 import fs from "fs";
 
@@ -15,10 +17,12 @@ export async function deleteSubmissionArtifacts(submission: {
   }
 
   if (submission.logs) {
-    const logPath = path.join(FILESDIR, "logs", submission.logs);
+    const logPath = path.join(LOGS_DIR, submission.logs);
     ops.push(fs.promises.rm(logPath, { force: true }));
   }
 
+  ops.push(clearLiveLog(submission.id));
+
   // Best-effort cleanup: DB is already source of truth
   await Promise.allSettled(ops);
 }
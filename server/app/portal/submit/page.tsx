@@ -9,6 +9,7 @@ import { eq } from "drizzle-orm";
 
 import { FILESDIR } from "@/app/lib/env";
 import { deleteSubmissionArtifacts } from "@/app/lib/submissions";
+import { notifySubmission } from "@/app/lib/dispatch";
 
 import path from "path";
 import crypto from "crypto";
@@ -141,6 +142,7 @@ async function createSubmission(formData: FormData) {
     pending: SubmissionStatus.WAITING,
     createdAt: new Date(),
   });
+  notifySubmission(arch);
 
   // --------------------------------
   // Cleanup graded submissions
@@ -0,0 +1,116 @@
+import { auth } from "@/app/lib/auth";
+import { db } from "@/app/db";
+import { submissionTable } from "@/app/db/schema";
+import { SubmissionStatus } from "@/app/db/types";
+import { isAdminQuery } from "@/app/lib/is-admin";
+import { readLiveLog, waitForLiveLog } from "@/app/lib/livelogs";
+import { eq } from "drizzle-orm";
+
+export const dynamic = "force-dynamic";
+
+const READ_BYTES = 256 * 1024;
+// comment lines keep proxies from closing idle streams; the submission's
+// status is rechecked at the same pace in case it finished elsewhere.
+const KEEPALIVE_MS = 15_000;
+
+async function isGrading(submissionId: number) {
+  const [row] = await db
+    .select({ pending: submissionTable.pending })
+    .from(submissionTable)
+    .where(eq(submissionTable.id, submissionId))
+    .limit(1);
+  return row?.pending === SubmissionStatus.GRADING;
+}
+
+// Server-sent events with the log of a submission that is being graded.
+// Each "log" event carries { offset, text }; a "done" event is sent once the
+// submission leaves GRADING. Reconnects resume from Last-Event-ID.
+export async function GET(
+  req: Request,
+  { params }: { params: Promise<{ id: string }> },
+) {
+  const session = await auth();
+  if (!session?.user?.id) {
+    return new Response("Unauthorized", { status: 401 });
+  }
+
+  const submissionId = Number((await params).id);
+  if (!Number.isFinite(submissionId)) {
+    return new Response("Not found", { status: 404 });
+  }
+
+  const [submission] = await db
+    .select({ userId: submissionTable.userId })
+    .from(submissionTable)
+    .where(eq(submissionTable.id, submissionId))
+    .limit(1);
+
+  if (!submission) {
+    return new Response("Not found", { status: 404 });
+  }
+
+  const isAdmin = await isAdminQuery();
+  const isOwner = submission.userId === session.user.id;
+
+  if (!isAdmin && !isOwner) {
+    return new Response("Forbidden", { status: 403 });
+  }
+
+  let offset = Number(req.headers.get("last-event-id") ?? 0);
+  if (!Number.isInteger(offset) || offset < 0) {
+    offset = 0;
+  }
+
+  const encoder = new TextEncoder();
+  const decoder = new TextDecoder();
+
+  const stream = new ReadableStream<Uint8Array>({
+    async start(controller) {
+      const send = (text: string) => controller.enqueue(encoder.encode(text));
+
+      try {
+        while (!req.signal.aborted) {
+          const chunk = await readLiveLog(submissionId, offset, READ_BYTES);
+          if (chunk.length > 0) {
+            offset += chunk.length;
+            const text = decoder.decode(chunk, { stream: true });
+            send(
+              `id: ${offset}\nevent: log\ndata: ${JSON.stringify({ offset, text })}\n\n`,
+            );
+            continue;
+          }
+
+          if (!(await isGrading(submissionId))) {
+            send("event: done\ndata: {}\n\n");
+            break;
+          }
+
+          const how = await waitForLiveLog(
+            submissionId,
+            KEEPALIVE_MS,
+            req.signal,
+          );
+          if (how === "timeout") {
+            send(": keepalive\n\n");
+          }
+        }
+      } catch {
+        // the viewer went away
+      } finally {
+        try {
+          controller.close();
+        } catch {
+          // already closed
+        }
+      }
+    },
+  });
+
+  return new Response(stream, {
+    headers: {
+      "Content-Type": "text/event-stream; charset=utf-8",
+      "Cache-Control": "no-cache, no-transform",
+      "X-Accel-Buffering": "no",
+    },
+  });
+}
@@ -1,15 +1,12 @@
 import { auth } from "@/app/lib/auth";
 import { db } from "@/app/db";
 import { submissionTable } from "@/app/db/schema";
-import { FILESDIR } from "@/app/lib/env";
 import { isAdminQuery } from "@/app/lib/is-admin";
+import { logResponse } from "@/app/lib/logs";
 import { eq } from "drizzle-orm";
 
-import fs from "fs";
-import path from "path";
-
 export async function GET(
-  _req: Request,
+  req: Request,
   { params }: { params: Promise<{ id: string }> },
 ) {
   const session = await auth();
@@ -42,19 +39,5 @@ export async function GET(
     return new Response("Forbidden", { status: 403 });
   }
 
-  const logsDir = path.join(FILESDIR, "logs");
-  await fs.promises.mkdir(logsDir, { recursive: true });
-
-  const filePath = path.join(logsDir, submission.logs);
-  if (!fs.existsSync(filePath)) {
-    return new Response("Not found", { status: 404 });
-  }
-
-  const stream = fs.createReadStream(filePath);
-
-  return new Response(stream as unknown as BodyInit, {
-    headers: {
-      "Content-Type": "text/plain; charset=utf-8",
-    },
-  });
+  return logResponse(req, submission.logs);
 }
@@ -1,5 +1,8 @@
+import io
 import logging
+import zlib
 from pathlib import Path
+from typing import Iterator
 
 import requests
 
@@ -15,6 +18,58 @@ from .models import Arch, Submission
 
 log = logging.getLogger("fls-client")
 
+STREAM_CHUNK = 64 * 1024
+
+# the server lists the optional features it supports in this header
+FEATURES_HEADER = "X-FLS-Features"
+
+# set once any response says the server takes gzipped logs. it is shared
+# because each slot, the heartbeat and the live logs use clients of their own.
+server_takes_gzip_logs = False
+
+
+def _gzip_file(path: Path) -> Iterator[bytes]:
+    """
+    Gzip a file on the fly, for use as a chunked request body.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    with open(path, "rb") as f:
+        while chunk := f.read(STREAM_CHUNK):
+            if out := compressor.compress(chunk):
+                yield out
+    yield compressor.flush()
+
+
+class _ResponseStream(io.RawIOBase):
+    """
+    Read-only file view of a streamed response body. Reads go through
+    iter_content, so transport errors surface as requests exceptions.
+    """
+
+    def __init__(self, r: requests.Response):
+        self._response = r
+        self._chunks = r.iter_content(chunk_size=STREAM_CHUNK)
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = chunk
+
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self) -> None:
+        self._response.close()
+        super().close()
+
 
 class FLSClient:
     def __init__(self, timeout: float = 30.0):
@@ -33,6 +88,10 @@ class FLSClient:
     # -----------------------------
 
     def _handle_response(self, r: requests.Response) -> requests.Response:
+        global server_takes_gzip_logs
+        if "gzip-logs" in r.headers.get(FEATURES_HEADER, "").split(","):
+            server_takes_gzip_logs = True
+
         if r.status_code == 401 or r.status_code == 403:
             raise FLSAuthError("authentication failed")
 
@@ -66,14 +125,29 @@ class FLSClient:
     # public API
     # -----------------------------
 
-    def grading_heartbeat(self):
+    def grading_heartbeat(self, jobs: list[dict] | None = None) -> list[int]:
         """
-        GET /api/grader/grading
+        POST /api/grader/grading
+        json: {"jobs": [{"id": ..., "stage": ..., "logBytes": ...}]}
+
+        Returns the ids of jobs the server no longer considers ours, e.g.
+        because their lease expired. Falls back to GET /api/grader/grading
+        on servers that only track whether the worker is alive.
         """
         try:
+            r = self._post("/api/grader/grading", json={"jobs": jobs or []})
+        except FLSBadResponseError as e:
+            if e.status_code != 405:
+                raise
             self._get("/api/grader/grading")
-        except:
-            pass
+            return []
+
+        try:
+            lost = r.json().get("lost", [])
+        except (ValueError, AttributeError):
+            # older servers answer with plain text
+            return []
+        return [int(i) for i in lost if isinstance(i, int)]
 
     def list_submissions(self, arch: Arch) -> list[Submission]:
         """
@@ -90,6 +164,55 @@ class FLSClient:
 
         return [Submission.from_json(item) for item in raw]
 
+    def wait_submissions(self, arch: Arch, timeout: float) -> list[Submission]:
+        """
+        GET /api/grader/submissions/wait?arch=...&timeout=...
+
+        Like list_submissions, but the server holds the request until a
+        submission is waiting or timeout seconds pass. Raises
+        FLSNotFoundError on servers without long-poll support.
+        """
+        url = f"{self.baseurl}/api/grader/submissions/wait"
+        log.debug("GET %s", url)
+        r = self.session.get(
+            url,
+            params={"arch": arch, "timeout": timeout},
+            timeout=timeout + self.timeout,
+        )
+        r = self._handle_response(r)
+        raw = r.json()
+
+        if not isinstance(raw, list):
+            raise FLSBadResponseError(
+                r.status_code,
+                f"expected list, got {type(raw)}",
+            )
+
+        return [Submission.from_json(item) for item in raw]
+
+    def claim_next(self, arch: Arch, wait: float = 0) -> Submission | None:
+        """
+        POST /api/grader/submissions/claim-next?arch=...&wait=...
+
+        Atomically claims the oldest waiting submission. The server holds the
+        request for up to wait seconds if there is none. Returns None if
+        nothing was claimed; raises FLSNotFoundError on servers without this
+        endpoint.
+        """
+        url = f"{self.baseurl}/api/grader/submissions/claim-next"
+        log.debug("POST %s", url)
+        r = self.session.post(
+            url,
+            params={"arch": arch, "wait": wait},
+            timeout=wait + self.timeout,
+        )
+        r = self._handle_response(r)
+
+        if r.status_code == 204:
+            return None
+
+        return Submission.from_json(r.json())
+
     def claim_submission(self, submission: Submission) -> None:
         """
         POST /api/grader/submissions/[id]/claim
@@ -116,12 +239,100 @@ class FLSClient:
                 if chunk:
                     f.write(chunk)
 
+    def open_tarball(self, submission: Submission) -> io.BufferedReader:
+        """
+        GET /api/grader/submissions/[id]/tarball, as a stream the caller
+        must close.
+        """
+        r = self._get(
+            f"/api/grader/submissions/{submission.id}/tarball",
+            stream=True,
+        )
+        return io.BufferedReader(_ResponseStream(r), STREAM_CHUNK)
+
+    def append_logs(self, submission_id: int, *, offset: int, data: bytes) -> int:
+        """
+        POST /api/grader/submissions/[id]/logs?offset=...
+        body: log bytes starting at offset
+
+        Returns the number of bytes the server holds for the live log.
+        Raises FLSNotFoundError on servers without live logs.
+        """
+        r = self._post(
+            f"/api/grader/submissions/{submission_id}/logs",
+            params={"offset": offset},
+            data=data,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        return int(r.json()["size"])
+
     def submit_result(
         self,
         submission: Submission,
         *,
         passed: bool,
         log_path: Path,
+        report_path: Path | None = None,
+    ) -> None:
+        """
+        POST /api/grader/submissions/[id]/result?passed=true|false
+        body: the log, gzipped (Content-Type: application/gzip)
+
+        Only used once the server has said it takes gzipped logs; until then,
+        and whenever an error comes from a server that no longer says so,
+        the log goes up with the multipart upload below. The grader's report,
+        if there is one, is uploaded first.
+        """
+        if report_path is not None and report_path.exists():
+            self.submit_report(submission, report_path)
+
+        if not server_takes_gzip_logs:
+            self._submit_result_multipart(submission, passed=passed, log_path=log_path)
+            return
+
+        url = f"{self.baseurl}/api/grader/submissions/{submission.id}/result"
+        log.debug("POST %s", url)
+        r = self.session.post(
+            url,
+            params={"passed": "true" if passed else "false"},
+            data=_gzip_file(log_path),
+            headers={"Content-Type": "application/gzip"},
+            timeout=self.timeout,
+        )
+        if not r.ok and FEATURES_HEADER not in r.headers:
+            # a server that does not know gzipped logs fails on the body in
+            # any number of ways
+            log.warning(
+                "server failed on compressed logs (HTTP %d); uploading them as-is",
+                r.status_code,
+            )
+            self._submit_result_multipart(submission, passed=passed, log_path=log_path)
+            return
+        self._handle_response(r)
+
+    def submit_report(self, submission: Submission, report_path: Path) -> None:
+        """
+        POST /api/grader/submissions/[id]/report
+        json: the grader's per-test report
+
+        The report only adds detail to the result, so servers without this
+        endpoint, or that refuse the report, are logged and ignored.
+        """
+        try:
+            self._post(
+                f"/api/grader/submissions/{submission.id}/report",
+                data=report_path.read_bytes(),
+                headers={"Content-Type": "application/json"},
+            )
+        except (FLSNotFoundError, FLSBadResponseError) as e:
+            log.warning("server did not take the grader report: %s", e)
+
+    def _submit_result_multipart(
+        self,
+        submission: Submission,
+        *,
+        passed: bool,
+        log_path: Path,
     ) -> None:
         """
         POST /api/grader/submissions/[id]/result
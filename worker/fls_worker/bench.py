@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+import argparse
+import functools
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from .benchserver import BenchServer, BenchState, make_tarball
+
+log = logging.getLogger("fls-bench")
+
+MIB = 1024 * 1024
+BENCH_SECRET = "fls-bench"
+
+
+# ------------------------------------------------------------
+# configuration
+# ------------------------------------------------------------
+
+
+def configure(args: argparse.Namespace, baseurl: str, root: str) -> None:
+    """
+    Point the worker's configuration at the stand-in server. config reads
+    the environment on import, so this must run before any worker module
+    is imported.
+    """
+    os.environ.update(
+        {
+            "FLS_HOST_ROOT": root,
+            "FLS_MOUNT_PREFIX": root,
+            "FLS_GRADING_SECRET": BENCH_SECRET,
+            "FLS_GRADING_BASEURL": baseurl,
+            "FLS_GRADING_GRADER": "fls-bench/fake",
+            "FLS_GRADING_BUILDER": "fls-bench/fake",
+            "FLS_WORKER_SLOTS": str(args.slots),
+            "FLS_WORKER_PIPELINE": "1" if args.pipeline else "0",
+            "FLS_STREAM_SUBMISSIONS": "1" if args.stream else "0",
+            # the pool and the caches need real images and containers
+            "FLS_BUILDER_POOL": "0",
+            "FLS_STAGE_CACHE_BYTES": "0",
+            "FLS_RESULT_CACHE_BYTES": "0",
+            "FLS_CCACHE": "0",
+            "FLS_METRICS_PORT": "0",
+        }
+    )
+
+
+# ------------------------------------------------------------
+# report
+# ------------------------------------------------------------
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _describe(values: list[float]) -> str:
+    if not values:
+        return "n/a"
+    return (
+        f"mean {statistics.fmean(values):7.2f}s  p50 {_percentile(values, 0.5):7.2f}s  "
+        f"p95 {_percentile(values, 0.95):7.2f}s  max {max(values):7.2f}s"
+    )
+
+
+def report(state: BenchState, container_seconds: float) -> None:
+    from .metrics import jobs_total, phase_seconds
+
+    done = [s for s in state.submissions.values() if s.finished is not None]
+    print()
+    print(f"submissions finished: {len(done)} of {len(state.submissions)}")
+    if not done:
+        return
+
+    started = min(s.created for s in state.submissions.values())
+    wall = max(s.finished for s in done) - started  # type: ignore[type-var]
+    pickup = [s.claimed - s.created for s in done if s.claimed is not None]
+    turnaround = [s.finished - s.created for s in done]  # type: ignore[operator]
+    busy = [s.finished - s.claimed for s in done if s.claimed is not None]  # type: ignore[operator]
+    overhead = [b - container_seconds for b in busy]
+
+    print(f"wall clock:           {wall:.1f}s")
+    print(f"throughput:           {len(done) / wall * 3600:.1f} jobs/hour")
+    print(f"pickup latency:       {_describe(pickup)}")
+    print(f"turnaround:           {_describe(turnaround)}")
+    print(f"claim to result:      {_describe(busy)}")
+    print(f"worker overhead:      {_describe(overhead)}")
+    print(f"  (claim to result minus the {container_seconds:.1f}s the fake containers take;")
+    print("   with pipelining this includes the wait of a prefetched job for its slot)")
+    print(f"cancelled claims:     {sum(s.cancels for s in state.submissions.values())}")
+    print(f"heartbeats:           {state.heartbeats}")
+
+    passed = sum(1 for s in done if s.passed)
+    print(f"passed / failed:      {passed} / {len(done) - passed}")
+    outcomes = {key[0]: int(n) for key, n in jobs_total.totals().items()}
+    print(f"worker outcomes:      {outcomes}")
+
+    phases = sorted(phase_seconds.totals().items(), key=lambda item: -item[1][0])
+    if phases:
+        width = max(len(key[0]) for key, _ in phases)
+        print()
+        print(f"{'phase':<{width}}  {'count':>6}  {'mean':>9}  {'total':>9}")
+        for (phase,), (total, n) in phases:
+            print(f"{phase:<{width}}  {n:>6}  {total / n:>8.3f}s  {total:>8.1f}s")
+
+
+# ------------------------------------------------------------
+# entrypoint
+# ------------------------------------------------------------
+
+
+def main() -> None:
+    """
+    Measure the worker's own throughput against a local stand-in for the
+    portal and containers that only sleep and print, so changes to claiming,
+    staging, logging and reporting can be compared without a real build.
+    """
+    parser = argparse.ArgumentParser(
+        description="benchmark the grading worker against fake containers",
+    )
+    parser.add_argument("--submissions", type=int, default=20, help="submissions to grade")
+    parser.add_argument("--users", type=int, default=4, help="distinct students submitting")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.0,
+        help="seconds between submissions; 0 queues them all up front",
+    )
+    parser.add_argument("--slots", type=int, default=1, help="FLS_WORKER_SLOTS")
+    parser.add_argument("--pipeline", action="store_true", help="FLS_WORKER_PIPELINE=1")
+    parser.add_argument("--stream", action="store_true", help="FLS_STREAM_SUBMISSIONS=1")
+    parser.add_argument(
+        "--legacy-api",
+        action="store_true",
+        help="serve neither claim-next, long polling, live logs nor gzipped logs",
+    )
+    parser.add_argument("--tarball-mib", type=float, default=8, help="submission size")
+    parser.add_argument("--tarball-files", type=int, default=2000, help="files per submission")
+    parser.add_argument("--builder-start-seconds", type=float, default=1.0)
+    parser.add_argument("--build-seconds", type=float, default=5.0)
+    parser.add_argument("--build-log-mib", type=float, default=2.0)
+    parser.add_argument("--grade-seconds", type=float, default=3.0)
+    parser.add_argument("--grade-log-kib", type=float, default=64.0)
+    parser.add_argument("--image-mib", type=int, default=200, help="bootable.img size")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of builds that fail")
+    parser.add_argument("--timeout", type=float, default=3600, help="give up after this many seconds")
+    args = parser.parse_args()
+
+    # set up before the worker modules do, to keep per-job chatter out of
+    # the report
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s [%(levelname)s] [%(threadName)s] %(name)s: %(message)s",
+    )
+
+    log.warning("building a %.1f MiB synthetic submission", args.tarball_mib)
+    state = BenchState(
+        tarball=make_tarball(int(args.tarball_mib * MIB), args.tarball_files),
+        legacy=args.legacy_api,
+    )
+    server = BenchServer(state, BENCH_SECRET)
+    server.start()
+
+    root = tempfile.mkdtemp(prefix="fls-bench-")
+    configure(args, server.baseurl, root)
+
+    # worker modules read the configuration on import
+    from . import worker
+    from .arch import detect_arch
+    from .benchfakes import FakeDocker, FakeProfile
+    from .dockerclient import DockerClient
+    from .images import images
+    from .main import slot_loop
+
+    profile = FakeProfile(
+        builder_start_seconds=args.builder_start_seconds,
+        build_seconds=args.build_seconds,
+        build_log_bytes=int(args.build_log_mib * MIB),
+        grade_seconds=args.grade_seconds,
+        grade_log_bytes=int(args.grade_log_kib * 1024),
+        image_bytes=args.image_mib * MIB,
+        fail_rate=args.fail_rate,
+    )
+    fake_docker = FakeDocker(profile)
+    images.use_client(fake_docker)  # type: ignore[arg-type]
+    worker.docker_client_factory = functools.partial(
+        DockerClient,
+        client=fake_docker,  # type: ignore[arg-type]
+    )
+
+    for index in range(args.slots):
+        threading.Thread(
+            target=slot_loop,
+            args=(worker.Slot(index, pipeline=args.pipeline),),
+            name=f"slot-{index}",
+            daemon=True,
+        ).start()
+
+    arch = detect_arch()
+    for i in range(args.submissions):
+        state.add(f"bench-user-{i % max(1, args.users)}", arch)
+        if args.interval > 0:
+            time.sleep(args.interval)
+
+    if not state.wait_until_done(args.timeout):
+        log.warning("timed out after %.0fs", args.timeout)
+
+    # the result is in before the worker cleans up after the job
+    settle = time.monotonic() + 30
+    while worker.active_job_count() and time.monotonic() < settle:
+        time.sleep(0.1)
+
+    report(
+        state,
+        args.builder_start_seconds + args.build_seconds + args.grade_seconds,
+    )
+    shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import gzip
+import itertools
+import json
+import logging
+import random
+import socket as pysocket
+import struct
+import tarfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
+
+from .dockerclient import REPORT_NAME
+
+log = logging.getLogger("fls-bench")
+
+FAKE_IMAGE_ID = "sha256:" + "0" * 64
+
+# output is produced in this many bursts over a container's run
+OUTPUT_TICKS = 20
+
+# stream id of stderr in docker's multiplexed attach protocol
+STDERR = 2
+
+
+@dataclass(frozen=True)
+class FakeProfile:
+    """
+    How long the fake containers take and how much they print.
+    """
+
+    builder_start_seconds: float = 1.0
+    build_seconds: float = 5.0
+    build_log_bytes: int = 2 * 1024 * 1024
+    grade_seconds: float = 3.0
+    grade_log_bytes: int = 64 * 1024
+    image_bytes: int = 200 * 1024 * 1024
+    # fraction of builds that fail, as a broken submission would
+    fail_rate: float = 0.0
+
+
+def _output(
+    seconds: float,
+    log_bytes: int,
+    markers: list[str],
+    stop: threading.Event,
+) -> Iterator[tuple[bytes | None, bytes | None]]:
+    """
+    Demuxed container output spread evenly over seconds, with a timing
+    marker for each phase in markers. Ends early once stop is set.
+    """
+    line = b"  CC      fls-bench/some/object/file.o\n"
+    per_tick = (line * (log_bytes // OUTPUT_TICKS // len(line) + 1))[: log_bytes // OUTPUT_TICKS]
+    tick = seconds / OUTPUT_TICKS
+    phase_every = max(1, OUTPUT_TICKS // max(1, len(markers)))
+    started = time.monotonic()
+
+    for i in range(OUTPUT_TICKS):
+        if stop.wait(tick):
+            return
+        yield per_tick, None
+        if markers and (i + 1) % phase_every == 0:
+            phase = markers.pop(0)
+            yield f"\n[fls-timing] {phase} {time.monotonic() - started:.3f}\n".encode(), None
+            started = time.monotonic()
+
+
+def _sparse_tar(name: str, data: bytes, size: int) -> bytes:
+    """
+    A GNU tar archive holding one sparse file of size bytes that starts with
+    data and is a hole after it, as tar --sparse archives bootable.img.
+    """
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.GNUTYPE_SPARSE
+    info.mode = 0o644
+    info.size = len(data)
+
+    header = bytearray(info.tobuf(tarfile.GNU_FORMAT, "utf-8", "surrogateescape"))
+    # one data region at offset 0, and the logical size
+    header[386:410] = tarfile.itn(0, 12, tarfile.GNU_FORMAT) + tarfile.itn(
+        len(data), 12, tarfile.GNU_FORMAT
+    )
+    header[483:495] = tarfile.itn(size, 12, tarfile.GNU_FORMAT)
+    header[148:156] = b" " * 8
+    header[148:155] = b"%06o\0" % sum(header)
+
+    padding = -len(data) % tarfile.BLOCKSIZE
+    return bytes(header) + data + bytes(padding) + bytes(2 * tarfile.BLOCKSIZE)
+
+
+def _frame(stream: int, data: bytes) -> bytes:
+    """
+    data as one frame of docker's multiplexed attach protocol.
+    """
+    return struct.pack(">BxxxL", stream, len(data)) + data
+
+
+@dataclass
+class _Exec:
+    container: "FakeContainer"
+    cmd: list[str]
+    exit_code: int | None = None
+
+
+@dataclass
+class FakeImage:
+    id: str
+    attrs: dict[str, Any] = field(default_factory=lambda: {"RepoDigests": []})
+
+
+class FakeContainer:
+    """
+    A container that runs nothing. Its role decides what it pretends to do:
+    a builder answers the exec calls DockerClient makes, a grader prints and
+    writes a report into its /dist mount.
+    """
+
+    def __init__(self, docker: "FakeDocker", id: str, role: str, kwargs: dict[str, Any]):
+        self.docker = docker
+        self.id = id
+        self.short_id = id[:12]
+        self.role = role
+        self.kwargs = kwargs
+        self.killed = threading.Event()
+        self.built = False
+        self.status: int | None = None
+
+    def start(self) -> None:
+        time.sleep(self.docker.profile.builder_start_seconds)
+
+    def kill(self) -> None:
+        self.killed.set()
+
+    def remove(self, force: bool = False) -> None:
+        self.killed.set()
+        self.docker.containers.forget(self.id)
+
+    # --- builder ---
+
+    def build(self, run: _Exec) -> Iterator[tuple[bytes | None, bytes | None]]:
+        profile = self.docker.profile
+        yield from _output(
+            profile.build_seconds,
+            profile.build_log_bytes,
+            ["stage.busybox", "stage.kernel", "stage.user", "stage.image"],
+            self.killed,
+        )
+        if self.killed.is_set():
+            run.exit_code = 137
+        elif random.random() < profile.fail_rate:
+            yield None, b"make: *** [fls-bench] Error 2\n"
+            run.exit_code = 2
+        else:
+            self.built = True
+            run.exit_code = 0
+
+    def archive_image(self, run: _Exec) -> Iterator[bytes]:
+        if not self.built:
+            run.exit_code = 2
+            return
+        archive = _sparse_tar(
+            "bootable.img", b"\x55\xaa" * 256, self.docker.profile.image_bytes
+        )
+        if "-cz" in run.cmd:
+            archive = gzip.compress(archive, compresslevel=1)
+        yield archive
+        run.exit_code = 0
+
+    def unpack(self, run: _Exec, conn: pysocket.socket) -> None:
+        """
+        Read a tar stream from conn like tar -x would, then report tar's
+        output, if any, as docker frames and hang up.
+        """
+        with conn, conn.makefile("rb") as stdin:
+            try:
+                with tarfile.open(fileobj=stdin, mode="r|") as tar:
+                    for member in tar:
+                        src = tar.extractfile(member)
+                        if src is not None:
+                            while src.read(1024 * 1024):
+                                pass
+                # tar drains its input past the end of the archive
+                while stdin.read(1024 * 1024):
+                    pass
+                run.exit_code = 0
+            except (tarfile.TarError, OSError) as e:
+                run.exit_code = 2
+                try:
+                    conn.sendall(_frame(STDERR, f"tar: {e}\n".encode()))
+                except OSError:
+                    pass
+
+    # --- grader ---
+
+    def attach(self, **kwargs) -> Iterator[tuple[bytes | None, bytes | None]]:
+        profile = self.docker.profile
+        yield from _output(
+            profile.grade_seconds,
+            profile.grade_log_bytes,
+            ["grade.boot", "grade.test.ls", "grade.test.persistence"],
+            self.killed,
+        )
+
+        dist = next(
+            Path(host)
+            for host, mount in self.kwargs["volumes"].items()
+            if mount["bind"] == "/dist"
+        )
+        if not (dist / "bootable.img").is_file():
+            yield None, b"bootable.img not found\n"
+            self.status = 1
+            return
+
+        report = {
+            "version": 1,
+            "passed": True,
+            "failure": None,
+            "failedTest": None,
+            "qemu": None,
+            "bootSeconds": [],
+            "tests": [],
+        }
+        (dist / REPORT_NAME).write_text(json.dumps(report))
+        self.status = 0
+
+    def wait(self) -> dict[str, Any]:
+        return {"StatusCode": self.status if self.status is not None else 137}
+
+
+class FakeContainers:
+    def __init__(self, docker: "FakeDocker"):
+        self.docker = docker
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._containers: dict[str, FakeContainer] = {}
+
+    def _new(self, role: str, kwargs: dict[str, Any]) -> FakeContainer:
+        with self._lock:
+            id = f"{next(self._ids):064x}"
+            container = FakeContainer(self.docker, id, role, kwargs)
+            self._containers[id] = container
+        return container
+
+    def get(self, id: str) -> FakeContainer:
+        with self._lock:
+            return self._containers[id]
+
+    def forget(self, id: str) -> None:
+        with self._lock:
+            self._containers.pop(id, None)
+
+    def create(self, **kwargs) -> FakeContainer:
+        return self._new("builder", kwargs)
+
+    def run(self, **kwargs) -> FakeContainer:
+        return self._new("grader", kwargs)
+
+    def list(self, **kwargs) -> list[FakeContainer]:
+        return []
+
+
+class FakeAPI:
+    """
+    The low-level exec calls DockerClient makes against builders.
+    """
+
+    def __init__(self, docker: "FakeDocker"):
+        self.docker = docker
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._execs: dict[str, _Exec] = {}
+
+    def exec_create(self, container: str, cmd: list[str], **kwargs) -> dict[str, str]:
+        with self._lock:
+            id = f"exec-{next(self._ids)}"
+            self._execs[id] = _Exec(self.docker.containers.get(container), cmd)
+        return {"Id": id}
+
+    def exec_inspect(self, exec_id: str) -> dict[str, Any]:
+        with self._lock:
+            return {"ExitCode": self._execs[exec_id].exit_code}
+
+    def exec_start(
+        self,
+        exec_id: str,
+        *,
+        stream: bool = False,
+        socket: bool = False,
+        demux: bool = False,
+    ) -> Any:
+        with self._lock:
+            run = self._execs[exec_id]
+        container = run.container
+
+        if run.cmd == ["/build-all-stages.sh"]:
+            return container.build(run)
+
+        if run.cmd[0] == "tar" and "-x" in run.cmd:
+            ours, theirs = pysocket.socketpair()
+            threading.Thread(
+                target=container.unpack,
+                args=(run, theirs),
+                name="fake-tar",
+                daemon=True,
+            ).start()
+            sock = ours.makefile("rwb", buffering=0)
+            ours.close()
+            return sock
+
+        if run.cmd[0] == "tar" and "--sparse" in run.cmd:
+            return container.archive_image(run)
+
+        if run.cmd[0] == "rsync":
+            run.exit_code = 0
+            return iter(())
+
+        log.warning("fake builder cannot run %s", run.cmd)
+        run.exit_code = 127
+        return iter(())
+
+
+class FakeImages:
+    def pull(self, ref: str) -> FakeImage:
+        return FakeImage(FAKE_IMAGE_ID)
+
+    def get(self, ref: str) -> FakeImage:
+        return FakeImage(FAKE_IMAGE_ID)
+
+
+class FakeDocker:
+    """
+    Stand-in for docker.DockerClient whose containers only sleep and print,
+    for benchmarking the worker around them. DockerClient runs unchanged on
+    top of it, so the submission stream, log capture, artifact copy and
+    everything the worker does on the host are real.
+    """
+
+    def __init__(self, profile: FakeProfile = FakeProfile()):
+        self.profile = profile
+        self.containers = FakeContainers(self)
+        self.api = FakeAPI(self)
+        self.images = FakeImages()
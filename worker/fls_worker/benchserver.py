@@ -0,0 +1,315 @@
+import gzip
+import http.server
+import io
+import json
+import logging
+import re
+import tarfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+
+log = logging.getLogger("fls-bench-server")
+
+# ------------------------------------------------------------
+# synthetic submissions
+# ------------------------------------------------------------
+
+
+def make_tarball(total_bytes: int, files: int) -> bytes:
+    """
+    A gzipped submission tree of roughly total_bytes spread over files
+    files, laid out like the real stages.
+    """
+    files = max(1, files)
+    per_file = max(1, total_bytes // files)
+    # source-like text compresses about as well as real submissions
+    line = b"static int fls_bench(int x) { return x * 31 + 7; } /* filler */\n"
+    body = (line * (per_file // len(line) + 1))[:per_file]
+
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for i in range(files):
+            info = tarfile.TarInfo(f"stages/{i % 4}-stage/src/file{i}.c")
+            info.size = len(body)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(body))
+    return buf.getvalue()
+
+
+@dataclass
+class BenchSubmission:
+    id: int
+    user_id: str
+    arch: str
+    created: float
+    status: str = "WAITING"
+    claimed: float | None = None
+    finished: float | None = None
+    passed: bool | None = None
+    claims: int = 0
+    cancels: int = 0
+    log_bytes: int = 0
+    live_log_bytes: int = 0
+    report: dict | None = None
+
+    def to_json(self) -> dict:
+        created = datetime.fromtimestamp(self.created, timezone.utc)
+        return {
+            "id": self.id,
+            "userId": self.user_id,
+            "tarball": f"submission-{self.id}.tar.gz",
+            "arch": self.arch,
+            "createdAt": created.isoformat().replace("+00:00", "Z"),
+        }
+
+
+@dataclass
+class BenchState:
+    """
+    What the stand-in server knows about submissions. Times are
+    time.time() so they can be compared with the worker's.
+    """
+
+    tarball: bytes
+    submissions: dict[int, BenchSubmission] = field(default_factory=dict)
+    heartbeats: int = 0
+    # servers that predate claim-next and long polling answer 404
+    legacy: bool = False
+    _next_id: int = 1
+    _cond: threading.Condition = field(default_factory=threading.Condition)
+
+    def add(self, user_id: str, arch: str) -> BenchSubmission:
+        with self._cond:
+            submission = BenchSubmission(self._next_id, user_id, arch, time.time())
+            self.submissions[submission.id] = submission
+            self._next_id += 1
+            self._cond.notify_all()
+            return submission
+
+    def _waiting(self, arch: str) -> list[BenchSubmission]:
+        return sorted(
+            (
+                s
+                for s in self.submissions.values()
+                if s.status == "WAITING" and s.arch == arch
+            ),
+            key=lambda s: s.id,
+        )
+
+    def wait_for_waiting(self, arch: str, timeout: float) -> list[BenchSubmission]:
+        with self._cond:
+            self._cond.wait_for(lambda: self._waiting(arch), timeout)
+            return self._waiting(arch)
+
+    def claim(self, submission: BenchSubmission) -> bool:
+        with self._cond:
+            if submission.status != "WAITING":
+                return False
+            submission.status = "GRADING"
+            submission.claimed = time.time()
+            submission.claims += 1
+            submission.live_log_bytes = 0
+            return True
+
+    def claim_next(self, arch: str, wait: float) -> BenchSubmission | None:
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while True:
+                waiting = self._waiting(arch)
+                if waiting:
+                    self.claim(waiting[0])
+                    return waiting[0]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def cancel(self, submission: BenchSubmission) -> None:
+        # a cancelled submission goes back to the queue, like on the server
+        with self._cond:
+            submission.status = "WAITING"
+            submission.cancels += 1
+            self._cond.notify_all()
+
+    def finish(self, submission: BenchSubmission, passed: bool, log_bytes: int) -> None:
+        with self._cond:
+            submission.status = "PASSED" if passed else "FAILED"
+            submission.finished = time.time()
+            submission.passed = passed
+            submission.log_bytes = log_bytes
+            self._cond.notify_all()
+
+    def wait_until_done(self, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: all(s.finished is not None for s in self.submissions.values()),
+                timeout,
+            )
+
+
+# ------------------------------------------------------------
+# /api/grader/*
+# ------------------------------------------------------------
+
+# advertised like the portal does, except in legacy mode
+FEATURES_HEADER = "X-FLS-Features"
+
+SUBMISSION_RE = re.compile(r"^/api/grader/submissions/(\d+)/(claim|cancel|tarball|result|logs|report)$")
+
+
+class _BenchHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: BenchState
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json") -> None:
+        self.send_response(status)
+        if not self.state.legacy:
+            self.send_header(FEATURES_HEADER, "gzip-logs")
+        if status != 204:
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and status != 204:
+            self.wfile.write(body)
+
+    def _json(self, data, status: int = 200) -> None:
+        self._send(status, json.dumps(data).encode())
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            return self.rfile.read(length)
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            return b""
+        parts = []
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            if size == 0:
+                self.rfile.readline()
+                return b"".join(parts)
+            parts.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    def _route(self, method: str) -> None:
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = self._body() if method == "POST" else b""
+        state = self.state
+
+        if self.headers.get("Authorization", "") != f"Bearer {self.server.secret}":  # type: ignore[attr-defined]
+            return self._json({"error": "unauthorized"}, 401)
+
+        if url.path == "/api/grader/grading":
+            state.heartbeats += 1
+            return self._json({"ok": True})
+
+        if url.path == "/api/grader/submissions" and method == "GET":
+            waiting = state.wait_for_waiting(query.get("arch", ""), 0)
+            return self._json([s.to_json() for s in waiting])
+
+        if url.path == "/api/grader/submissions/wait" and method == "GET":
+            if state.legacy:
+                return self._json({"error": "not found"}, 404)
+            timeout = float(query.get("timeout", 0))
+            waiting = state.wait_for_waiting(query.get("arch", ""), timeout)
+            return self._json([s.to_json() for s in waiting])
+
+        if url.path == "/api/grader/submissions/claim-next" and method == "POST":
+            if state.legacy:
+                return self._json({"error": "not found"}, 404)
+            claimed = state.claim_next(query.get("arch", ""), float(query.get("wait", 0)))
+            if claimed is None:
+                return self._send(204)
+            return self._json(claimed.to_json())
+
+        match = SUBMISSION_RE.match(url.path)
+        submission = state.submissions.get(int(match[1])) if match else None
+        if match is None or submission is None:
+            return self._json({"error": "not found"}, 404)
+        action = match[2]
+
+        if action == "tarball" and method == "GET":
+            return self._send(200, state.tarball, "application/gzip")
+
+        if method != "POST":
+            return self._json({"error": "method not allowed"}, 405)
+
+        if action == "claim":
+            if not state.claim(submission):
+                return self._json({"error": "already claimed"}, 409)
+            return self._json({"ok": True})
+
+        if action == "cancel":
+            state.cancel(submission)
+            return self._json({"ok": True})
+
+        if action == "logs":
+            if state.legacy:
+                return self._json({"error": "not found"}, 404)
+            offset = int(query.get("offset", 0))
+            if offset <= submission.live_log_bytes:
+                submission.live_log_bytes = max(submission.live_log_bytes, offset + len(body))
+            return self._json({"size": submission.live_log_bytes})
+
+        if action == "report":
+            if state.legacy:
+                return self._json({"error": "not found"}, 404)
+            submission.report = json.loads(body)
+            return self._json({"ok": True})
+
+        if action == "result":
+            gzipped = self.headers.get("Content-Type", "").startswith("application/gzip")
+            if gzipped and state.legacy:
+                # older servers fail to parse the body as a form
+                return self._json({"error": "internal server error"}, 500)
+            if gzipped:
+                passed = query.get("passed") == "true"
+                log_bytes = len(gzip.decompress(body))
+            else:
+                # older multipart upload; only the flag matters here
+                passed = b'name="passed"\r\n\r\ntrue' in body
+                log_bytes = len(body)
+            state.finish(submission, passed, log_bytes)
+            return self._json({"ok": True})
+
+        return self._json({"error": "not found"}, 404)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def log_message(self, *args):
+        pass
+
+
+class BenchServer(http.server.ThreadingHTTPServer):
+    """
+    A stand-in for the grading endpoints of the portal, serving the same
+    synthetic tarball for every submission.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, state: BenchState, secret: str, port: int = 0):
+        handler = type("BenchHandler", (_BenchHandler,), {"state": state})
+        super().__init__(("127.0.0.1", port), handler)
+        self.state = state
+        self.secret = secret
+
+    @property
+    def baseurl(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        threading.Thread(
+            target=self.serve_forever,
+            name="bench-server",
+            daemon=True,
+        ).start()
+        log.info("stand-in server listening on %s", self.baseurl)
@@ -0,0 +1,107 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+
+from .dockerclient import Builder
+
+log = logging.getLogger("fls-pool")
+
+RETRY_SLEEP_SECONDS = 30
+
+
+class BuilderPool:
+    """
+    A small pool of started builders whose toolchain sources are already
+    staged.
+
+    Every builder is handed out exactly once, and a replacement is started
+    in the background once its build is over (see release), so claiming a
+    submission never waits on container creation or the source rsync unless
+    the pool has run dry, and the rsync does not compete with the build.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        *,
+        create: Callable[[], Builder],
+        destroy: Callable[[Builder], None],
+        is_stale: Callable[[Builder], bool] = lambda _: False,
+    ):
+        self.size = size
+        self._create = create
+        self._destroy = destroy
+        self._is_stale = is_stale
+        self._ready: queue.Queue[Builder] = queue.Queue()
+        # ids of pooled builders handed out and not yet released
+        self._lent: set[int] = set()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def start(self) -> None:
+        for _ in range(self.size):
+            self._refill()
+
+    def _refill(self) -> None:
+        if self.size == 0:
+            return
+        threading.Thread(target=self._add, name="pool-refill", daemon=True).start()
+
+    def _add(self) -> None:
+        while True:
+            try:
+                builder = self._create()
+                break
+            except Exception:
+                log.exception("failed to start pooled builder")
+                time.sleep(RETRY_SLEEP_SECONDS)
+                if self._closed:
+                    return
+
+        with self._lock:
+            if not self._closed:
+                self._ready.put(builder)
+                return
+        self._destroy(builder)
+
+    def acquire(self) -> Builder:
+        """
+        Take a ready builder, or start one synchronously if none is ready.
+        Stale builders (e.g. started from an outdated image) are replaced.
+        """
+        while True:
+            try:
+                builder = self._ready.get_nowait()
+            except queue.Empty:
+                log.info("no pooled builder ready; starting one now")
+                return self._create()
+
+            if not self._is_stale(builder):
+                with self._lock:
+                    self._lent.add(id(builder))
+                return builder
+            log.info("discarding stale pooled builder")
+            self._destroy(builder)
+            self._refill()
+
+    def release(self, builder: Builder) -> None:
+        """
+        Called once the build of an acquired builder is over; starts the
+        replacement of a pooled one.
+        """
+        with self._lock:
+            if id(builder) not in self._lent:
+                return
+            self._lent.discard(id(builder))
+        self._refill()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._destroy(self._ready.get_nowait())
+            except queue.Empty:
+                return
@@ -23,3 +23,68 @@ FLS_GRADING_BASEURL = os.environ["FLS_GRADING_BASEURL"].rstrip("/")
 # docker images for building and grading
 FLS_GRADING_GRADER = os.environ["FLS_GRADING_GRADER"]
 FLS_GRADING_BUILDER = os.environ["FLS_GRADING_BUILDER"]
+
+# how often the builder and grader tags are re-pulled in the background
+FLS_IMAGE_REFRESH_SECONDS = float(os.environ.get("FLS_IMAGE_REFRESH_SECONDS", "300"))
+
+# number of submissions graded concurrently on this host. CPU and memory are
+# split evenly between slots.
+FLS_WORKER_SLOTS = max(1, int(os.environ.get("FLS_WORKER_SLOTS", "1")))
+
+# claim and stage the next submission while the current one is building.
+FLS_WORKER_PIPELINE = os.environ.get("FLS_WORKER_PIPELINE", "0") == "1"
+
+# upper bound on the size of the local per-stage build cache; 0 (the default)
+# disables it.
+FLS_STAGE_CACHE_BYTES = int(os.environ.get("FLS_STAGE_CACHE_BYTES", "0"))
+
+# upper bound on the size of the local cache of grading results, which lets
+# identical resubmissions skip the build; 0 disables it.
+FLS_RESULT_CACHE_BYTES = int(
+    os.environ.get("FLS_RESULT_CACHE_BYTES", str(1024 * 1024 * 1024))
+)
+
+# mount the per-arch compiler cache (read-only) into student builds. the
+# cache is populated by fls-ccache-warm.
+FLS_CCACHE = os.environ.get("FLS_CCACHE", "0") == "1"
+
+# builders kept started with their sources staged, ready for the next job.
+# each holds its sources in memory while it waits.
+FLS_BUILDER_POOL = max(0, int(os.environ.get("FLS_BUILDER_POOL", "0")))
+
+# how long an idle worker blocks on the server waiting for a submission; 0
+# falls back to polling.
+FLS_LONG_POLL_SECONDS = max(0.0, float(os.environ.get("FLS_LONG_POLL_SECONDS", "25")))
+
+# pipe submissions from the server straight into the builder's in-memory
+# workspace instead of extracting them on the host first.
+FLS_STREAM_SUBMISSIONS = os.environ.get("FLS_STREAM_SUBMISSIONS", "0") == "1"
+
+# gzip bootable.img inside the builder before copying it out. holes are
+# skipped either way.
+FLS_ARTIFACT_COMPRESSION = os.environ.get("FLS_ARTIFACT_COMPRESSION", "1") == "1"
+
+# how often the logs of running jobs are streamed to the server; 0 disables
+# live logs.
+FLS_LIVE_LOG_SECONDS = max(0.0, float(os.environ.get("FLS_LIVE_LOG_SECONDS", "2")))
+
+# pass /dev/kvm into grader containers so QEMU can use hardware
+# virtualization; the host must have it.
+FLS_GRADER_KVM = os.environ.get("FLS_GRADER_KVM", "0") == "1"
+
+# memory of the grading VM, in MiB; capped to what the grader container has.
+FLS_GRADER_VM_MIB = max(256, int(os.environ.get("FLS_GRADER_VM_MIB", "1024")))
+
+# vCPUs of the grading VM; capped to the slot's cpus. fixed rather than
+# following the host so that grading behaves the same on every worker.
+FLS_GRADER_VM_CPUS = max(1, int(os.environ.get("FLS_GRADER_VM_CPUS", "2")))
+
+# port of the Prometheus metrics endpoint; 0 disables it.
+FLS_METRICS_PORT = int(os.environ.get("FLS_METRICS_PORT", "0"))
+
+# decompression budget for submission tarballs
+FLS_TAR_MAX_BYTES = int(os.environ.get("FLS_TAR_MAX_BYTES", str(256 * 1024 * 1024)))
+FLS_TAR_MAX_FILES = int(os.environ.get("FLS_TAR_MAX_FILES", "20000"))
+FLS_TAR_MAX_FILE_BYTES = int(
+    os.environ.get("FLS_TAR_MAX_FILE_BYTES", str(64 * 1024 * 1024))
+)
@@ -1,43 +1,223 @@
+import hashlib
+import io
+import json
 import logging
 import os
+import shutil
+import socket
+import tarfile
+import threading
+import zlib
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable
+from typing import IO, Callable, Iterable
 
 import docker
-
-from .config import (FLS_GRADING_BUILDER, FLS_GRADING_GRADER, FLS_HOST_ROOT,
-                     FLS_MOUNT_PREFIX)
-from .errors import FLSContainerFailure
-
-MAX_LOG_BYTES = 20 * 1024 * 1024  # 20MB
-TRUNCATION_NOTICE = (
-    b"\n\n"
-    b"====================\n"
-    b"[fls] LOG TRUNCATED: output exceeded 20MB\n"
-    b"====================\n"
-)
-
+from docker.models.containers import Container
+from docker.utils.socket import consume_socket_output, frames_iter
+
+from .config import (FLS_ARTIFACT_COMPRESSION, FLS_BUILDER_POOL,
+                     FLS_GRADER_KVM, FLS_GRADER_VM_CPUS, FLS_GRADER_VM_MIB,
+                     FLS_HOST_ROOT, FLS_MOUNT_PREFIX, FLS_TAR_MAX_BYTES,
+                     FLS_TAR_MAX_FILES, FLS_WORKER_SLOTS)
+from .errors import FLSContainerFailure, FLSSubmissionRejected
+from .images import ResolvedImage, images
+from .logsink import LogSink
+from .metrics import JobTimings, TimingMarkers, timed
+from .stagecache import Manifest, StageCacheSession, tree_manifest
+from .tarsafe import copy_sanitized
 
 host_cpus = os.cpu_count()
 if host_cpus is None:
     raise RuntimeError("failed to detect host CPU count")
 usable_cpus = max(1, host_cpus - 1)
 
+# every slot gets an equal share of the usable cpus and of host memory. a
+# slot runs its builder and grader one after the other, so the builder and
+# grader limits are both taken out of the same budget. a single slot keeps
+# the fixed limits regardless of host size.
+MIB = 1024 * 1024
+GIB = 1024 * MIB
+BUILDER_MAX_MEM = 8 * GIB
+GRADER_MAX_MEM = 2 * GIB
+
+# the builder's in-memory filesystems are charged to its memory limit. the
+# staged toolchain sources alone take up to BUILDER_SRC_MEM, and the build
+# needs room on top for the compilers, /tmp and /dist.
+BUILDER_SRC_MEM = 6 * GIB
+BUILDER_BUILD_MEM = 2 * GIB
+MIN_BUILDER_MEM = BUILDER_SRC_MEM + BUILDER_BUILD_MEM
+
+host_mem = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+usable_mem = max(GIB, host_mem - GIB)
+
+# idle pooled builders hold their staged sources in memory outside of any
+# slot's budget.
+pool_mem = FLS_BUILDER_POOL * BUILDER_SRC_MEM
+
+slot_cpus = max(1, usable_cpus // FLS_WORKER_SLOTS)
+if FLS_WORKER_SLOTS == 1:
+    slot_mem = BUILDER_MAX_MEM
+else:
+    slot_mem = max(0, usable_mem - pool_mem) // FLS_WORKER_SLOTS
+builder_mem = min(BUILDER_MAX_MEM, slot_mem)
+grader_mem = min(GRADER_MAX_MEM, slot_mem)
+
+
+def check_memory_budget() -> None:
+    """
+    Refuse slot and pool sizes that leave a builder too little memory to
+    stage the sources and build, instead of having builds OOM later.
+    """
+    if builder_mem < MIN_BUILDER_MEM:
+        raise RuntimeError(
+            f"FLS_WORKER_SLOTS={FLS_WORKER_SLOTS} and FLS_BUILDER_POOL="
+            f"{FLS_BUILDER_POOL} leave each builder {builder_mem // MIB} MiB "
+            f"of memory, less than the {MIN_BUILDER_MEM // MIB} MiB a build "
+            "needs; use fewer slots or pooled builders"
+        )
+    if FLS_BUILDER_POOL and FLS_WORKER_SLOTS * builder_mem + pool_mem > usable_mem:
+        raise RuntimeError(
+            f"FLS_BUILDER_POOL={FLS_BUILDER_POOL} does not fit in host memory "
+            "next to the running builders; use fewer pooled builders"
+        )
+
+
+# the grading VM gets at most the grader's cpus, and at most its memory less
+# room for QEMU itself and the grading script.
+GRADER_OVERHEAD_MEM = 512 * MIB
+grader_vm_mib = max(256, min(FLS_GRADER_VM_MIB, (grader_mem - GRADER_OVERHEAD_MEM) // MIB))
+grader_vm_cpus = min(FLS_GRADER_VM_CPUS, slot_cpus)
+
+# archives of freshly built stages are left here by build-all-stages.sh. it is
+# a tmpfs of its own so that the archives do not take space the build needs
+# in /dist.
+STAGE_EXPORT_DIR = "/stage-export"
+MAX_STAGE_ARCHIVE_BYTES = 2 * GIB
+
+# compiler cache settings for builders. the sources are rsynced to
+# /writable_src, so paths are made relative to it to share objects across
+# jobs. per-compile results go to a stats log since the cache itself may be
+# mounted read-only.
+CCACHE_ENVIRONMENT = {
+    "CCACHE_DIR": "/ccache",
+    "CCACHE_TEMPDIR": "/tmp/ccache",
+    "CCACHE_BASEDIR": "/writable_src",
+    "CCACHE_NOHASHDIR": "1",
+    "CCACHE_SLOPPINESS": "include_file_ctime,time_macros",
+    "CCACHE_STATSLOG": "/tmp/ccache-stats.log",
+    "CCACHE_MAXSIZE": "20G",
+    "PATH": "/usr/lib/ccache:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin",
+}
+
+# bootable.img leaves the builder as a sparse (and optionally gzipped) tar
+# stream; the cap applies to the logical size of the image.
+MAX_ARTIFACT_BYTES = 220 * 1024 * 1024
+ARTIFACT_CHUNK = 1024 * 1024
+ZERO_CHUNK = bytes(ARTIFACT_CHUNK)
+
+# in-memory /workspace of builders that receive the submission as a stream;
+# room for the largest accepted submission, where every file takes up at
+# least one 4 KiB page, plus directory overhead.
+TMPFS_PAGE_BYTES = 4096
+STREAMED_WORKSPACE_BYTES = (
+    FLS_TAR_MAX_BYTES + FLS_TAR_MAX_FILES * TMPFS_PAGE_BYTES + 64 * MIB
+)
+
+# grade.py's per-test report, written next to bootable.img in /dist
+REPORT_NAME = "report.json"
+MAX_REPORT_BYTES = 256 * 1024
+
+# hard cap on a whole build; the stages have tighter limits of their own. the
+# builder container is killed when it runs out, since stage scripts run in
+# process groups of their own that a kill of the build script would miss.
+BUILD_TIMEOUT_SECONDS = 2400
+
+# builders are labelled with the worker they belong to, so leftovers from a
+# crashed worker can be found and removed on startup.
+BUILDER_LABEL = "fls.builder"
+BUILDER_LABEL_VALUE = hashlib.sha256(str(FLS_HOST_ROOT).encode()).hexdigest()[:16]
+
 log = logging.getLogger("fls-docker")
 
 
+class _ChunkReader(io.RawIOBase):
+    """
+    Read-only file view of a stream of byte chunks, e.g. exec output.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = chunk
+
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+def _write_sparse(src: IO[bytes], dest: Path) -> None:
+    """
+    Copy src to dest, seeking over all-zero chunks instead of writing them
+    so that the holes of disk images stay holes on the host.
+    """
+    with dest.open("wb") as f:
+        while chunk := src.read(ARTIFACT_CHUNK):
+            if len(chunk) == ARTIFACT_CHUNK and chunk == ZERO_CHUNK:
+                f.seek(len(chunk), os.SEEK_CUR)
+            elif not chunk.strip(b"\0"):
+                f.seek(len(chunk), os.SEEK_CUR)
+            else:
+                f.write(chunk)
+        # a trailing hole only exists once the size is set
+        f.truncate()
+
+
+@dataclass
+class Builder:
+    """
+    A running builder container whose toolchain sources are staged.
+    """
+
+    container: Container
+    base_dir: Path
+    image: ResolvedImage
+    ccache: bool
+    # /workspace is a tmpfs filled through the exec API rather than a mount
+    streamed: bool = False
+
+    @property
+    def workspace_dir(self) -> Path:
+        return self.base_dir / "workspace"
+
+    @property
+    def stage_hits_dir(self) -> Path:
+        return self.base_dir / "stage-cache"
+
+
 class DockerClient:
     """
     Hardened Docker client grading.
 
     Invariants:
     - Builder runs with:
+        * toolchain sources staged into tmpfs before the submission arrives
         * read-only root
         * /dist as tmpfs (10GB)
-        * /workspace read-only
+        * /workspace read-only, or tmpfs fed a sanitized tar stream
         * no network
         * hard resource limits
-        * artifact extracted via docker cp (get_archive)
+        * artifact extracted as a sparse tar stream through exec
     - Grader runs ephemerally
     """
 
@@ -45,12 +225,22 @@ class DockerClient:
         self,
         *,
         log_path: Path,
+        timings: JobTimings | None = None,
+        client: docker.DockerClient | None = None,
     ):
         """
         Args:
             log_path:
                 File where all container output is appended.
 
+            timings:
+                Per-job record of how long each phase took, including the
+                timing markers found in container output.
+
+            client:
+                docker-py client to use instead of connecting to the daemon
+                from the environment.
+
             host_root:
                 Real host directory visible to the Docker daemon.
 
@@ -58,11 +248,12 @@ class DockerClient:
                 Path inside *this process* where host_root is mounted.
                 Used for path translation when running inside a container.
         """
-        self.client = docker.from_env()
+        self.client = client if client is not None else docker.from_env()
 
         self.log_path = log_path.resolve()
         self.log_path.parent.mkdir(parents=True, exist_ok=True)
         self.log_path.touch(exist_ok=True)
+        self.timings = timings
 
         self.host_root = FLS_HOST_ROOT
         self.mount_prefix = FLS_MOUNT_PREFIX
@@ -110,197 +301,595 @@ class DockerClient:
 
                 f.write(chunk)
 
-    def _append_logs(self, stream: Iterable[bytes]) -> None:
-        written = 0
+    def _log_line(self, message: str) -> None:
+        with self.log_path.open("a", encoding="utf-8") as f:
+            f.write(f"[fls] {message}\n")
 
-        with self.log_path.open("ab") as f:
-            for chunk in stream:
+    def _append_logs(
+        self,
+        stream: Iterable[bytes] | Iterable[tuple[bytes | None, bytes | None]],
+        *,
+        demuxed: bool = False,
+    ) -> LogSink:
+        """
+        Append container output to the job log, keeping its head and tail.
+
+        With demuxed set, stream yields (stdout, stderr) pairs as returned by
+        docker's demux=True, and the streams are counted separately.
+        """
+        markers = TimingMarkers(self.timings)
+        with LogSink(self.log_path) as sink:
+            for item in stream:
+                if demuxed:
+                    stdout, stderr = item  # type: ignore[misc]
+                    if stdout:
+                        markers.feed(stdout)
+                        sink.write(stdout, "stdout")
+                    if stderr:
+                        sink.write(stderr, "stderr")
+                    continue
+
+                chunk = item
                 if not isinstance(chunk, (bytes, bytearray)):
                     chunk = str(chunk).encode()
+                markers.feed(chunk)
+                sink.write(chunk)
+
+        if sink.omitted:
+            log.info(
+                "container output truncated: stdout %d bytes, stderr %d bytes",
+                sink.counts["stdout"],
+                sink.counts["stderr"],
+            )
+        return sink
 
-                if written < MAX_LOG_BYTES:
-                    remaining = MAX_LOG_BYTES - written
+    def _extract_artifact(self, container, path: str, dest: Path) -> None:
+        """
+        Copy a file out of a container without moving its holes.
 
-                    if len(chunk) <= remaining:
-                        f.write(chunk)
-                        written += len(chunk)
-                    else:
-                        # write partial chunk
-                        f.write(chunk[:remaining])
-                        written += remaining
+        The file is archived by GNU tar in the container (--sparse, and gzip
+        if FLS_ARTIFACT_COMPRESSION is set), and written back sparse on the
+        host. The size limit applies to the logical file size, and to the
+        transferred stream.
+        """
+        directory, name = path.rsplit("/", 1)
+        exec_id = self.client.api.exec_create(
+            container.id,
+            cmd=[
+                "tar",
+                "--sparse",
+                "-cz" if FLS_ARTIFACT_COMPRESSION else "-c",
+                "-f",
+                "-",
+                "-C",
+                directory or "/",
+                name,
+            ],
+            stdout=True,
+            stderr=False,
+        )["Id"]
 
-                        # write truncation notice once
-                        f.write(TRUNCATION_NOTICE)
+        def bounded(stream: Iterable[bytes]) -> Iterable[bytes]:
+            total = 0
+            for chunk in stream:
+                total += len(chunk)
+                if total > MAX_ARTIFACT_BYTES + ARTIFACT_CHUNK:
+                    raise FLSContainerFailure(
+                        f"artifact exceeded size limit ({total} bytes)"
+                    )
+                yield chunk
+
+        reader = io.BufferedReader(
+            _ChunkReader(bounded(self.client.api.exec_start(exec_id, stream=True))),
+            ARTIFACT_CHUNK,
+        )
+        try:
+            with tarfile.open(fileobj=reader, mode="r|*") as tar:
+                member = tar.next()
+                if member is None or member.name != name or not member.isreg():
+                    raise FLSContainerFailure(f"{path} not found after build")
+                if member.size > MAX_ARTIFACT_BYTES:
+                    raise FLSContainerFailure(
+                        f"artifact exceeded size limit ({member.size} bytes)"
+                    )
+
+                src = tar.extractfile(member)
+                assert src is not None
+                _write_sparse(src, dest)
+
+            exit_code = self.client.api.exec_inspect(exec_id)["ExitCode"]
+            if exit_code != 0:
+                raise FLSContainerFailure(
+                    f"artifact stream failed with exit code {exit_code}"
+                )
+        except (tarfile.TarError, EOFError, zlib.error) as e:
+            dest.unlink(missing_ok=True)
+            raise FLSContainerFailure(f"failed to copy {path}: {e}") from e
+        except BaseException:
+            # e.g. the stream went over the size limit halfway through the
+            # file; a retry or the grader must not find it truncated
+            dest.unlink(missing_ok=True)
+            raise
 
     # ------------------------------------------------------------------
-    # builder
+    # build caches
     # ------------------------------------------------------------------
 
-    def run_builder(
+    def _collect_stage_exports(
         self,
-        *,
-        workspace_dir: Path,
-        output_dir: Path,
-    ) -> Path:
+        container,
+        stage_cache: StageCacheSession,
+    ) -> None:
         """
-        Run the hardened builder container and extract bootable.img.
-
-        Returns:
-            Path to bootable.img on the host.
+        Copy the archives of freshly built stages out of the builder and
+        store them in the stage cache. Failures only cost future cache hits.
         """
-        workspace_host = self._to_host_path(workspace_dir)
-        output_dir = output_dir.resolve()
-        output_dir.mkdir(parents=True, exist_ok=True)
-
-        log.info("pulling image %s", FLS_GRADING_BUILDER)
-        self.client.images.pull(FLS_GRADING_BUILDER)
-
-        log.info("creating builder container")
+        for stage in stage_cache.misses:
+            dest = stage_cache.exports_dir / f"{stage}.tar"
+            try:
+                exec_id = self.client.api.exec_create(
+                    container.id,
+                    cmd=["cat", f"{STAGE_EXPORT_DIR}/{stage}.tar"],
+                    stdout=True,
+                    stderr=False,
+                )["Id"]
+                self._write_stream_to_file(
+                    self.client.api.exec_start(exec_id, stream=True),
+                    dest=dest,
+                    max_bytes=MAX_STAGE_ARCHIVE_BYTES,
+                )
+                if self.client.api.exec_inspect(exec_id)["ExitCode"] != 0:
+                    # the stage never finished
+                    dest.unlink(missing_ok=True)
+                    continue
 
-        container = self.client.containers.create(
-            image=FLS_GRADING_BUILDER,
-            entrypoint=["/usr/bin/tini", "--"],
-            command=["sleep", "2400"],
-            network_mode="none",
-            read_only=True,
-            detach=True,
-            volumes={
-                str(workspace_host): {
-                    "bind": "/workspace",
-                    "mode": "ro",
-                },
-            },
-            tmpfs={
-                "/tmp": "size=4g,mode=755,exec",
-                "/dist": "size=10g,mode=755,exec",
-                "/writable_src": "size=6g,mode=755,exec",
-            },
-            environment={
-                "DIST": "/dist",
-                "SRC": "/writable_src",
-            },
-            mem_limit="8g",
-            memswap_limit="8g",
-            nano_cpus=usable_cpus * 1_000_000_000,
-            pids_limit=512,
-            security_opt=["no-new-privileges"],
-            cap_drop=["SYS_PTRACE", "SYS_ADMIN"],
-        )
+                stage_cache.store(stage, dest)
+                log.info("cached %s stage", stage)
+            except Exception:
+                log.exception("failed to cache %s stage", stage)
+                dest.unlink(missing_ok=True)
 
+    def _report_ccache_stats(self, container) -> None:
+        """
+        Append the compiler cache hit rate of this build to the job log.
+        """
         try:
-            container.start()
-
-            log.info("executing build script")
-
             exec_id = self.client.api.exec_create(
                 container.id,
                 cmd=[
                     "sh",
                     "-c",
-                    "rsync -a --delete /src/ /writable_src/ && exec /build-all-stages.sh",
+                    "echo '[fls] compiler cache statistics:'; "
+                    "ccache --show-log-stats 2>&1 || echo '[fls] no compilations'",
                 ],
                 stdout=True,
                 stderr=True,
             )["Id"]
+            self._append_logs(self.client.api.exec_start(exec_id, stream=True))
+        except Exception:
+            log.exception("failed to collect ccache statistics")
+
+    # ------------------------------------------------------------------
+    # streamed submissions
+    # ------------------------------------------------------------------
 
-            output = self.client.api.exec_start(
-                exec_id,
-                stream=True,
+    def _stream_workspace(self, builder: Builder, tarball: IO[bytes]) -> Manifest:
+        """
+        Unpack the submission tarball into the builder's tmpfs /workspace.
+
+        The tarball is sanitized on the fly (see copy_sanitized) and piped
+        into tar running inside the builder, so nothing touches the host's
+        disk. Returns the manifest of the unpacked tree.
+        """
+        exec_id = self.client.api.exec_create(
+            builder.container.id,
+            cmd=["tar", "-x", "-p", "--no-same-owner", "-C", "/workspace"],
+            stdin=True,
+            stdout=True,
+            stderr=True,
+        )["Id"]
+        sock = self.client.api.exec_start(exec_id, socket=True)
+        raw = sock._sock
+
+        class _Sink:
+            def write(self, data: bytes) -> int:
+                raw.sendall(data)
+                return len(data)
+
+        # tar stops reading when it fails (say, with /workspace full), which
+        # shows up here as a broken pipe; its exit code and output tell why.
+        broken_pipe = False
+        try:
+            try:
+                manifest = copy_sanitized(tarball, _Sink())  # type: ignore[arg-type]
+                raw.shutdown(socket.SHUT_WR)
+            except (BrokenPipeError, ConnectionResetError):
+                broken_pipe = True
+            output = consume_socket_output(frames_iter(sock, tty=False))
+        finally:
+            sock.close()
+
+        exit_code = self.client.api.exec_inspect(exec_id)["ExitCode"]
+        if exit_code != 0:
+            self._append_logs([output])
+            raise FLSSubmissionRejected(
+                f"unpacking submission failed with exit code {exit_code}"
             )
+        if broken_pipe:
+            raise FLSContainerFailure("tar stopped reading the submission")
 
-            self._append_logs(output)
+        return manifest
 
-            inspect = self.client.api.exec_inspect(exec_id)
-            exit_code = inspect["ExitCode"]
+    # ------------------------------------------------------------------
+    # builder
+    # ------------------------------------------------------------------
 
-            if exit_code != 0:
-                raise FLSContainerFailure(f"builder failed with exit code {exit_code}")
+    def create_builder(
+        self,
+        *,
+        base_dir: Path,
+        stage_cache: bool = False,
+        ccache_dir: Path | None = None,
+        ccache_writable: bool = False,
+        streamed: bool = False,
+    ) -> Builder:
+        """
+        Start a hardened builder container and stage the toolchain sources
+        into its /writable_src. The container idles until run_builder hands
+        it a submission, so this can happen ahead of time.
 
-            # Bootable image streaming
-            exec_id = self.client.api.exec_create(
-                container.id,
-                cmd=["sh", "-c", "exec cat /dist/bootable.img"],
-                stdout=True,
-                stderr=False,
-            )["Id"]
+        base_dir is a fresh directory on the host holding the directories
+        the container mounts; the submission is later moved into
+        base_dir/workspace.
 
-            stream = self.client.api.exec_start(exec_id, stream=True)
+        If stage_cache is set, the builder restores stages found in
+        base_dir/stage-cache and archives the ones it rebuilds.
 
-            bootable = output_dir / "bootable.img"
-            self._write_stream_to_file(
-                stream,
-                dest=bootable,
-                max_bytes=220 * 1024 * 1024,  # 220MB cap
+        If ccache_dir is given, it is mounted as the compiler cache. It is
+        read-only unless ccache_writable is set, which must only be done for
+        trusted builds.
+
+        If streamed is set, /workspace is an in-memory filesystem and the
+        submission is later piped into it instead of being bind-mounted from
+        base_dir/workspace.
+        """
+        base_dir = base_dir.resolve()
+        workspace_dir = base_dir / "workspace"
+        hits_dir = base_dir / "stage-cache"
+        workspace_dir.mkdir(parents=True)
+        hits_dir.mkdir()
+
+        image = images.builder()
+
+        volumes = {}
+        # these are charged to the builder's memory limit, so none may be
+        # larger than it.
+        tmpfs = {
+            "/tmp": f"size={min(4 * GIB, builder_mem)},mode=755,exec",
+            "/dist": f"size={builder_mem},mode=755,exec",
+            "/writable_src": f"size={BUILDER_SRC_MEM},mode=755,exec",
+        }
+        if streamed:
+            tmpfs["/workspace"] = f"size={STREAMED_WORKSPACE_BYTES},mode=755,exec"
+        else:
+            volumes[str(self._to_host_path(workspace_dir))] = {
+                "bind": "/workspace",
+                "mode": "ro",
+            }
+
+        environment = {
+            "DIST": "/dist",
+            "SRC": "/writable_src",
+        }
+
+        if stage_cache:
+            volumes[str(self._to_host_path(hits_dir))] = {
+                "bind": "/stage-cache",
+                "mode": "ro",
+            }
+            environment["STAGE_CACHE"] = "/stage-cache"
+            environment["STAGE_EXPORT"] = STAGE_EXPORT_DIR
+            tmpfs[STAGE_EXPORT_DIR] = f"size={MAX_STAGE_ARCHIVE_BYTES},mode=755"
+
+        if ccache_dir is not None:
+            ccache_dir.mkdir(parents=True, exist_ok=True)
+            volumes[str(self._to_host_path(ccache_dir))] = {
+                "bind": "/ccache",
+                "mode": "rw" if ccache_writable else "ro",
+            }
+            environment.update(CCACHE_ENVIRONMENT)
+            if not ccache_writable:
+                environment["CCACHE_READONLY"] = "1"
+                environment["CCACHE_NOSTATS"] = "1"
+
+        log.info("creating builder container")
+
+        with timed("builder_create", self.timings):
+            container = self.client.containers.create(
+                image=image.id,
+                entrypoint=["/usr/bin/tini", "--"],
+                command=["sleep", "infinity"],
+                network_mode="none",
+                read_only=True,
+                detach=True,
+                volumes=volumes,
+                tmpfs=tmpfs,
+                environment=environment,
+                mem_limit=builder_mem,
+                memswap_limit=builder_mem,
+                nano_cpus=slot_cpus * 1_000_000_000,
+                pids_limit=512,
+                security_opt=["no-new-privileges"],
+                cap_drop=["SYS_PTRACE", "SYS_ADMIN"],
+                labels={BUILDER_LABEL: BUILDER_LABEL_VALUE},
             )
-            inspect = self.client.api.exec_inspect(exec_id)
-            exit_code = inspect["ExitCode"]
+        builder = Builder(
+            container=container,
+            base_dir=base_dir,
+            image=image,
+            ccache=ccache_dir is not None,
+            streamed=streamed,
+        )
+
+        try:
+            with timed("builder_start", self.timings):
+                container.start()
+
+            log.info("staging sources in builder")
+
+            with timed("source_staging", self.timings):
+                exec_id = self.client.api.exec_create(
+                    container.id,
+                    cmd=["rsync", "-a", "--delete", "/src/", "/writable_src/"],
+                    stdout=True,
+                    stderr=True,
+                )["Id"]
+                self._append_logs(self.client.api.exec_start(exec_id, stream=True))
+
+                exit_code = self.client.api.exec_inspect(exec_id)["ExitCode"]
             if exit_code != 0:
+                raise RuntimeError(f"source staging failed with exit code {exit_code}")
+        except BaseException:
+            self.destroy_builder(builder)
+            raise
+
+        return builder
+
+    def destroy_builder(self, builder: Builder) -> None:
+        log.info("destroying builder container")
+        try:
+            builder.container.remove(force=True)
+        except Exception:
+            log.exception("failed to remove builder container")
+        shutil.rmtree(builder.base_dir, ignore_errors=True)
+
+    def remove_stale_builders(self) -> None:
+        """
+        Remove builders left behind by a previous run of this worker.
+        """
+        stale = self.client.containers.list(
+            all=True,
+            filters={"label": f"{BUILDER_LABEL}={BUILDER_LABEL_VALUE}"},
+        )
+        for container in stale:
+            log.info("removing stale builder %s", container.short_id)
+            try:
+                container.remove(force=True)
+            except Exception:
+                log.exception("failed to remove stale builder")
+
+    def run_builder(
+        self,
+        *,
+        builder: Builder,
+        output_dir: Path,
+        workspace_dir: Path | None = None,
+        open_tarball: Callable[[], IO[bytes]] | None = None,
+        stage_cache: StageCacheSession | None = None,
+        check_workspace: Callable[[Manifest], bool] | None = None,
+    ) -> Path | None:
+        """
+        Build a submission inside builder and extract bootable.img. The
+        builder is destroyed afterwards.
+
+        The submission is either the extracted tree in workspace_dir, which
+        is moved into the builder's workspace, or, for streamed builders, the
+        submission tarball returned by open_tarball, which is sanitized and
+        piped into the builder.
+
+        If stage_cache is given (the builder must have been created with
+        stage_cache=True), stages whose inputs are unchanged are restored
+        from the cache instead of being rebuilt, and freshly built stages are
+        added to it.
+
+        If check_workspace is given, it is called with the manifest of the
+        submission once the submission is in the builder. If it returns
+        False, nothing is built and None is returned.
+
+        Returns:
+            Path to bootable.img on the host.
+        """
+        output_dir = output_dir.resolve()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        container = builder.container
+
+        try:
+            with timed("workspace", self.timings):
+                manifest = None
+                if builder.streamed:
+                    if open_tarball is None:
+                        raise RuntimeError("streamed builder needs a tarball")
+                    log.info("streaming submission into builder")
+                    with open_tarball() as tarball:
+                        manifest = self._stream_workspace(builder, tarball)
+                else:
+                    if workspace_dir is None:
+                        raise RuntimeError("builder needs an extracted workspace")
+                    for entry in workspace_dir.iterdir():
+                        shutil.move(entry, builder.workspace_dir / entry.name)
+
+            if manifest is None and (stage_cache is not None or check_workspace is not None):
+                manifest = tree_manifest(builder.workspace_dir)
+
+            if check_workspace is not None and not check_workspace(manifest):
+                return None
+
+            if stage_cache is not None:
+                with timed("stage_cache_lookup", self.timings):
+                    stage_cache.prepare(
+                        manifest,
+                        builder_image=builder.image.id,
+                        hits_dir=builder.stage_hits_dir,
+                    )
+
+            self._log_line(f"builder image: {builder.image.describe()}")
+
+            log.info("executing build script")
+
+            timed_out = threading.Event()
+
+            def kill_build() -> None:
+                timed_out.set()
+                log.warning("build timed out; killing builder")
+                try:
+                    container.kill()
+                except Exception:
+                    log.exception("failed to kill builder")
+
+            with timed("build", self.timings):
+                exec_id = self.client.api.exec_create(
+                    container.id,
+                    cmd=["/build-all-stages.sh"],
+                    stdout=True,
+                    stderr=True,
+                )["Id"]
+
+                deadline = threading.Timer(BUILD_TIMEOUT_SECONDS, kill_build)
+                deadline.daemon = True
+                deadline.start()
+                try:
+                    output = self.client.api.exec_start(
+                        exec_id,
+                        stream=True,
+                        demux=True,
+                    )
+
+                    self._append_logs(output, demuxed=True)
+                finally:
+                    deadline.cancel()
+
+            if timed_out.is_set():
+                self._log_line(f"build timed out after {BUILD_TIMEOUT_SECONDS}s")
                 raise FLSContainerFailure(
-                    f"artifact stream failed with exit code {inspect['ExitCode']}"
+                    f"build timed out after {BUILD_TIMEOUT_SECONDS}s"
                 )
 
+            inspect = self.client.api.exec_inspect(exec_id)
+            exit_code = inspect["ExitCode"]
+
+            if builder.ccache:
+                self._report_ccache_stats(container)
+
+            # stages that finished are worth keeping even if a later one failed
+            if stage_cache is not None:
+                with timed("stage_cache_store", self.timings):
+                    self._collect_stage_exports(container, stage_cache)
+
+            if exit_code != 0:
+                raise FLSContainerFailure(f"builder failed with exit code {exit_code}")
+
+            bootable = output_dir / "bootable.img"
+            with timed("artifact_copy", self.timings):
+                self._extract_artifact(container, "/dist/bootable.img", bootable)
+
             if not bootable.exists():
                 raise FLSContainerFailure("bootable.img not found after extraction")
 
             return bootable
 
         finally:
-            log.info("destroying builder container")
-            try:
-                container.remove(force=True)
-            except Exception:
-                log.exception("failed to remove builder container")
+            self.destroy_builder(builder)
 
     # ------------------------------------------------------------------
     # grader
     # ------------------------------------------------------------------
 
+    def _check_report(self, path: Path) -> None:
+        """
+        Keep the grader's report only if it is a small JSON object with a
+        list of tests; anything else is dropped from the result.
+        """
+        try:
+            if path.stat().st_size > MAX_REPORT_BYTES:
+                raise ValueError("too large")
+            report = json.loads(path.read_bytes())
+            if not isinstance(report, dict) or not isinstance(report.get("tests"), list):
+                raise ValueError("unexpected format")
+        except FileNotFoundError:
+            self._log_line("grader wrote no report")
+        except ValueError as e:
+            self._log_line(f"ignoring grader report: {e}")
+            path.unlink(missing_ok=True)
+
     def run_grader(
         self,
         *,
         bootable_img: Path,
     ) -> None:
         """
-        Run the grader container against a bootable image.
+        Run the grader container against a bootable image. The grader's
+        report, if any, is left next to the image as report.json.
         """
         bootable_img = bootable_img.resolve()
         dist_dir = bootable_img.parent
         dist_host = self._to_host_path(dist_dir)
+        report_path = dist_dir / REPORT_NAME
+        report_path.unlink(missing_ok=True)
 
         log.info("starting grader container")
 
-        log.info("pulling image %s", FLS_GRADING_GRADER)
-        self.client.images.pull(FLS_GRADING_GRADER)
-
-        container = self.client.containers.run(
-            image=FLS_GRADING_GRADER,
-            command=[
-                "timeout",
-                "--signal=KILL",
-                "3m",
-                "/grade.py",
-                "/dist/bootable.img",
-            ],
-            remove=True,
-            detach=True,
-            network_mode="none",
-            volumes={
-                str(dist_host): {
-                    "bind": "/dist",
-                    "mode": "rw",
-                }
-            },
-            # qemu can only use 1024mb here anw which should be overkill.
-            mem_limit="2g",
-            memswap_limit="2g",
-            nano_cpus=usable_cpus * 1_000_000_000,
-            pids_limit=256,
-        )
+        image = images.grader()
+        self._log_line(f"grader image: {image.describe()}")
+
+        with timed("grader_start", self.timings):
+            container = self.client.containers.run(
+                image=image.id,
+                command=[
+                    "timeout",
+                    "--signal=KILL",
+                    "3m",
+                    "/grade.py",
+                    "/dist/bootable.img",
+                ],
+                remove=True,
+                detach=True,
+                network_mode="none",
+                volumes={
+                    str(dist_host): {
+                        "bind": "/dist",
+                        "mode": "rw",
+                    }
+                },
+                environment={
+                    "FLS_VM_CPUS": str(grader_vm_cpus),
+                    "FLS_VM_MEM_MIB": str(grader_vm_mib),
+                },
+                devices=["/dev/kvm:/dev/kvm:rwm"] if FLS_GRADER_KVM else None,
+                mem_limit=grader_mem,
+                memswap_limit=grader_mem,
+                nano_cpus=slot_cpus * 1_000_000_000,
+                pids_limit=256,
+            )
 
         try:
-            self._append_logs(container.logs(stream=True))
-            result = container.wait()
+            with timed("grade", self.timings):
+                self._append_logs(
+                    container.attach(stream=True, logs=True, demux=True),
+                    demuxed=True,
+                )
+                result = container.wait()
             status = int(result["StatusCode"])
+            self._check_report(report_path)
 
             if status != 0:
                 raise FLSContainerFailure(f"grader failed with exit code {status}")
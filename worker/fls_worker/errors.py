@@ -25,3 +25,6 @@ class FLSAlreadyClaimedError(FLSAPIError):
 
 class FLSContainerFailure(Exception):
     pass
+
+class FLSSubmissionRejected(Exception):
+    """The submission itself is unusable; the message is shown to the student."""
@@ -0,0 +1,91 @@
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from .apiclient import FLSClient
+
+log = logging.getLogger("fls-heartbeat")
+
+HEARTBEAT_INTERVAL_SECONDS = 20
+
+
+@dataclass
+class Lease:
+    submission_id: int
+    stage: str
+    log_path: Path
+
+    def to_json(self) -> dict:
+        try:
+            log_bytes = self.log_path.stat().st_size
+        except OSError:
+            log_bytes = 0
+        return {"id": self.submission_id, "stage": self.stage, "logBytes": log_bytes}
+
+
+class HeartbeatManager:
+    """
+    Renews the server-side lease of every job this worker holds.
+
+    A single thread sends one heartbeat for all jobs every interval seconds
+    (and right away when a job is added or removed) over one keep-alive
+    session.
+    """
+
+    def __init__(self, interval: float = HEARTBEAT_INTERVAL_SECONDS):
+        self.interval = interval
+        self._leases: dict[int, Lease] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def register(self, submission_id: int, *, log_path: Path, stage: str) -> None:
+        with self._lock:
+            self._leases[submission_id] = Lease(submission_id, stage, log_path)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="heartbeat",
+                    daemon=True,
+                )
+                self._thread.start()
+        self._wake.set()
+
+    def set_stage(self, submission_id: int, stage: str) -> None:
+        with self._lock:
+            lease = self._leases.get(submission_id)
+            if lease is not None:
+                lease.stage = stage
+
+    def unregister(self, submission_id: int) -> None:
+        with self._lock:
+            self._leases.pop(submission_id, None)
+        self._wake.set()
+
+    def _run(self) -> None:
+        api = FLSClient()
+        had_jobs = False
+
+        while True:
+            with self._lock:
+                jobs = [lease.to_json() for lease in self._leases.values()]
+
+            # one last beat after the final job goes away marks us idle
+            if jobs or had_jobs:
+                try:
+                    for submission_id in api.grading_heartbeat(jobs):
+                        log.warning(
+                            "the server no longer holds submission %s for us; "
+                            "its lease may have expired",
+                            submission_id,
+                        )
+                except Exception:
+                    log.warning("heartbeat failed", exc_info=True)
+            had_jobs = bool(jobs)
+
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+heartbeats = HeartbeatManager()
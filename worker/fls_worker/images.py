@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+import docker
+from docker.errors import APIError
+
+from .config import FLS_GRADING_BUILDER, FLS_GRADING_GRADER, FLS_IMAGE_REFRESH_SECONDS
+from .metrics import timed
+
+log = logging.getLogger("fls-images")
+
+
+@dataclass(frozen=True)
+class ResolvedImage:
+    """
+    A tag pinned to the image it pointed at when it was last pulled.
+    """
+
+    ref: str
+    id: str
+    digest: str | None
+
+    def describe(self) -> str:
+        if self.digest:
+            return self.digest
+        return f"{self.ref} ({self.id})"
+
+
+class ImageManager:
+    """
+    Resolves the builder and grader tags to local images.
+
+    Jobs run against the locally cached image id, so no registry round trip
+    sits in the critical path. A background thread pulls the tags every
+    refresh_seconds and moves the pins when a tag has moved.
+    """
+
+    def __init__(self, refs: dict[str, str], *, refresh_seconds: float):
+        self.refs = refs
+        self.refresh_seconds = refresh_seconds
+        self._resolved: dict[str, ResolvedImage] = {}
+        self._lock = threading.Lock()
+        self._client: docker.DockerClient | None = None
+
+    def use_client(self, client: docker.DockerClient) -> None:
+        """
+        Resolve images with client instead of the daemon from the
+        environment.
+        """
+        self._client = client
+
+    def _docker(self) -> docker.DockerClient:
+        if self._client is None:
+            self._client = docker.from_env()
+        return self._client
+
+    def _resolve(self, name: str) -> ResolvedImage:
+        ref = self.refs[name]
+        try:
+            with timed(f"image_pull.{name}"):
+                image = self._docker().images.pull(ref)
+        except APIError:
+            # registry trouble; fall back to whatever we have locally
+            log.warning("failed to pull %s, using local image", ref)
+            image = self._docker().images.get(ref)
+
+        repo = ref.rsplit(":", 1)[0] if ":" in ref.rsplit("/", 1)[-1] else ref
+        digest = next(
+            (d for d in image.attrs.get("RepoDigests", []) if d.startswith(f"{repo}@")),
+            None,
+        )
+        return ResolvedImage(ref=ref, id=image.id, digest=digest)
+
+    def refresh(self) -> None:
+        for name in self.refs:
+            try:
+                resolved = self._resolve(name)
+            except Exception:
+                log.exception("failed to refresh %s image", name)
+                continue
+
+            with self._lock:
+                previous = self._resolved.get(name)
+                self._resolved[name] = resolved
+
+            if previous is None or previous.id != resolved.id:
+                log.info("%s image is now %s", name, resolved.describe())
+
+    def get(self, name: str) -> ResolvedImage:
+        with self._lock:
+            resolved = self._resolved.get(name)
+        if resolved is not None:
+            return resolved
+
+        resolved = self._resolve(name)
+        with self._lock:
+            return self._resolved.setdefault(name, resolved)
+
+    def builder(self) -> ResolvedImage:
+        return self.get("builder")
+
+    def grader(self) -> ResolvedImage:
+        return self.get("grader")
+
+    def start(self) -> None:
+        """
+        Resolve both images now and keep them fresh in the background.
+        """
+        self.refresh()
+        threading.Thread(target=self._run, name="image-refresh", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.refresh_seconds)
+            self.refresh()
+
+
+images = ImageManager(
+    {"builder": FLS_GRADING_BUILDER, "grader": FLS_GRADING_GRADER},
+    refresh_seconds=FLS_IMAGE_REFRESH_SECONDS,
+)
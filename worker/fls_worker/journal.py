@@ -0,0 +1,140 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from .models import Submission
+
+log = logging.getLogger("fls-journal")
+
+# job states, in order. a job leaves the journal once it is finished or
+# handed back, so whatever is left after a crash was interrupted.
+CLAIMED = "claimed"
+STAGED = "staged"
+# bootable.img is in the job's out dir
+BUILT = "built"
+# the verdict is known; the log and report are ready to upload
+GRADED = "graded"
+
+
+@dataclass
+class JournalEntry:
+    submission: Submission
+    slot: int
+    base_dir: Path
+    state: str
+    passed: bool | None
+
+
+class JobJournal:
+    """
+    Crash-safe record of the jobs this worker holds, kept in SQLite so a
+    restarted worker can finish what it had claimed.
+
+    Every change is committed before the caller moves on; a connection is
+    opened per call, so any thread may use the journal.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._created = False
+
+    def _connect(self) -> sqlite3.Connection:
+        # the database is created on first use, so that merely importing
+        # the worker leaves the disk alone. callers hold _lock.
+        if not self._created:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30)
+            try:
+                with db:
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.execute(
+                        """
+                        CREATE TABLE IF NOT EXISTS jobs (
+                            submission_id INTEGER PRIMARY KEY,
+                            submission TEXT NOT NULL,
+                            slot INTEGER NOT NULL,
+                            base_dir TEXT NOT NULL,
+                            state TEXT NOT NULL,
+                            passed INTEGER,
+                            updated_at REAL NOT NULL
+                        )
+                        """
+                    )
+            finally:
+                db.close()
+            self._created = True
+
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA synchronous=FULL")
+        return db
+
+    def _execute(self, sql: str, params: tuple) -> None:
+        # the journal only matters after a crash; never fail a job over it
+        try:
+            with self._lock:
+                db = self._connect()
+                try:
+                    with db:
+                        db.execute(sql, params)
+                finally:
+                    db.close()
+        except sqlite3.Error:
+            log.exception("failed to update the job journal")
+
+    def claimed(self, submission: Submission, *, slot: int, base_dir: Path) -> None:
+        self._execute(
+            """
+            INSERT OR REPLACE INTO jobs
+                (submission_id, submission, slot, base_dir, state, passed, updated_at)
+            VALUES (?, ?, ?, ?, ?, NULL, ?)
+            """,
+            (
+                submission.id,
+                json.dumps(submission.to_json()),
+                slot,
+                str(base_dir),
+                CLAIMED,
+                time.time(),
+            ),
+        )
+
+    def advance(self, submission_id: int, state: str, *, passed: bool | None = None) -> None:
+        self._execute(
+            "UPDATE jobs SET state = ?, passed = ?, updated_at = ? WHERE submission_id = ?",
+            (state, passed, time.time(), submission_id),
+        )
+
+    def forget(self, submission_id: int) -> None:
+        self._execute("DELETE FROM jobs WHERE submission_id = ?", (submission_id,))
+
+    def entries(self) -> list[JournalEntry]:
+        with self._lock:
+            db = self._connect()
+            try:
+                rows = db.execute(
+                    "SELECT submission, slot, base_dir, state, passed FROM jobs"
+                    " ORDER BY updated_at"
+                ).fetchall()
+            finally:
+                db.close()
+
+        entries = []
+        for submission, slot, base_dir, state, passed in rows:
+            try:
+                entries.append(
+                    JournalEntry(
+                        submission=Submission.from_json(json.loads(submission)),
+                        slot=slot,
+                        base_dir=Path(base_dir),
+                        state=state,
+                        passed=None if passed is None else bool(passed),
+                    )
+                )
+            except (ValueError, KeyError):
+                log.exception("skipping unreadable journal entry")
+        return entries
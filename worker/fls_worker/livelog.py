@@ -0,0 +1,102 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from .apiclient import FLSClient
+from .config import FLS_LIVE_LOG_SECONDS
+from .errors import FLSNotFoundError
+
+log = logging.getLogger("fls-livelog")
+
+# largest append sent in one request
+MAX_APPEND_BYTES = 256 * 1024
+
+
+@dataclass
+class _Tail:
+    submission_id: int
+    log_path: Path
+    # bytes of the log the server holds
+    offset: int = 0
+    # set once the server stops accepting more (size cap)
+    stopped: bool = False
+
+
+class LiveLogStreamer:
+    """
+    Streams the logs of running jobs to the server while they grow.
+
+    A single thread looks at every registered log each interval seconds and
+    appends what is new. Appends carry the offset they start at, so a retry
+    after a lost response is harmless; the server answers with the size it
+    holds and the next append starts there.
+    """
+
+    def __init__(self, interval: float = FLS_LIVE_LOG_SECONDS):
+        self.interval = interval
+        self._tails: dict[int, _Tail] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        # cleared the first time the server turns out not to support this
+        self.supported = interval > 0
+
+    def register(self, submission_id: int, *, log_path: Path) -> None:
+        if not self.supported:
+            return
+        with self._lock:
+            self._tails[submission_id] = _Tail(submission_id, log_path)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="livelog",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def unregister(self, submission_id: int) -> None:
+        with self._lock:
+            self._tails.pop(submission_id, None)
+
+    def _send(self, api: FLSClient, tail: _Tail) -> None:
+        try:
+            with tail.log_path.open("rb") as f:
+                f.seek(tail.offset)
+                data = f.read(MAX_APPEND_BYTES)
+        except FileNotFoundError:
+            return
+        if not data:
+            return
+
+        size = api.append_logs(tail.submission_id, offset=tail.offset, data=data)
+        if tail.offset <= size < tail.offset + len(data):
+            log.info("server stopped accepting live logs for %s", tail.submission_id)
+            tail.stopped = True
+        tail.offset = size
+
+    def _run(self) -> None:
+        api = FLSClient()
+
+        while self.supported:
+            with self._lock:
+                tails = [t for t in self._tails.values() if not t.stopped]
+
+            for tail in tails:
+                try:
+                    self._send(api, tail)
+                except FLSNotFoundError:
+                    log.warning("server does not support live logs; disabling them")
+                    self.supported = False
+                    break
+                except Exception:
+                    log.warning(
+                        "failed to stream logs of %s",
+                        tail.submission_id,
+                        exc_info=True,
+                    )
+
+            time.sleep(self.interval)
+
+
+live_logs = LiveLogStreamer()
@@ -0,0 +1,92 @@
+from collections import deque
+from pathlib import Path
+from types import TracebackType
+
+# what is kept of one container output stream: the start of the output, and
+# its end, where the error that ended a failed build is.
+LOG_HEAD_BYTES = 16 * 1024 * 1024
+LOG_TAIL_BYTES = 4 * 1024 * 1024
+
+STREAMS = ("stdout", "stderr")
+
+
+class LogSink:
+    """
+    Appends container output to a job log with bounded size.
+
+    The first head_bytes are written as they arrive. After that, only the
+    last tail_bytes are kept, in memory, and written after a single
+    truncation marker when the sink is closed. Bytes are counted per stream
+    whether or not they are kept.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        head_bytes: int = LOG_HEAD_BYTES,
+        tail_bytes: int = LOG_TAIL_BYTES,
+    ):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.counts = {stream: 0 for stream in STREAMS}
+        self.written = 0
+        # bytes dropped between head and tail, known once closed
+        self.omitted = 0
+        self._tail: deque[bytes] = deque()
+        self._tail_size = 0
+        self._file = path.open("ab")
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def write(self, chunk: bytes, stream: str = "stdout") -> None:
+        self.counts[stream] += len(chunk)
+
+        if self.written < self.head_bytes:
+            head = chunk[: self.head_bytes - self.written]
+            self._file.write(head)
+            self.written += len(head)
+            chunk = chunk[len(head):]
+
+        if chunk and self.tail_bytes > 0:
+            self._tail.append(chunk)
+            self._tail_size += len(chunk)
+            # drop whole chunks that are no longer needed for the tail
+            while self._tail_size - len(self._tail[0]) >= self.tail_bytes:
+                self._tail_size -= len(self._tail.popleft())
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+
+        tail = b"".join(self._tail)[-self.tail_bytes:] if self.tail_bytes > 0 else b""
+        self.omitted = self.total - self.written - len(tail)
+        if self.omitted > 0:
+            self._file.write(
+                b"\n\n"
+                b"====================\n"
+                + (
+                    f"[fls] LOG TRUNCATED: {self.omitted} bytes omitted "
+                    f"(stdout {self.counts['stdout']} bytes, "
+                    f"stderr {self.counts['stderr']} bytes in total)\n"
+                ).encode()
+                + b"====================\n\n"
+            )
+        self._file.write(tail)
+        self.written += len(tail)
+        self._tail.clear()
+        self._tail_size = 0
+        self._file.close()
+
+    def __enter__(self) -> "LogSink":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
 import logging
 import random
+import threading
 import time
 import traceback
 
-from .worker import run_once
+from .config import (FLS_BUILDER_POOL, FLS_GRADER_KVM, FLS_METRICS_PORT,
+                     FLS_WORKER_PIPELINE, FLS_WORKER_SLOTS)
+from .dockerclient import (builder_mem, check_memory_budget, grader_vm_cpus,
+                           grader_vm_mib, slot_cpus)
+from .images import images
+from .metrics import start_server as start_metrics_server
+from .worker import (Slot, cancel_active_jobs, resume_jobs, start_builder_pool,
+                     stop_builder_pool)
 
 # ------------------------------------------------------------
 # configuration knobs
@@ -21,7 +29,7 @@ MAX_BACKOFF_SECONDS = 300
 
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    format="%(asctime)s [%(levelname)s] [%(threadName)s] %(name)s: %(message)s",
 )
 
 log = logging.getLogger("fls-main")
@@ -32,14 +40,15 @@ log = logging.getLogger("fls-main")
 # ------------------------------------------------------------
 
 
-def main() -> None:
-    log.info("grading worker starting")
-
+def slot_loop(slot: Slot) -> None:
     backoff = ERROR_SLEEP_SECONDS
 
+    # spread out the first poll of each slot
+    time.sleep(random.uniform(0, slot.index))
+
     while True:
         try:
-            did_work = run_once()
+            did_work = slot.run_once()
 
             if did_work:
                 # reset backoff after successful work
@@ -47,14 +56,15 @@ def main() -> None:
                 continue
 
             # idle path
+            if slot.waited_for_work:
+                # the long poll already waited; just avoid lockstep
+                time.sleep(random.uniform(0, 1))
+                continue
+
             sleep_for = IDLE_SLEEP_SECONDS + random.uniform(-3, 3)
             log.debug("idle, sleeping for %.1fs", sleep_for)
             time.sleep(max(1.0, sleep_for))
 
-        except KeyboardInterrupt:
-            log.info("received keyboard interrupt, exiting")
-            return
-
         except Exception:
             # this should never happen, but if it does,
             # we *do not* crash the worker
@@ -67,6 +77,59 @@ def main() -> None:
             backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
 
 
+def main() -> None:
+    check_memory_budget()
+    log.info(
+        "grading worker starting with %d slot(s), %d cpus and %d MiB per slot",
+        FLS_WORKER_SLOTS,
+        slot_cpus,
+        builder_mem // (1024 * 1024),
+    )
+    if FLS_WORKER_PIPELINE:
+        log.info("pipelining enabled: next submission is staged during builds")
+    log.info(
+        "grading VMs get %d vcpus and %d MiB%s",
+        grader_vm_cpus,
+        grader_vm_mib,
+        " with KVM" if FLS_GRADER_KVM else "",
+    )
+
+    if FLS_METRICS_PORT > 0:
+        start_metrics_server(FLS_METRICS_PORT)
+
+    images.start()
+
+    # before claiming anything new, finish what a previous run left behind
+    resume_jobs(max_workers=FLS_WORKER_SLOTS)
+
+    try:
+        start_builder_pool(FLS_BUILDER_POOL)
+    except Exception:
+        # jobs fall back to starting their own builders
+        log.exception("failed to start builder pool")
+
+    threads = [
+        threading.Thread(
+            target=slot_loop,
+            args=(Slot(index, pipeline=FLS_WORKER_PIPELINE),),
+            name=f"slot-{index}",
+            daemon=True,
+        )
+        for index in range(FLS_WORKER_SLOTS)
+    ]
+    for t in threads:
+        t.start()
+
+    try:
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(timeout=1)
+    except KeyboardInterrupt:
+        log.info("received keyboard interrupt, exiting")
+        cancel_active_jobs()
+        stop_builder_pool()
+
+
 # ------------------------------------------------------------
 # entrypoint
 # ------------------------------------------------------------
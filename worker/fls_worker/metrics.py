@@ -0,0 +1,269 @@
+import http.server
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+log = logging.getLogger("fls-metrics")
+
+# seconds; jobs range from sub-second API calls to 40 minute builds
+TIME_BUCKETS = (
+    0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 2400, 3600,
+)
+RATE_BUCKETS = (1e5, 1e6, 5e6, 1e7, 5e7, 1e8, 5e8, 1e9)
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """
+    A Prometheus histogram, optionally split by labels.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = TIME_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # label values -> (per-bucket counts, sum, count)
+        self._series: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            counts, total, n = self._series.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._series[key] = (counts, total + value, n + 1)
+
+    def totals(self) -> dict[tuple[str, ...], tuple[float, int]]:
+        """
+        Sum and count of the observations, by label values.
+        """
+        with self._lock:
+            return {key: (total, n) for key, (_, total, n) in self._series.items()}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(
+                (key, (list(counts), total, n))
+                for key, (counts, total, n) in self._series.items()
+            )
+        for key, (counts, total, n) in series:
+            for bound, count in zip(self.buckets, counts):
+                le = _labels(self.labelnames, key, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{le} {count}")
+            inf = _labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {n}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+class Counter:
+    """
+    A Prometheus counter, optionally split by labels.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def totals(self) -> dict[tuple[str, ...], float]:
+        """
+        Current values, by label values.
+        """
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+REGISTRY: list[Histogram | Counter] = []
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# ------------------------------------------------------------
+# worker metrics
+# ------------------------------------------------------------
+
+phase_seconds = Histogram(
+    "fls_phase_seconds",
+    "Wall-clock time spent in each phase of grading a submission.",
+    ("phase",),
+)
+claim_seconds = Histogram(
+    "fls_claim_seconds",
+    "Time to claim a submission, including any long-poll wait.",
+    ("result",),
+)
+tarball_bytes = Counter(
+    "fls_tarball_bytes_total",
+    "Bytes of submission tarballs downloaded.",
+)
+tarball_rate = Histogram(
+    "fls_tarball_download_bytes_per_second",
+    "Download throughput of submission tarballs.",
+    buckets=RATE_BUCKETS,
+)
+jobs_total = Counter(
+    "fls_jobs_total",
+    "Jobs finished, by outcome.",
+    ("outcome",),
+)
+
+
+# ------------------------------------------------------------
+# per-job timings
+# ------------------------------------------------------------
+
+
+@dataclass
+class JobTimings:
+    """
+    Phases of one job in the order they finished, for the job log.
+    """
+
+    phases: list[tuple[str, float]] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phases.append((phase, seconds))
+
+    def summary(self) -> str:
+        with self._lock:
+            phases = list(self.phases)
+        if not phases:
+            return ""
+        width = max(len(phase) for phase, _ in phases)
+        lines = ["[fls] timing summary:"]
+        lines += [f"[fls]   {phase:<{width}}  {seconds:9.2f}s" for phase, seconds in phases]
+        return "\n".join(lines) + "\n"
+
+
+def record(phase: str, seconds: float, timings: JobTimings | None = None) -> None:
+    phase_seconds.observe(seconds, phase=phase)
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+@contextmanager
+def timed(phase: str, timings: JobTimings | None = None) -> Iterator[None]:
+    """
+    Record how long the body takes, whether or not it raises.
+    """
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        record(phase, time.monotonic() - started, timings)
+
+
+# build-all-stages.sh and grade.py report their own phases as
+#   [fls-timing] <phase> <seconds>
+# the grader's output includes the student's console, so markers must
+# be whole lines, are limited to the phases those scripts report, and to a
+# few per stream.
+TIMING_MARKER_RE = re.compile(
+    rb"^\[fls-timing\] ("
+    rb"stage\.(?:busybox|kernel|user|image)"
+    rb"|grade\.(?:boot|test\.(?:ls|mount|udevd|dhcpcd|chrony|route|http|time|write|sync|persistence))"
+    rb") ([0-9]{1,6}(?:\.[0-9]{1,9})?)\r?$"
+)
+MAX_MARKERS = 64
+
+# longer lines cannot be markers
+MAX_MARKER_LINE = 4096
+
+
+class TimingMarkers:
+    """
+    Picks timing markers out of container output as it streams by.
+    """
+
+    def __init__(self, timings: JobTimings | None = None):
+        self.timings = timings
+        self._partial = b""
+        self._seen = 0
+
+    def feed(self, chunk: bytes) -> None:
+        lines = (self._partial + chunk).split(b"\n")
+        self._partial = lines.pop()[-MAX_MARKER_LINE:]
+        for line in lines:
+            match = TIMING_MARKER_RE.search(line)
+            if match and self._seen < MAX_MARKERS:
+                self._seen += 1
+                record(match[1].decode(), float(match[2]), self.timings)
+
+
+# ------------------------------------------------------------
+# exposition
+# ------------------------------------------------------------
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(port: int) -> None:
+    """
+    Serve /metrics in the Prometheus text format on port.
+    """
+    server = http.server.ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(
+        target=server.serve_forever,
+        name="metrics",
+        daemon=True,
+    ).start()
+    log.info("serving metrics on port %d", port)
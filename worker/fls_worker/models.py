@@ -25,3 +25,12 @@ class Submission:
                 data["createdAt"].replace("Z", "+00:00")
             ),
         )
+
+    def to_json(self) -> dict:
+        return {
+            "id": self.id,
+            "userId": self.user_id,
+            "tarball": self.tarball,
+            "arch": self.arch,
+            "createdAt": self.created_at.isoformat(),
+        }
@@ -0,0 +1,23 @@
+from pathlib import Path
+
+from .config import FLS_MOUNT_PREFIX
+from .models import Arch
+
+# where the worker keeps its state under FLS_MOUNT_PREFIX. nothing here
+# touches the disk, so any entrypoint may import it.
+
+# one directory per claimed job
+JOBS_DIR = FLS_MOUNT_PREFIX / "jobs"
+
+# host-side directories of builder containers
+BUILDERS_DIR = FLS_MOUNT_PREFIX / "builders"
+
+# what this worker holds, so a restarted worker can finish it
+JOURNAL_PATH = FLS_MOUNT_PREFIX / "journal.db"
+
+STAGE_CACHE_DIR = FLS_MOUNT_PREFIX / "cache" / "stages"
+RESULT_CACHE_DIR = FLS_MOUNT_PREFIX / "cache" / "results"
+
+
+def ccache_dir(arch: Arch) -> Path:
+    return FLS_MOUNT_PREFIX / "cache" / "ccache" / arch
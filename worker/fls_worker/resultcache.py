@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from .stagecache import Manifest, tree_digest
+
+log = logging.getLogger("fls-resultcache")
+
+ENTRY_RESULT = "result.json"
+ENTRY_LOG = "logs.txt"
+ENTRY_REPORT = "report.json"
+
+
+@dataclass(frozen=True)
+class ResultKey:
+    """
+    Identifies a grading result: the submitted tree and everything else
+    that went into building and grading it.
+    """
+
+    digest: str
+    builder_image: str
+    grader_image: str
+
+
+def result_key(
+    manifest: Manifest,
+    *,
+    builder_image: str,
+    grader_image: str,
+    arch: str,
+    scope: str,
+) -> ResultKey:
+    """
+    Compute the key of a submission's result. scope keeps results from
+    being shared between students.
+    """
+    digest = hashlib.sha256(
+        f"{builder_image}\0{grader_image}\0{arch}\0{scope}\0{tree_digest(manifest)}".encode()
+    ).hexdigest()
+    return ResultKey(digest, builder_image, grader_image)
+
+
+@dataclass
+class CachedResult:
+    passed: bool
+    submission_id: int
+    graded_at: float
+    log: bytes
+    report: bytes | None
+
+
+class ResultCache:
+    """
+    Size-bounded, least-recently-used store of grading results, so a
+    resubmission of identical files is not built and graded again.
+
+    Each entry is a directory holding the verdict, the job log and the
+    grader's report. Using an entry bumps its mtime. Entries graded with
+    other builder or grader images than the newest entry are dropped, then
+    the oldest entries are evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _entry(self, key: ResultKey) -> Path:
+        return self.root / key.digest
+
+    def lookup(self, key: ResultKey) -> CachedResult | None:
+        """
+        Returns the result stored under key, or None on a miss.
+        """
+        entry = self._entry(key)
+        with self._lock:
+            try:
+                result = json.loads((entry / ENTRY_RESULT).read_text())
+                log_bytes = (entry / ENTRY_LOG).read_bytes()
+                report = entry / ENTRY_REPORT
+                report_bytes = report.read_bytes() if report.is_file() else None
+                os.utime(entry / ENTRY_RESULT)
+            except FileNotFoundError:
+                return None
+            except (OSError, ValueError):
+                log.warning("dropping unreadable result cache entry %s", entry.name)
+                shutil.rmtree(entry, ignore_errors=True)
+                return None
+
+        return CachedResult(
+            passed=bool(result["passed"]),
+            submission_id=int(result["submissionId"]),
+            graded_at=float(result["gradedAt"]),
+            log=log_bytes,
+            report=report_bytes,
+        )
+
+    def store(
+        self,
+        key: ResultKey,
+        *,
+        submission_id: int,
+        passed: bool,
+        log_path: Path,
+        report_path: Path,
+    ) -> None:
+        """
+        Copy a finished job's verdict, log and report into the cache under
+        key and evict old entries.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / f".{key.digest}.{uuid.uuid4().hex}.tmp"
+        tmp.mkdir()
+        try:
+            shutil.copyfile(log_path, tmp / ENTRY_LOG)
+            if report_path.is_file():
+                shutil.copyfile(report_path, tmp / ENTRY_REPORT)
+            (tmp / ENTRY_RESULT).write_text(
+                json.dumps(
+                    {
+                        "passed": passed,
+                        "submissionId": submission_id,
+                        "gradedAt": time.time(),
+                        "builderImage": key.builder_image,
+                        "graderImage": key.grader_image,
+                    }
+                )
+            )
+
+            with self._lock:
+                entry = self._entry(key)
+                shutil.rmtree(entry, ignore_errors=True)
+                os.replace(tmp, entry)
+                self._evict(key)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _evict(self, newest: ResultKey) -> None:
+        entries = []
+        for p in self.root.iterdir():
+            if p.name.startswith("."):
+                continue
+            try:
+                result = json.loads((p / ENTRY_RESULT).read_text())
+                mtime = (p / ENTRY_RESULT).stat().st_mtime
+                size = sum(f.stat().st_size for f in p.iterdir())
+            except (OSError, ValueError):
+                shutil.rmtree(p, ignore_errors=True)
+                continue
+
+            if (result.get("builderImage"), result.get("graderImage")) != (
+                newest.builder_image,
+                newest.grader_image,
+            ):
+                log.info("dropping result cache entry %s for old images", p.name)
+                shutil.rmtree(p, ignore_errors=True)
+                continue
+            entries.append((mtime, size, p))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            log.info("evicting result cache entry %s", p.name)
+            shutil.rmtree(p, ignore_errors=True)
+            total -= size
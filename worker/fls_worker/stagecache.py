@@ -0,0 +1,203 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+log = logging.getLogger("fls-stagecache")
+
+# build-all-stages.sh runs these in order; each stage's key chains the key of
+# the stage before it, so a stage is only reused on top of identical inputs.
+STAGES = ("busybox", "kernel", "user", "image")
+
+HASH_CHUNK = 1024 * 1024
+
+# version of what build-all-stages.sh puts in a stage archive. it feeds into
+# every key, so archives in an older layout are never restored.
+ARCHIVE_FORMAT = 2
+
+# (mode, sha256 of contents) per relative path; directories hash to "".
+Manifest = dict[str, tuple[int, str]]
+
+
+def tree_manifest(root: Path) -> Manifest:
+    """
+    Describe every directory and regular file under root.
+
+    root must only contain directories and regular files, which is what
+    safe_extract_tar produces.
+    """
+    manifest: Manifest = {}
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        base = Path(dirpath)
+        for d in dirnames:
+            p = base / d
+            manifest[p.relative_to(root).as_posix()] = (p.stat().st_mode & 0o777, "")
+        for f in sorted(filenames):
+            p = base / f
+            h = hashlib.sha256()
+            with p.open("rb") as fh:
+                while chunk := fh.read(HASH_CHUNK):
+                    h.update(chunk)
+            manifest[p.relative_to(root).as_posix()] = (
+                p.stat().st_mode & 0o777,
+                h.hexdigest(),
+            )
+
+    return manifest
+
+
+def _digest(manifest: Manifest, paths) -> str:
+    h = hashlib.sha256()
+    for path in sorted(paths):
+        mode, content = manifest[path]
+        h.update(f"{path}\0{mode:o}\0{content}\n".encode())
+    return h.hexdigest()
+
+
+def tree_digest(manifest: Manifest) -> str:
+    """
+    Digest of the whole tree described by manifest.
+    """
+    return _digest(manifest, manifest)
+
+
+def stage_keys(
+    manifest: Manifest,
+    *,
+    builder_image: str,
+    arch: str,
+    scope: str,
+) -> dict[str, str]:
+    """
+    Compute the cache key of every stage.
+
+    Files outside the stage directories may be used by any stage, so they
+    feed into every key. scope keeps entries from being shared between
+    students.
+    """
+    by_stage: dict[str, list[str]] = {stage: [] for stage in STAGES}
+    shared: list[str] = []
+    for path in manifest:
+        top = path.split("/", 1)[0]
+        if top in by_stage:
+            by_stage[top].append(path)
+        else:
+            shared.append(path)
+
+    prev = hashlib.sha256(
+        f"{ARCHIVE_FORMAT}\0{builder_image}\0{arch}\0{scope}\0{_digest(manifest, shared)}".encode()
+    ).hexdigest()
+
+    keys: dict[str, str] = {}
+    for stage in STAGES:
+        prev = hashlib.sha256(
+            f"{prev}\0{stage}\0{_digest(manifest, by_stage[stage])}".encode()
+        ).hexdigest()
+        keys[stage] = prev
+    return keys
+
+
+class StageCache:
+    """
+    Size-bounded, least-recently-used store of stage output archives.
+
+    Entries are <key>.tar files produced by build-all-stages.sh. Using an
+    entry bumps its mtime, and the oldest entries are evicted once the cache
+    grows past max_bytes.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _entry(self, key: str) -> Path:
+        return self.root / f"{key}.tar"
+
+    def link(self, key: str, dest: Path) -> bool:
+        """
+        Hardlink (or copy) the entry for key to dest. Returns False on a miss.
+        """
+        entry = self._entry(key)
+        with self._lock:
+            if not entry.is_file():
+                return False
+            os.utime(entry)
+            try:
+                os.link(entry, dest)
+            except OSError:
+                shutil.copyfile(entry, dest)
+        return True
+
+    def store(self, key: str, src: Path) -> None:
+        """
+        Move src into the cache under key and evict old entries.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / f".{key}.tmp"
+        shutil.move(src, tmp)
+        with self._lock:
+            os.replace(tmp, self._entry(key))
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for p in self.root.glob("*.tar"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            log.info("evicting stage cache entry %s", p.name)
+            p.unlink(missing_ok=True)
+            total -= size
+
+
+class StageCacheSession:
+    """
+    Stage cache lookups and stores for a single job.
+
+    prepare() links every hit for the submission described by a manifest into
+    the directory the builder mounts at /stage-cache; store() files away the
+    stages that had to be rebuilt.
+    """
+
+    def __init__(self, cache: StageCache, *, work_dir: Path, arch: str, scope: str):
+        self.cache = cache
+        self.exports_dir = work_dir / "exports"
+        self.arch = arch
+        self.scope = scope
+        self.keys: dict[str, str] = {}
+        self.hits: list[str] = []
+
+    @property
+    def misses(self) -> list[str]:
+        return [stage for stage in STAGES if stage not in self.hits]
+
+    def prepare(self, manifest: Manifest, *, builder_image: str, hits_dir: Path) -> None:
+        self.exports_dir.mkdir(parents=True, exist_ok=True)
+
+        self.keys = stage_keys(
+            manifest,
+            builder_image=builder_image,
+            arch=self.arch,
+            scope=self.scope,
+        )
+        self.hits = [
+            stage
+            for stage in STAGES
+            if self.cache.link(self.keys[stage], hits_dir / f"{stage}.tar")
+        ]
+        log.info("stage cache hits: %s", ", ".join(self.hits) or "none")
+
+    def store(self, stage: str, archive: Path) -> None:
+        self.cache.store(self.keys[stage], archive)
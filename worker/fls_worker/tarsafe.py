@@ -0,0 +1,333 @@
+import bz2
+import gzip
+import hashlib
+import lzma
+import posixpath
+import shutil
+import tarfile
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Iterator
+
+from .config import FLS_TAR_MAX_BYTES, FLS_TAR_MAX_FILE_BYTES, FLS_TAR_MAX_FILES
+from .errors import FLSSubmissionRejected
+from .stagecache import Manifest
+
+COPY_CHUNK = 1024 * 1024
+
+# tar headers and padding on top of file contents: at most 1.5KiB per member
+# (header + pax header + padding), plus the end-of-archive blocks.
+TAR_OVERHEAD_PER_MEMBER = 1536
+TAR_OVERHEAD = 64 * 1024
+
+
+@dataclass(frozen=True)
+class TarLimits:
+    """
+    Decompression budget for a submission tarball.
+    """
+
+    max_total_bytes: int = FLS_TAR_MAX_BYTES
+    max_files: int = FLS_TAR_MAX_FILES
+    max_file_bytes: int = FLS_TAR_MAX_FILE_BYTES
+
+    @property
+    def max_stream_bytes(self) -> int:
+        return (
+            self.max_total_bytes
+            + self.max_files * TAR_OVERHEAD_PER_MEMBER
+            + TAR_OVERHEAD
+        )
+
+
+class _LimitedReader:
+    """
+    Read-only file wrapper that refuses to read past limit bytes, so that
+    not even tar headers can blow past the decompression budget.
+    """
+
+    def __init__(self, f: IO[bytes], limit: int):
+        self.f = f
+        self.limit = limit
+        self.consumed = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.limit - self.consumed + 1:
+            size = self.limit - self.consumed + 1
+        data = self.f.read(size)
+        self.consumed += len(data)
+        if self.consumed > self.limit:
+            raise FLSSubmissionRejected(
+                f"tarball expands to more than {self.limit} bytes"
+            )
+        return data
+
+
+class _Prefixed:
+    """
+    Puts bytes already read from a non-seekable stream back in front of it.
+    """
+
+    def __init__(self, prefix: bytes, f: IO[bytes]):
+        self.prefix = prefix
+        self.f = f
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.prefix:
+            return self.f.read(size)
+        if size < 0:
+            data, self.prefix = self.prefix + self.f.read(), b""
+            return data
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        return data
+
+
+def _decompressed(f: IO[bytes]) -> IO[bytes]:
+    magic = f.read(6)
+    if f.seekable():
+        f.seek(0)
+    else:
+        f = _Prefixed(magic, f)  # type: ignore[assignment]
+    if magic.startswith(b"\x1f\x8b"):
+        return gzip.GzipFile(fileobj=f)
+    if magic.startswith(b"BZh"):
+        return bz2.BZ2File(f)
+    if magic.startswith(b"\xfd7zXZ\x00"):
+        return lzma.LZMAFile(f)
+    return f
+
+
+# errors that mean the tarball itself is broken, not the worker
+CORRUPT_TAR_ERRORS = (
+    tarfile.TarError,
+    EOFError,
+    zlib.error,
+    lzma.LZMAError,
+    gzip.BadGzipFile,
+)
+
+
+class _MemberReader:
+    """
+    Contents of one tar member; decompression errors surface while the
+    caller reads, so they are translated here.
+    """
+
+    def __init__(self, f: IO[bytes]):
+        self.f = f
+
+    def read(self, size: int = -1) -> bytes:
+        try:
+            return self.f.read(size)
+        except CORRUPT_TAR_ERRORS as e:
+            raise FLSSubmissionRejected(f"corrupt tarball: {e}") from e
+
+
+class _HashingReader:
+    def __init__(self, f: IO[bytes]):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        self.sha256.update(data)
+        return data
+
+
+def check_member_name(name: str) -> None:
+    # no absolute paths
+    if name.startswith("/") or name.startswith("\\"):
+        raise FLSSubmissionRejected(f"absolute path in tar: {name}")
+
+    # no path traversal
+    if ".." in name.replace("\\", "/").split("/"):
+        raise FLSSubmissionRejected(f"path traversal in tar: {name}")
+
+
+def _check_tree_conflict(kinds: dict[str, bool], name: str, is_dir: bool) -> None:
+    """
+    Reject a member that tar could not create next to the earlier ones: a
+    file below a file, or a file and a directory under the same name.
+    kinds maps each normalized path seen so far to whether it is a directory.
+    """
+    name = posixpath.normpath(name)
+    if name == ".":
+        return
+
+    parent = posixpath.dirname(name)
+    while parent:
+        if kinds.get(parent) is False:
+            raise FLSSubmissionRejected(f"{name} is inside the file {parent}")
+        kinds[parent] = True
+        parent = posixpath.dirname(parent)
+
+    if kinds.get(name, is_dir) != is_dir:
+        raise FLSSubmissionRejected(f"{name} is both a file and a directory")
+    kinds[name] = is_dir
+
+
+def iter_members(
+    fileobj: IO[bytes],
+    limits: TarLimits,
+) -> Iterator[tuple[tarfile.TarInfo, IO[bytes] | None]]:
+    """
+    Lazily walk a (possibly compressed) tar stream, enforcing limits.
+
+    Yields each directory with None, and each regular file with a reader of
+    its contents that must be consumed before advancing. Anything else, any
+    archive exceeding limits, and any path that conflicts with an earlier
+    member raises FLSSubmissionRejected.
+    """
+    budget = _LimitedReader(_decompressed(fileobj), limits.max_stream_bytes)
+    count = 0
+    total = 0
+    kinds: dict[str, bool] = {}
+
+    try:
+        with tarfile.open(fileobj=budget, mode="r|") as tar:  # type: ignore[arg-type]
+            for member in tar:
+                name = member.name
+
+                count += 1
+                if count > limits.max_files:
+                    raise FLSSubmissionRejected(
+                        f"tarball has more than {limits.max_files} entries"
+                    )
+
+                check_member_name(name)
+
+                # directories
+                if member.isdir():
+                    _check_tree_conflict(kinds, name, True)
+                    yield member, None
+                    continue
+
+                # regular files ONLY (no links)
+                if member.isreg():
+                    if member.linkname:
+                        raise FLSSubmissionRejected(f"hardlink disallowed: {name}")
+
+                    if member.size > limits.max_file_bytes:
+                        raise FLSSubmissionRejected(
+                            f"{name} is larger than {limits.max_file_bytes} bytes"
+                        )
+
+                    total += member.size
+                    if total > limits.max_total_bytes:
+                        raise FLSSubmissionRejected(
+                            f"tarball contents exceed {limits.max_total_bytes} bytes"
+                        )
+
+                    _check_tree_conflict(kinds, name, False)
+
+                    src = tar.extractfile(member)
+                    if src is None:
+                        raise FLSSubmissionRejected(f"failed to extract file: {name}")
+
+                    with src:
+                        yield member, _MemberReader(src)  # type: ignore[misc]
+                    continue
+
+                # everything else is forbidden
+                raise FLSSubmissionRejected(f"disallowed tar entry type: {name}")
+    except CORRUPT_TAR_ERRORS as e:
+        raise FLSSubmissionRejected(f"corrupt tarball: {e}") from e
+
+
+def safe_extract_tar(
+    tar_path: Path,
+    dest: Path,
+    limits: TarLimits = TarLimits(),
+) -> None:
+    """
+    Safely extract a tar.gz (or tar.*) archive.
+
+    Members are streamed one at a time and copied in fixed-size chunks, so
+    memory use does not depend on the archive. limits bounds the total
+    decompressed size, the number of entries and the size of each file.
+
+    Allowed:
+      - directories
+      - regular files (no links)
+
+    Disallowed:
+      - symlinks
+      - hardlinks
+      - device files
+      - absolute paths
+      - path traversal
+    """
+    dest = dest.resolve()
+
+    with open(tar_path, "rb") as f:
+        for member, src in iter_members(f, limits):
+            target = (dest / member.name).resolve()
+            if not target.is_relative_to(dest):
+                raise FLSSubmissionRejected(f"path traversal in tar: {member.name}")
+
+            if src is None:
+                target.mkdir(parents=True, exist_ok=True)
+                target.chmod(0o755)
+                continue
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK)
+            target.chmod(member.mode & 0o777)
+
+
+def copy_sanitized(
+    fileobj: IO[bytes],
+    out: IO[bytes],
+    limits: TarLimits = TarLimits(),
+) -> Manifest:
+    """
+    Re-emit a submission tarball as a plain tar stream that holds only what
+    safe_extract_tar would have extracted: directories and regular files
+    with normalized names, permission bits only and no ownership. Missing
+    parent directories are added explicitly.
+
+    Nothing is written to disk. Returns the manifest of the resulting tree,
+    as tree_manifest would compute it after extraction.
+    """
+    manifest: Manifest = {}
+
+    def add_dir(tar: tarfile.TarFile, name: str, mode: int) -> None:
+        info = tarfile.TarInfo(name)
+        info.type = tarfile.DIRTYPE
+        info.mode = mode
+        tar.addfile(info)
+        manifest[name] = (mode, "")
+
+    def add_parents(tar: tarfile.TarFile, name: str) -> None:
+        parent = posixpath.dirname(name)
+        if parent and parent not in manifest:
+            add_parents(tar, parent)
+            add_dir(tar, parent, 0o755)
+
+    with tarfile.open(
+        fileobj=out,  # type: ignore[arg-type]
+        mode="w|",
+        format=tarfile.PAX_FORMAT,
+        bufsize=COPY_CHUNK,
+    ) as tar:
+        for member, src in iter_members(fileobj, limits):
+            name = posixpath.normpath(member.name)
+            if name == ".":
+                continue
+            add_parents(tar, name)
+
+            if src is None:
+                add_dir(tar, name, 0o755)
+                continue
+
+            info = tarfile.TarInfo(name)
+            info.mode = member.mode & 0o777
+            info.size = member.size
+            info.mtime = member.mtime
+            hashing = _HashingReader(src)
+            tar.addfile(info, hashing)  # type: ignore[arg-type]
+            manifest[name] = (info.mode, hashing.sha256.hexdigest())
+
+    return manifest
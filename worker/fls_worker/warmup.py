@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+import shutil
+import uuid
+from pathlib import Path
+
+from .arch import detect_arch
+from .config import FLS_MOUNT_PREFIX
+from .dockerclient import DockerClient
+from .paths import ccache_dir
+from .tarsafe import safe_extract_tar
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+)
+
+log = logging.getLogger("fls-warmup")
+
+
+def main() -> None:
+    """
+    Populate this host's compiler cache from a trusted build.
+
+    Student builds only ever mount the cache read-only, so the only way
+    objects get into it is through this command, run by staff against a
+    known-good submission (e.g. the reference solution).
+    """
+    parser = argparse.ArgumentParser(
+        description="warm the compiler cache with a trusted submission",
+    )
+    parser.add_argument("tarball", type=Path, help="trusted submission tarball")
+    args = parser.parse_args()
+
+    arch = detect_arch()
+    base_dir = FLS_MOUNT_PREFIX / "warmup" / str(uuid.uuid4())
+    src_dir = base_dir / "src"
+    out_dir = base_dir / "out"
+    log_path = base_dir / "logs.txt"
+
+    try:
+        src_dir.mkdir(parents=True)
+        safe_extract_tar(args.tarball, src_dir)
+
+        docker = DockerClient(log_path=log_path)
+        builder = docker.create_builder(
+            base_dir=base_dir / "builder",
+            ccache_dir=ccache_dir(arch),
+            ccache_writable=True,
+        )
+        docker.run_builder(
+            builder=builder,
+            workspace_dir=src_dir,
+            output_dir=out_dir,
+        )
+        log.info("warm-up build succeeded")
+    finally:
+        if log_path.exists():
+            print(log_path.read_text(errors="replace")[-4000:])
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
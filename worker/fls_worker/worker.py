@@ -1,21 +1,36 @@
 #!/usr/bin/env python3
 import logging
 import shutil
-import signal
-import tarfile
 import threading
+import time
 import traceback
 import uuid
-from multiprocessing import Process
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Callable
 
 from .apiclient import FLSClient
 from .arch import detect_arch
-from .config import FLS_MOUNT_PREFIX
-from .dockerclient import DockerClient
-from .errors import FLSAlreadyClaimedError, FLSAPIError
+from .builderpool import BuilderPool
+from .config import (FLS_CCACHE, FLS_LONG_POLL_SECONDS, FLS_RESULT_CACHE_BYTES,
+                     FLS_STAGE_CACHE_BYTES, FLS_STREAM_SUBMISSIONS)
+from .dockerclient import REPORT_NAME, Builder, DockerClient
+from .errors import (FLSAlreadyClaimedError, FLSAPIError, FLSConflictError,
+                     FLSNotFoundError, FLSSubmissionRejected)
+from .heartbeat import heartbeats
+from .images import images
 from .infraerrors import INFRA_EXCEPTIONS
-from .models import Arch
+from .journal import BUILT, CLAIMED, GRADED, STAGED, JobJournal, JournalEntry
+from .livelog import live_logs
+from .metrics import (JobTimings, claim_seconds, jobs_total, record, tarball_bytes,
+                      tarball_rate, timed)
+from .models import Arch, Submission
+from .paths import (BUILDERS_DIR, JOBS_DIR, JOURNAL_PATH, RESULT_CACHE_DIR, STAGE_CACHE_DIR,
+                    ccache_dir)
+from .resultcache import CachedResult, ResultCache, ResultKey, result_key
+from .stagecache import Manifest, StageCache, StageCacheSession, tree_manifest
+from .tarsafe import safe_extract_tar
 
 # ------------------------------------------------------------
 # logging
@@ -23,174 +38,509 @@ from .models import Arch
 
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    format="%(asctime)s [%(levelname)s] [%(threadName)s] %(name)s: %(message)s",
 )
 
 log = logging.getLogger("fls-grade")
 
 # ------------------------------------------------------------
-# heartbeat
+# build caches
 # ------------------------------------------------------------
 
+stage_cache = (
+    StageCache(STAGE_CACHE_DIR, FLS_STAGE_CACHE_BYTES)
+    if FLS_STAGE_CACHE_BYTES > 0
+    else None
+)
 
-def grading_heartbeat(interval=20):
-    api = FLSClient()
-    stop = threading.Event()
+result_cache = (
+    ResultCache(RESULT_CACHE_DIR, FLS_RESULT_CACHE_BYTES)
+    if FLS_RESULT_CACHE_BYTES > 0
+    else None
+)
 
-    def _sigterm(_signo, _frame):
-        stop.set()
 
-    signal.signal(signal.SIGTERM, _sigterm)
+# ------------------------------------------------------------
+# job journal
+# ------------------------------------------------------------
 
-    while not stop.is_set():
-        try:
-            api.grading_heartbeat()
-        except Exception:
-            pass
-        stop.wait(interval)
+# what this worker holds, so a restarted worker can finish it. the database
+# is only created once the journal is first used.
+journal = JobJournal(JOURNAL_PATH)
 
 
 # ------------------------------------------------------------
-# safe tar extraction
+# builders
 # ------------------------------------------------------------
 
+# how jobs talk to docker; the benchmark swaps in fake containers.
+docker_client_factory: Callable[..., DockerClient] = DockerClient
 
-def safe_extract_tar(tar_path: Path, dest: Path) -> None:
+builder_pool: BuilderPool | None = None
+
+
+def create_builder(docker: DockerClient) -> Builder:
+    return docker.create_builder(
+        base_dir=BUILDERS_DIR / str(uuid.uuid4()),
+        stage_cache=stage_cache is not None,
+        ccache_dir=ccache_dir(detect_arch()) if FLS_CCACHE else None,
+        streamed=FLS_STREAM_SUBMISSIONS,
+    )
+
+
+def start_builder_pool(size: int) -> None:
+    """
+    Keep size builders started and staged ahead of time. Anything left over
+    from a previous run of the worker is removed first. With size 0 there is
+    no pool, and each job creates its builder itself, so that starting and
+    staging it shows up in the job's log.
     """
-    Safely extract a tar.gz (or tar.*) archive.
+    global builder_pool
 
-    Allowed:
-      - directories
-      - regular files (no links)
+    shutil.rmtree(BUILDERS_DIR, ignore_errors=True)
+    BUILDERS_DIR.mkdir(parents=True)
 
-    Disallowed:
-      - symlinks
-      - hardlinks
-      - device files
-      - absolute paths
-      - path traversal
+    docker = docker_client_factory(log_path=BUILDERS_DIR / "staging.log")
+    docker.remove_stale_builders()
+
+    if size <= 0:
+        return
+
+    builder_pool = BuilderPool(
+        size,
+        create=lambda: create_builder(docker),
+        destroy=docker.destroy_builder,
+        is_stale=lambda b: b.image.id != images.builder().id,
+    )
+    builder_pool.start()
+
+
+def stop_builder_pool() -> None:
+    if builder_pool is not None:
+        builder_pool.close()
+
+# ------------------------------------------------------------
+# jobs
+# ------------------------------------------------------------
+
+
+@dataclass
+class Job:
+    """
+    A claimed submission and everything the worker keeps on disk for it.
     """
-    dest = dest.resolve()
 
-    with tarfile.open(tar_path, "r:*") as tar:
-        for member in tar.getmembers():
-            name = member.name
+    submission: Submission
+    slot: int
+    base_dir: Path
+    staged: bool = False
+    # staging may happen in a prefetch thread; failures are replayed when
+    # the job is executed so they are classified like any other failure.
+    stage_error: BaseException | None = None
+    timings: JobTimings = field(default_factory=JobTimings)
 
-            # no absolute paths
-            if name.startswith("/") or name.startswith("\\"):
-                raise Exception(f"absolute path in tar: {name}")
+    @property
+    def tar_path(self) -> Path:
+        return self.base_dir / "tarball" / "submission.tar"
 
-            # no path traversal
-            target = (dest / name).resolve()
-            if not target.is_relative_to(dest):
-                raise Exception(f"path traversal in tar: {name}")
+    @property
+    def src_dir(self) -> Path:
+        return self.base_dir / "src"
 
-            # directories
-            if member.isdir():
-                target.mkdir(parents=True, exist_ok=True)
-                target.chmod(0o755)
-                continue
+    @property
+    def out_dir(self) -> Path:
+        return self.base_dir / "out"
 
-            # regular files ONLY (no links)
-            if member.isreg():
-                if member.linkname:
-                    raise Exception(f"hardlink disallowed: {name}")
+    @property
+    def report_path(self) -> Path:
+        return self.out_dir / REPORT_NAME
 
-                target.parent.mkdir(parents=True, exist_ok=True)
+    @property
+    def log_path(self) -> Path:
+        return self.base_dir / "logs.txt"
 
-                src = tar.extractfile(member)
-                if src is None:
-                    raise Exception(f"failed to extract file: {name}")
+    @property
+    def stage_cache_dir(self) -> Path:
+        return self.base_dir / "stages"
 
-                with src, open(target, "wb") as dst:
-                    dst.write(src.read())
 
-                target.chmod(member.mode & 0o777)
-                continue
+# claimed jobs that have not been finished yet, so they can be handed back
+# to the server if the worker is interrupted.
+_active_lock = threading.Lock()
+_active_jobs: dict[int, Job] = {}
 
-            # everything else is forbidden
-            raise RuntimeError(f"disallowed tar entry type: {name}")
 
+def active_job_count() -> int:
+    """
+    Number of claimed jobs that have not been cleaned up yet.
+    """
+    with _active_lock:
+        return len(_active_jobs)
 
-# ------------------------------------------------------------
-# main grading pass
-# ------------------------------------------------------------
 
+# cleared the first time the server turns out not to support these
+claim_next_supported = True
+long_poll_supported = FLS_LONG_POLL_SECONDS > 0
 
-def run_once() -> None:
-    client = FLSClient()
 
-    # we do not know the arch at startup; workers are arch-pinned
-    arch: Arch = detect_arch()
+def _list_and_claim(client: FLSClient, arch: Arch, wait: bool) -> Submission | None:
+    """
+    Fallback for servers without claim-next: list, then race to claim the
+    first submission.
+    """
+    global long_poll_supported
 
-    try:
+    submissions = None
+    if wait and long_poll_supported:
+        try:
+            submissions = client.wait_submissions(arch, FLS_LONG_POLL_SECONDS)
+        except FLSNotFoundError:
+            log.warning("server does not support long polling; polling instead")
+            long_poll_supported = False
+    if submissions is None:
         submissions = client.list_submissions(arch)
-    except Exception as e:
-        # infra failure → abort immediately
-        log.exception("failed to list submissions")
-        return
 
     if not submissions:
-        log.info("no submissions available")
-        return
+        return None
 
     submission = submissions[0]
 
     try:
         client.claim_submission(submission)
-    except FLSAlreadyClaimedError:
+    except (FLSAlreadyClaimedError, FLSConflictError):
         log.info("submission %s already claimed", submission.id)
-        return
+        return None
+
+    return submission
+
+
+def _claim(client: FLSClient, arch: Arch, wait: bool) -> Submission | None:
+    global claim_next_supported
+
+    if claim_next_supported:
+        try:
+            return client.claim_next(
+                arch,
+                wait=FLS_LONG_POLL_SECONDS if wait else 0,
+            )
+        except FLSNotFoundError:
+            log.warning("server does not support claim-next; listing instead")
+            claim_next_supported = False
+
+    return _list_and_claim(client, arch, wait)
+
+
+def claim_job(client: FLSClient, slot: int, wait: bool = False) -> Job | None:
+    """
+    Claim the oldest waiting submission. With wait set, block on the server
+    for up to FLS_LONG_POLL_SECONDS until one shows up.
+    """
+    # we do not know the arch at startup; workers are arch-pinned
+    arch: Arch = detect_arch()
+
+    started = time.monotonic()
+    try:
+        submission = _claim(client, arch, wait and FLS_LONG_POLL_SECONDS > 0)
     except Exception:
+        # infra failure → abort immediately
         log.exception("failed to claim submission")
-        return
+        claim_seconds.observe(time.monotonic() - started, result="error")
+        return None
+
+    claimed_in = time.monotonic() - started
+    claim_seconds.observe(claimed_in, result="empty" if submission is None else "claimed")
+
+    if submission is None:
+        log.info("no submissions available")
+        return None
 
-    log.info("claimed submission %s by user %s", submission.id, submission.user_id)
+    log.info(
+        "slot %d claimed submission %s by user %s",
+        slot,
+        submission.id,
+        submission.user_id,
+    )
 
     # all filesystem work happens under FLS_MOUNT_PREFIX
-    base_dir = FLS_MOUNT_PREFIX / "jobs" / str(uuid.uuid4())
-    tar_dir = base_dir / "tarball"
-    src_dir = base_dir / "src"
-    out_dir = base_dir / "out"
+    job = Job(
+        submission=submission,
+        slot=slot,
+        base_dir=JOBS_DIR / str(uuid.uuid4()),
+    )
+    job.timings.add("claim", claimed_in)
+    journal.claimed(submission, slot=slot, base_dir=job.base_dir)
+    heartbeats.register(submission.id, log_path=job.log_path, stage="claimed")
+    live_logs.register(submission.id, log_path=job.log_path)
+    with _active_lock:
+        _active_jobs[submission.id] = job
+    return job
+
+
+def stage_job(client: FLSClient, job: Job) -> None:
+    """
+    Download and extract the submission. Never raises; errors are kept on
+    the job and re-raised by execute_job.
+
+    With FLS_STREAM_SUBMISSIONS the submission is downloaded straight into
+    the builder later, so only the job directory is set up.
+    """
+    heartbeats.set_stage(job.submission.id, "staging")
+    try:
+        try:
+            job.base_dir.mkdir(parents=True)
+            job.out_dir.mkdir()
+            if not FLS_STREAM_SUBMISSIONS:
+                job.tar_path.parent.mkdir()
+                job.src_dir.mkdir()
+        except Exception as e:
+            log.exception("Infrastructure setup failed (FS)")
+            raise FLSAPIError("Local infrastructure failure") from e
+
+        # download and extract
+        if not FLS_STREAM_SUBMISSIONS:
+            started = time.monotonic()
+            client.download_tarball(job.submission, job.tar_path)
+            elapsed = time.monotonic() - started
+            record("download", elapsed, job.timings)
+
+            size = job.tar_path.stat().st_size
+            tarball_bytes.inc(size)
+            if elapsed > 0:
+                tarball_rate.observe(size / elapsed)
+
+            with timed("extract", job.timings):
+                safe_extract_tar(job.tar_path, job.src_dir)
+        job.staged = True
+        journal.advance(job.submission.id, STAGED)
+        heartbeats.set_stage(job.submission.id, "staged")
+    except BaseException as e:
+        job.stage_error = e
+
+
+def write_timings(job: Job) -> None:
+    """
+    Append how long each phase of the job took to its log.
+    """
+    summary = job.timings.summary()
+    if not summary:
+        return
+    try:
+        with job.log_path.open("a", encoding="utf-8") as f:
+            f.write("\n" + summary)
+    except OSError:
+        log.warning("failed to write timing summary", exc_info=True)
+
+
+def lookup_result(
+    cache: ResultCache, job: Job, manifest: Manifest
+) -> tuple[ResultKey, CachedResult | None]:
+    submission = job.submission
+    with timed("result_cache_lookup", job.timings):
+        key = result_key(
+            manifest,
+            builder_image=images.builder().id,
+            grader_image=images.grader().id,
+            arch=submission.arch,
+            # never share results between students
+            scope=submission.user_id,
+        )
+        return key, cache.lookup(key)
+
+
+def cache_result(job: Job, key: ResultKey | None) -> None:
+    """
+    Keep a passing job's result for identical resubmissions, unless the
+    images moved while it was running. Failures are never kept: a timeout or
+    an out-of-memory kill under load says nothing about the files.
+    """
+    if result_cache is None or key is None:
+        return
+    if (key.builder_image, key.grader_image) != (images.builder().id, images.grader().id):
+        return
+    try:
+        result_cache.store(
+            key,
+            submission_id=job.submission.id,
+            passed=True,
+            log_path=job.log_path,
+            report_path=job.report_path,
+        )
+    except OSError:
+        log.warning("failed to cache the result", exc_info=True)
+
+
+def write_cached_result(job: Job, cached: CachedResult) -> None:
+    graded_at = time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime(cached.graded_at))
+    with job.log_path.open("ab") as f:
+        f.write(
+            f"[fls] cached result: submission {cached.submission_id} had identical "
+            f"files and was graded at {graded_at} with the same builder and grader "
+            f"images, so this submission was not built again. Its log follows.\n"
+            f"\n=== cached log of submission {cached.submission_id} ===\n".encode()
+        )
+        f.write(cached.log)
+        f.write(
+            f"\n=== end of cached log of submission {cached.submission_id} ===\n".encode()
+        )
+    if cached.report is not None:
+        job.report_path.write_bytes(cached.report)
 
-    log_path = base_dir / "logs.txt"
 
-    hb_proc = Process(
-        target=grading_heartbeat,
-        daemon=True,
+def submit_cached_result(client: FLSClient, job: Job, cached: CachedResult) -> None:
+    submission = job.submission
+    log.info(
+        "submission %s is identical to submission %s; reusing its result",
+        submission.id,
+        cached.submission_id,
     )
+    write_cached_result(job, cached)
+    write_timings(job)
+    heartbeats.set_stage(submission.id, "submitting")
+    journal.advance(submission.id, GRADED, passed=cached.passed)
+    with timed("submit"):
+        client.submit_result(
+            submission,
+            passed=cached.passed,
+            log_path=job.log_path,
+            report_path=job.report_path,
+        )
+    jobs_total.inc(outcome="cached")
+
 
-    hb_proc.start()
+def finish_job(job: Job) -> None:
+    with _active_lock:
+        _active_jobs.pop(job.submission.id, None)
 
+    heartbeats.unregister(job.submission.id)
+    live_logs.unregister(job.submission.id)
+    journal.forget(job.submission.id)
+    # best-effort cleanup
     try:
-        tar_path = tar_dir / "submission.tar"
+        shutil.rmtree(job.base_dir)
+    except Exception:
+        log.warning("failed to clean up %s", job.base_dir)
+
+
+def cancel_active_jobs() -> None:
+    """
+    Hand every unfinished job back to the server. Used on shutdown.
+    """
+    with _active_lock:
+        jobs = list(_active_jobs.values())
+
+    if not jobs:
+        return
+
+    client = FLSClient()
+    for job in jobs:
+        log.info("cancelling submission %s on shutdown", job.submission.id)
+        try:
+            client.cancel_submission(job.submission)
+            journal.forget(job.submission.id)
+        except Exception:
+            log.exception("failed to cancel submission %s", job.submission.id)
+
+
+def execute_job(
+    client: FLSClient,
+    job: Job,
+    on_build_start: Callable[[], None] | None = None,
+) -> None:
+    """
+    Build, grade and report a claimed job, then clean it up.
+
+    on_build_start is called once the job is staged, right before the
+    builder container starts.
+    """
+    submission = job.submission
+    log_path = job.log_path
+    cache_key = None
+
+    try:
+        if not job.staged and job.stage_error is None:
+            stage_job(client, job)
+        if job.stage_error is not None:
+            raise job.stage_error
+
+        # ----------------------------------------------------
+        # identical resubmissions
+        # ----------------------------------------------------
+
+        # streamed submissions are only seen as they go into the builder,
+        # so they are looked up there instead of being downloaded twice
+        cached = None
+        if result_cache is not None and not FLS_STREAM_SUBMISSIONS:
+            cache_key, cached = lookup_result(result_cache, job, tree_manifest(job.src_dir))
+            if cached is not None:
+                submit_cached_result(client, job, cached)
+                return
+
+        def check_result_cache(manifest: Manifest) -> bool:
+            nonlocal cache_key, cached
+            assert result_cache is not None
+            cache_key, cached = lookup_result(result_cache, job, manifest)
+            return cached is None
+
         try:
-            tar_dir.mkdir(parents=True)
-            src_dir.mkdir()
-            out_dir.mkdir()
             # If Docker is down, this is an infra error
-            docker = DockerClient(log_path=log_path)
+            docker = docker_client_factory(log_path=log_path, timings=job.timings)
 
         except Exception as e:
-            log.exception("Infrastructure setup failed (FS or Docker)")
+            log.exception("Infrastructure setup failed (Docker)")
             raise FLSAPIError("Local infrastructure failure") from e
 
-        # download and extract
-        client.download_tarball(submission, tar_path)
-        safe_extract_tar(tar_path, src_dir)
-
         # ----------------------------------------------------
         # run builder + grader
         # ----------------------------------------------------
 
         passed = False
 
-        try:
-            bootable = docker.run_builder(
-                workspace_dir=src_dir,
-                output_dir=out_dir,
+        if on_build_start is not None:
+            on_build_start()
+
+        session = None
+        if stage_cache is not None:
+            session = StageCacheSession(
+                stage_cache,
+                work_dir=job.stage_cache_dir,
+                arch=submission.arch,
+                # never share build outputs between students
+                scope=submission.user_id,
             )
 
+        try:
+            heartbeats.set_stage(submission.id, "building")
+            with timed("builder_acquire", job.timings):
+                if builder_pool is not None:
+                    builder = builder_pool.acquire()
+                else:
+                    builder = create_builder(docker)
+            if cache_key is not None and builder.image.id != cache_key.builder_image:
+                # a pooled builder from before the image moved
+                cache_key = None
+
+            try:
+                bootable = docker.run_builder(
+                    builder=builder,
+                    output_dir=job.out_dir,
+                    workspace_dir=None if builder.streamed else job.src_dir,
+                    open_tarball=lambda: client.open_tarball(submission),
+                    stage_cache=session,
+                    check_workspace=(
+                        check_result_cache
+                        if result_cache is not None and FLS_STREAM_SUBMISSIONS
+                        else None
+                    ),
+                )
+            finally:
+                if builder_pool is not None:
+                    builder_pool.release(builder)
+            if cached is not None:
+                submit_cached_result(client, job, cached)
+                return
+            journal.advance(submission.id, BUILT)
+
+            heartbeats.set_stage(submission.id, "grading")
             docker.run_grader(bootable_img=bootable)
             passed = True
 
@@ -204,20 +554,48 @@ def run_once() -> None:
         # ----------------------------------------------------
         # submit result
         # ----------------------------------------------------
-        client.submit_result(
-            submission,
-            passed=passed,
-            log_path=log_path,
-        )
+        heartbeats.set_stage(submission.id, "submitting")
+        write_timings(job)
+        cache_result(job, cache_key)
+        journal.advance(submission.id, GRADED, passed=passed)
+        with timed("submit"):
+            client.submit_result(
+                submission,
+                passed=passed,
+                log_path=log_path,
+                report_path=job.report_path,
+            )
+        jobs_total.inc(outcome="passed")
 
     except INFRA_EXCEPTIONS as e:
         # infra error → cancel immediately
         log.exception("infrastructure error; cancelling submission... %s", e)
+        jobs_total.inc(outcome="cancelled")
         try:
             client.cancel_submission(submission)
         except Exception:
             log.exception("failed to cancel submission")
 
+    except FLSSubmissionRejected as e:
+        # unusable submission: tell the student why, without a traceback
+        log.info("rejected submission %s: %s", submission.id, e)
+
+        with log_path.open("a", encoding="utf-8") as f:
+            f.write(f"\n[fls] submission rejected: {e}\n")
+        write_timings(job)
+        journal.advance(submission.id, GRADED, passed=False)
+        jobs_total.inc(outcome="rejected")
+
+        try:
+            client.submit_result(
+                submission,
+                passed=False,
+                log_path=log_path,
+                report_path=job.report_path,
+            )
+        except Exception:
+            log.exception("failed to submit failure result")
+
     except Exception:
         # any other unexpected failure: fail submission but do not crash worker
         log.exception("unexpected error during grading")
@@ -225,21 +603,207 @@ def run_once() -> None:
         with log_path.open("a", encoding="utf-8") as f:
             f.write("\n--- grader traceback ---\n")
             traceback.print_exc(file=f)
+        write_timings(job)
+        journal.advance(submission.id, GRADED, passed=False)
+        jobs_total.inc(outcome="failed")
 
         try:
             client.submit_result(
                 submission,
                 passed=False,
                 log_path=log_path,
+                report_path=job.report_path,
             )
         except Exception:
             log.exception("failed to submit failure result")
 
     finally:
-        hb_proc.terminate()
-        hb_proc.join(timeout=2)
-        # best-effort cleanup
+        finish_job(job)
+
+
+# ------------------------------------------------------------
+# resuming after a restart
+# ------------------------------------------------------------
+
+
+def _resume_job(client: FLSClient, job: Job, entry: JournalEntry) -> None:
+    submission = job.submission
+    bootable = job.out_dir / "bootable.img"
+
+    def note(message: str) -> None:
+        log.info("submission %s: %s", submission.id, message)
+        with job.log_path.open("a", encoding="utf-8") as f:
+            f.write(f"\n[fls] {message}\n")
+
+    try:
+        if entry.state == GRADED and entry.passed is not None and job.log_path.exists():
+            note("worker restarted; uploading the result from before the restart")
+            passed = entry.passed
+
+        elif entry.state == BUILT and bootable.exists():
+            note("worker restarted; grading the image built before the restart")
+            heartbeats.set_stage(submission.id, "grading")
+            docker = docker_client_factory(log_path=job.log_path, timings=job.timings)
+            try:
+                docker.run_grader(bootable_img=bootable)
+                passed = True
+            except INFRA_EXCEPTIONS:
+                raise
+            except Exception:
+                log.exception("grading failed for submission %s", submission.id)
+                with job.log_path.open("a", encoding="utf-8") as f:
+                    f.write("\n--- grader traceback ---\n")
+                    traceback.print_exc(file=f)
+                passed = False
+            write_timings(job)
+            journal.advance(submission.id, GRADED, passed=passed)
+
+        else:
+            # nothing worth keeping was built; let any worker start over
+            log.info(
+                "handing back submission %s, interrupted while %s",
+                submission.id,
+                entry.state,
+            )
+            client.cancel_submission(submission)
+            jobs_total.inc(outcome="cancelled")
+            return
+
+        heartbeats.set_stage(submission.id, "submitting")
+        with timed("submit"):
+            client.submit_result(
+                submission,
+                passed=passed,
+                log_path=job.log_path,
+                report_path=job.report_path,
+            )
+        jobs_total.inc(outcome="resumed")
+
+    except Exception:
+        log.exception("failed to resume submission %s; cancelling it", submission.id)
+        jobs_total.inc(outcome="cancelled")
         try:
-            shutil.rmtree(base_dir)
+            client.cancel_submission(submission)
         except Exception:
-            log.warning("failed to clean up %s", base_dir)
+            log.exception("failed to cancel submission")
+
+
+def resume_jobs(max_workers: int = 1) -> None:
+    """
+    Finish the jobs a previous run of this worker left in the journal.
+
+    Jobs whose result was known are uploaded as they were, and built jobs
+    are graded again from their bootable.img. Jobs interrupted before their
+    build finished are handed back to the server. Job directories the
+    journal does not know about are removed.
+    """
+    entries = journal.entries()
+    known = {entry.base_dir for entry in entries}
+    if JOBS_DIR.is_dir():
+        for job_dir in JOBS_DIR.iterdir():
+            if job_dir not in known:
+                shutil.rmtree(job_dir, ignore_errors=True)
+
+    if not entries:
+        return
+    log.info("resuming %d job(s) from before the restart", len(entries))
+
+    def resume(entry: JournalEntry) -> None:
+        job = Job(
+            submission=entry.submission,
+            slot=entry.slot,
+            base_dir=entry.base_dir,
+            staged=entry.state != CLAIMED,
+        )
+        heartbeats.register(job.submission.id, log_path=job.log_path, stage=entry.state)
+        with _active_lock:
+            _active_jobs[job.submission.id] = job
+        try:
+            _resume_job(FLSClient(), job, entry)
+        finally:
+            finish_job(job)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resume") as pool:
+        for future in [pool.submit(resume, entry) for entry in entries]:
+            future.result()
+
+
+# ------------------------------------------------------------
+# main grading pass
+# ------------------------------------------------------------
+
+
+class Slot:
+    """
+    One grading lane of the worker.
+
+    With pipelining enabled, the slot claims and stages its next job in the
+    background while the current job's builder runs, so the next build can
+    start as soon as the current job finishes.
+    """
+
+    def __init__(self, index: int = 0, *, pipeline: bool = False):
+        self.index = index
+        self.pipeline = pipeline
+        self.client = FLSClient()
+        self._prefetcher = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=f"prefetch-{index}",
+        )
+        self._next: Future[Job | None] | None = None
+        # set when the last idle run_once already blocked on the server, so
+        # the caller need not sleep before polling again
+        self.waited_for_work = False
+
+    def _claim_and_stage(self) -> Job | None:
+        # separate client: requests sessions are not shared across threads
+        client = FLSClient()
+        job = claim_job(client, self.index)
+        if job is not None:
+            stage_job(client, job)
+            log.info(
+                "slot %d prefetched submission %s",
+                self.index,
+                job.submission.id,
+            )
+        return job
+
+    def _start_prefetch(self) -> None:
+        if self.pipeline and self._next is None:
+            self._next = self._prefetcher.submit(self._claim_and_stage)
+
+    def run_once(self) -> bool:
+        """
+        Grade at most one submission.
+
+        Returns True if a submission was graded, False if there was nothing
+        to do.
+        """
+        job = None
+        if self._next is not None:
+            job = self._next.result()
+            self._next = None
+
+        # a prefetch only checks the queue once, without waiting, so coming
+        # back empty-handed says nothing about the queue now
+        if job is None:
+            started = time.monotonic()
+            job = claim_job(self.client, self.index, wait=True)
+            # a long poll that failed or was refused returns right away
+            self.waited_for_work = time.monotonic() - started >= 1.0
+
+        if job is None:
+            return False
+
+        execute_job(self.client, job, on_build_start=self._start_prefetch)
+        return True
+
+
+def run_once(slot: int = 0) -> bool:
+    """
+    Claim and grade at most one submission without pipelining.
+
+    Returns True if a submission was claimed, False if there was nothing to
+    do.
+    """
+    return Slot(slot).run_once()
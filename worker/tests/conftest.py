@@ -0,0 +1,29 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# fls_worker.config reads the environment once, on import, so the worker's
+# state directory and server are pointed somewhere harmless before any test
+# module imports it. nothing listens on the discard port.
+_root = tempfile.mkdtemp(prefix="fls-tests-")
+atexit.register(shutil.rmtree, _root, True)
+
+os.environ.update(
+    {
+        "FLS_HOST_ROOT": _root,
+        "FLS_MOUNT_PREFIX": _root,
+        "FLS_GRADING_SECRET": "fls-tests",
+        "FLS_GRADING_BASEURL": "http://127.0.0.1:9",
+        "FLS_GRADING_GRADER": "fls-tests/grader",
+        "FLS_GRADING_BUILDER": "fls-tests/builder",
+        "FLS_WORKER_SLOTS": "1",
+        "FLS_BUILDER_POOL": "0",
+        "FLS_STAGE_CACHE_BYTES": "0",
+        "FLS_RESULT_CACHE_BYTES": "0",
+        "FLS_CCACHE": "0",
+        "FLS_STREAM_SUBMISSIONS": "0",
+        "FLS_LIVE_LOG_SECONDS": "0",
+        "FLS_METRICS_PORT": "0",
+    }
+)
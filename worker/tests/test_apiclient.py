@@ -0,0 +1,84 @@
+import pytest
+
+from fls_worker import apiclient
+from fls_worker.apiclient import FLSClient
+from fls_worker.benchserver import BenchServer, BenchState
+from fls_worker.errors import FLSNotFoundError
+from fls_worker.models import Submission
+
+LOG = b"build output\n" * 1000
+
+
+@pytest.fixture(autouse=True)
+def fresh_worker(monkeypatch):
+    # nothing has been heard from the server yet
+    monkeypatch.setattr(apiclient, "server_takes_gzip_logs", False)
+
+
+def serve(legacy: bool = False):
+    server = BenchServer(BenchState(tarball=b"", legacy=legacy), "fls-tests")
+    server.start()
+    client = FLSClient()
+    client.baseurl = server.baseurl
+    submission = server.state.add("alice", "x86_64")
+    server.state.claim(submission)
+    return server, client, submission
+
+
+def upload(client: FLSClient, submission, tmp_path) -> None:
+    log_path = tmp_path / "logs.txt"
+    log_path.write_bytes(LOG)
+    client.submit_result(
+        Submission.from_json(submission.to_json()),
+        passed=True,
+        log_path=log_path,
+    )
+
+
+def test_logs_are_sent_as_is_until_the_server_takes_gzip(tmp_path):
+    server, client, submission = serve()
+    try:
+        upload(client, submission, tmp_path)
+    finally:
+        server.shutdown()
+
+    assert submission.passed
+    # the stand-in counts the whole form for multipart uploads
+    assert submission.log_bytes > len(LOG)
+
+
+def test_logs_are_gzipped_once_the_server_says_so(tmp_path):
+    server, client, submission = serve()
+    try:
+        client.grading_heartbeat()
+        assert apiclient.server_takes_gzip_logs
+        upload(client, submission, tmp_path)
+    finally:
+        server.shutdown()
+
+    assert submission.passed
+    assert submission.log_bytes == len(LOG)
+
+
+def test_falls_back_when_the_server_no_longer_takes_gzip(tmp_path, monkeypatch):
+    # e.g. the portal was rolled back while the worker kept running
+    monkeypatch.setattr(apiclient, "server_takes_gzip_logs", True)
+    server, client, submission = serve(legacy=True)
+    try:
+        upload(client, submission, tmp_path)
+    finally:
+        server.shutdown()
+
+    assert submission.passed
+    assert submission.log_bytes > len(LOG)
+
+
+def test_errors_of_a_server_that_takes_gzip_are_raised(tmp_path):
+    server, client, submission = serve()
+    try:
+        client.grading_heartbeat()
+        server.state.submissions.clear()
+        with pytest.raises(FLSNotFoundError):
+            upload(client, submission, tmp_path)
+    finally:
+        server.shutdown()
@@ -0,0 +1,83 @@
+import tarfile
+
+import pytest
+
+from fls_worker import dockerclient
+from fls_worker.benchfakes import FakeDocker, FakeProfile
+from fls_worker.dockerclient import DockerClient
+from fls_worker.errors import FLSContainerFailure
+
+IMAGE_BYTES = 64 * 1024 * 1024
+
+
+@pytest.fixture
+def builder(tmp_path):
+    fake = FakeDocker(FakeProfile(image_bytes=IMAGE_BYTES))
+    container = fake.containers.create()
+    container.built = True
+    docker = DockerClient(log_path=tmp_path / "logs.txt", client=fake)  # type: ignore[arg-type]
+    return docker, container
+
+
+@pytest.mark.parametrize("compression", [True, False])
+def test_artifact_is_copied_sparse(builder, tmp_path, monkeypatch, compression):
+    monkeypatch.setattr(dockerclient, "FLS_ARTIFACT_COMPRESSION", compression)
+    docker, container = builder
+    dest = tmp_path / "bootable.img"
+
+    docker._extract_artifact(container, "/dist/bootable.img", dest)
+
+    with dest.open("rb") as f:
+        assert f.read(512) == b"\x55\xaa" * 256
+        assert f.read(1024 * 1024) == bytes(1024 * 1024)
+    assert dest.stat().st_size == IMAGE_BYTES
+    # only the chunk holding the boot sector is written out
+    assert dest.stat().st_blocks * 512 <= 1024 * 1024
+
+
+def test_artifact_over_the_size_limit(builder, tmp_path, monkeypatch):
+    monkeypatch.setattr(dockerclient, "MAX_ARTIFACT_BYTES", IMAGE_BYTES - 1)
+    docker, container = builder
+    dest = tmp_path / "bootable.img"
+
+    with pytest.raises(FLSContainerFailure, match="exceeded size limit"):
+        docker._extract_artifact(container, "/dist/bootable.img", dest)
+    assert not dest.exists()
+
+
+def test_artifact_stream_over_the_limit_leaves_nothing_behind(
+    builder, tmp_path, monkeypatch
+):
+    # the header is within the limit, but the stream goes on past it after
+    # part of the file was written
+    monkeypatch.setattr(dockerclient, "ARTIFACT_CHUNK", 4096)
+    monkeypatch.setattr(dockerclient, "MAX_ARTIFACT_BYTES", 64 * 1024)
+    docker, container = builder
+    data = b"\x55" * 64 * 1024
+    info = tarfile.TarInfo("bootable.img")
+    info.size = len(data)
+    header = info.tobuf(tarfile.GNU_FORMAT)
+
+    def archive_image(run):
+        yield header
+        yield data[: len(data) // 2]
+        yield data[len(data) // 2 :] + bytes(128 * 1024)
+        run.exit_code = 0
+
+    container.archive_image = archive_image
+    dest = tmp_path / "bootable.img"
+
+    with pytest.raises(FLSContainerFailure, match="exceeded size limit"):
+        docker._extract_artifact(container, "/dist/bootable.img", dest)
+    assert not dest.exists()
+
+
+def test_failed_artifact_stream(builder, tmp_path):
+    docker, container = builder
+    # bootable.img was never built, so tar fails without output
+    container.built = False
+    dest = tmp_path / "bootable.img"
+
+    with pytest.raises(FLSContainerFailure):
+        docker._extract_artifact(container, "/dist/bootable.img", dest)
+    assert not dest.exists()
@@ -0,0 +1,300 @@
+import importlib.util
+import os
+import re
+import struct
+import sys
+from pathlib import Path
+
+import pytest
+
+GRADE_PY = Path(__file__).resolve().parents[2] / "images" / "grade.py"
+
+SECTOR = 512
+
+
+@pytest.fixture(scope="module")
+def grade(tmp_path_factory):
+    # grade.py is a script that takes the image to grade from its command
+    # line as it is imported
+    image = tmp_path_factory.mktemp("grade") / "bootable.img"
+    argv = sys.argv
+    sys.argv = [str(GRADE_PY), str(image)]
+    try:
+        spec = importlib.util.spec_from_file_location("grade", GRADE_PY)
+        assert spec is not None and spec.loader is not None
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.argv = argv
+    return module
+
+
+@pytest.fixture
+def pipe():
+    r, w = os.pipe()
+    reader = os.fdopen(r, "rb", buffering=0)
+    writer = os.fdopen(w, "wb", buffering=0)
+    yield reader, writer
+    reader.close()
+    if not writer.closed:
+        writer.close()
+
+
+# -------------------------
+# console
+# -------------------------
+
+
+def test_lines_are_split_across_reads(grade, pipe):
+    reader, writer = pipe
+    console = grade.Console(reader)
+
+    # "\r\n" arrives split over two reads and still ends one line
+    writer.write(b"hel")
+    with pytest.raises(TimeoutError):
+        console.wait_for_line(re.compile("never"), 0.05)
+    writer.write(b"lo\r")
+    with pytest.raises(TimeoutError):
+        console.wait_for_line(re.compile("never"), 0.05)
+    writer.write(b"\nworld\r\n# ")
+
+    before: list[str] = []
+    console.wait_for_line(re.compile("^world$"), 1, before)
+    assert before == ["hello"]
+
+    # prompts are matched on the unfinished line
+    console.wait_for(grade.PROMPT_RE, 1)
+    assert console.partial == ""
+
+
+def test_lines_after_a_match_stay_queued(grade, pipe):
+    reader, writer = pipe
+    console = grade.Console(reader)
+    writer.write(b"one\ntwo\nthree\n")
+
+    lines: list[str] = []
+    assert console.wait_for_line(re.compile("one"), 1)
+    assert console.wait_for_line(re.compile("three"), 1, lines)
+    assert lines == ["two"]
+
+
+def test_fatal_output_fails_right_away(grade, pipe):
+    reader, writer = pipe
+    console = grade.Console(reader)
+    writer.write(b"[    1.0] Kernel panic - not syncing: VFS: Unable to mount root fs\n")
+
+    with pytest.raises(grade.GuestFailure, match="kernel panic: VFS: Unable to mount root fs"):
+        console.wait_for(grade.LOGIN_RE, 5)
+
+
+def test_boot_signatures_only_apply_when_set(grade, pipe):
+    reader, writer = pipe
+    console = grade.Console(reader)
+    writer.write(b"/bin/sh: can't access tty; job control turned off\n# ")
+    console.wait_for(grade.PROMPT_RE, 1)
+
+    console.signatures = grade.BOOT_SIGNATURES
+    writer.write(b"/bin/sh: can't access tty; job control turned off\n")
+    with pytest.raises(grade.GuestFailure, match="shell instead of a login prompt"):
+        console.wait_for(grade.LOGIN_RE, 1)
+
+
+def test_closed_console(grade, pipe):
+    reader, writer = pipe
+    console = grade.Console(reader)
+    writer.write(b"partial")
+    writer.close()
+
+    with pytest.raises(EOFError):
+        console.wait_for(grade.LOGIN_RE, 1)
+
+
+class FakeGuest:
+    """
+    QEMU's stdin: answers each command line like the guest shell would, by
+    echoing it and then printing what reply returns for it.
+    """
+
+    def __init__(self, console_writer, reply):
+        self.writer = console_writer
+        self.reply = reply
+
+    def write(self, data: bytes) -> None:
+        line = data.decode().rstrip("\n")
+        self.writer.write(f"{line}\r\n".encode())
+        self.writer.write(self.reply(line).encode())
+
+    def flush(self) -> None:
+        pass
+
+
+def vm_with(grade, pipe, reply):
+    reader, writer = pipe
+    vm = grade.VM(Path("unused.img"))
+    vm.console = grade.Console(reader)
+    vm.proc = type("Proc", (), {"stdin": FakeGuest(writer, reply)})()
+    return vm
+
+
+def framed(line: str, output: str, status: int) -> str:
+    token = re.search(r"BEGIN([0-9a-f]+)", line)[1]
+    return f"FLSCMDBEGIN{token}\r\n{output}FLSCMDEND{token} {status}\r\n# "
+
+
+def test_run_returns_output_and_status(grade, pipe):
+    vm = vm_with(grade, pipe, lambda line: framed(line, "a\r\nb\r\nno newline", 3))
+
+    result = vm.run("ls")
+
+    assert result.output == ["a", "b", "no newline"]
+    assert result.status == 3
+
+
+def test_run_ignores_sentinels_in_the_echo_and_output(grade, pipe):
+    # the command line itself never matches, and neither does a sentinel
+    # with another token
+    def reply(line):
+        return framed(line, "FLSCMDENDdeadbeef 0\r\nFLSCMDBEGINdeadbeef\r\n", 1)
+
+    vm = vm_with(grade, pipe, reply)
+    result = vm.run("cat /tmp/tricky")
+
+    assert result.output == ["FLSCMDENDdeadbeef 0", "FLSCMDBEGINdeadbeef"]
+    assert result.status == 1
+
+
+def test_run_fails_when_the_command_hangs(grade, pipe):
+    vm = vm_with(grade, pipe, lambda line: framed(line, "", 0).split("FLSCMDEND")[0])
+
+    with pytest.raises(grade.TestFailure, match="`sleep 100` did not finish within 0.2s"):
+        vm.run("sleep 100", timeout=0.2)
+
+
+# -------------------------
+# offline persistence check
+# -------------------------
+
+
+def gpt_image(
+    path: Path,
+    partitions: list[tuple[int, int]],
+    sector: int = SECTOR,
+    *,
+    count: int = 4,
+    entry_size: int = 128,
+) -> Path:
+    """
+    A sparse disk image with a GPT listing partitions as (first, last) LBAs.
+    The entry after the last partition is left empty.
+    """
+    entries_lba = 2
+    header = bytearray(92)
+    header[:8] = b"EFI PART"
+    struct.pack_into("<QII", header, 72, entries_lba, count, entry_size)
+
+    with path.open("wb") as f:
+        f.seek(sector)
+        f.write(header)
+        f.seek(entries_lba * sector)
+        for first, last in partitions:
+            entry = bytearray(min(max(entry_size, 48), 128))
+            entry[:16] = b"\x11" * 16
+            struct.pack_into("<QQ", entry, 32, first, last)
+            f.write(entry)
+        f.truncate(64 * 1024 * 1024)
+    return path
+
+
+def write_superblock(image: Path, offset: int, *, magic: int = 0xEF53, incompat: int = 0) -> None:
+    superblock = bytearray(1024)
+    struct.pack_into("<H", superblock, 56, magic)
+    struct.pack_into("<I", superblock, 96, incompat)
+    with image.open("r+b") as f:
+        f.seek(offset + 1024)
+        f.write(superblock)
+
+
+def test_reads_gpt_partitions(grade, tmp_path):
+    image = gpt_image(tmp_path / "disk.img", [(34, 2081), (2082, 4129)])
+
+    assert grade.read_gpt_partitions(image) == [
+        grade.Partition(34 * SECTOR, 2048 * SECTOR),
+        grade.Partition(2082 * SECTOR, 2048 * SECTOR),
+    ]
+
+
+def test_reads_gpt_with_4k_sectors(grade, tmp_path):
+    image = gpt_image(tmp_path / "disk.img", [(6, 1029)], sector=4096)
+
+    assert grade.read_gpt_partitions(image) == [grade.Partition(6 * 4096, 1024 * 4096)]
+
+
+@pytest.mark.parametrize(
+    "count, entry_size",
+    [
+        # would ask for about 16 EiB
+        (0xFFFFFFFF, 0xFFFFFFFF),
+        (16384, 128),
+        (4, 16),
+    ],
+)
+def test_implausible_gpt_headers_are_ignored(grade, tmp_path, count, entry_size):
+    image = gpt_image(tmp_path / "disk.img", [(34, 2081)], count=count, entry_size=entry_size)
+    assert grade.read_gpt_partitions(image) == []
+
+
+def test_images_without_gpt_have_no_partitions(grade, tmp_path):
+    image = tmp_path / "disk.img"
+    image.write_bytes(bytes(64 * 1024))
+    assert grade.read_gpt_partitions(image) == []
+
+
+def test_clean_ext_filesystem(grade, tmp_path):
+    image = gpt_image(tmp_path / "disk.img", [(34, 2081), (2082, 4129)])
+    clean, dirty = grade.read_gpt_partitions(image)
+    write_superblock(image, clean.offset, incompat=0x0002)
+    write_superblock(image, dirty.offset, incompat=0x0002 | 0x0004)
+
+    assert grade.clean_ext_filesystem(image, clean)
+    # the journal would have to be replayed first
+    assert not grade.clean_ext_filesystem(image, dirty)
+
+
+def test_other_filesystems_are_not_ext(grade, tmp_path):
+    image = gpt_image(tmp_path / "disk.img", [(34, 2081)])
+    (part,) = grade.read_gpt_partitions(image)
+    write_superblock(image, part.offset, magic=0x1234)
+
+    assert not grade.clean_ext_filesystem(image, part)
+
+
+def test_persisted_offline(grade, tmp_path, monkeypatch):
+    image = gpt_image(tmp_path / "disk.img", [(34, 2081), (2082, 4129)])
+    boot, root = grade.read_gpt_partitions(image)
+    write_superblock(image, boot.offset, magic=0x1234)
+    write_superblock(image, root.offset)
+    reads = []
+
+    def read_file_offline(image, part, path):
+        reads.append((part, path))
+        return "other\nhello\n"
+
+    monkeypatch.setattr(grade, "read_file_offline", read_file_offline)
+
+    assert grade.persisted_offline(image, "/hello", "hello")
+    assert not grade.persisted_offline(image, "/hello", "hell")
+    # only the ext filesystem is read
+    assert reads == [(root, "/hello"), (root, "/hello")]
+
+
+def test_persisted_offline_needs_a_clean_ext_filesystem(grade, tmp_path, monkeypatch):
+    image = gpt_image(tmp_path / "disk.img", [(34, 2081)])
+    (part,) = grade.read_gpt_partitions(image)
+    write_superblock(image, part.offset, incompat=0x0004)
+
+    def read_file_offline(image, part, path):
+        raise AssertionError("read a filesystem that needs recovery")
+
+    # the caller falls back to booting the image instead
+    monkeypatch.setattr(grade, "read_file_offline", read_file_offline)
+    assert not grade.persisted_offline(image, "/hello", "hello")
@@ -0,0 +1,148 @@
+import functools
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from fls_worker import worker
+from fls_worker.benchfakes import FakeDocker, FakeProfile
+from fls_worker.dockerclient import REPORT_NAME, DockerClient
+from fls_worker.images import images
+from fls_worker.journal import BUILT, CLAIMED, GRADED, STAGED, JobJournal
+from fls_worker.models import Submission
+
+
+def submission(id: int) -> Submission:
+    return Submission(
+        id=id,
+        user_id="alice",
+        tarball=f"{id}.tar.gz",
+        arch="x86_64",
+        created_at=datetime(2026, 1, 1, tzinfo=timezone.utc),
+    )
+
+
+def test_database_is_created_on_first_use(tmp_path):
+    path = tmp_path / "state" / "journal.db"
+    journal = JobJournal(path)
+    assert not path.exists()
+
+    journal.claimed(submission(1), slot=0, base_dir=tmp_path / "job")
+    assert path.exists()
+
+
+def test_entries_follow_the_job(tmp_path):
+    journal = JobJournal(tmp_path / "journal.db")
+    journal.claimed(submission(1), slot=2, base_dir=tmp_path / "job1")
+    journal.claimed(submission(2), slot=0, base_dir=tmp_path / "job2")
+    journal.advance(1, STAGED)
+    journal.advance(1, BUILT)
+    journal.advance(1, GRADED, passed=False)
+
+    # a reopened journal sees the same jobs, least recently updated first
+    entries = JobJournal(tmp_path / "journal.db").entries()
+    assert [(e.submission, e.slot, e.base_dir, e.state, e.passed) for e in entries] == [
+        (submission(2), 0, tmp_path / "job2", CLAIMED, None),
+        (submission(1), 2, tmp_path / "job1", GRADED, False),
+    ]
+
+    journal.forget(2)
+    journal.forget(1)
+    assert journal.entries() == []
+
+
+class RecordingClient:
+    """
+    Stands in for FLSClient and remembers what was sent to the server.
+    """
+
+    results: dict[int, tuple[bool, str, bool]] = {}
+    cancelled: list[int] = []
+
+    def submit_result(self, submission, *, passed, log_path, report_path=None):
+        has_report = report_path is not None and report_path.exists()
+        self.results[submission.id] = (passed, log_path.read_text(), has_report)
+
+    def cancel_submission(self, submission):
+        self.cancelled.append(submission.id)
+
+
+@pytest.fixture
+def resume(monkeypatch):
+    RecordingClient.results = {}
+    RecordingClient.cancelled = []
+    monkeypatch.setattr(worker, "FLSClient", RecordingClient)
+
+    fake = FakeDocker(FakeProfile(grade_seconds=0.05, grade_log_bytes=100))
+    images.use_client(fake)  # type: ignore[arg-type]
+    monkeypatch.setattr(
+        worker,
+        "docker_client_factory",
+        functools.partial(DockerClient, client=fake),  # type: ignore[arg-type]
+    )
+
+    for entry in worker.journal.entries():
+        worker.journal.forget(entry.submission.id)
+    return RecordingClient
+
+
+def leave_job(id: int, state: str, *, passed: bool | None = None, image: bool = False) -> Path:
+    """
+    Leave a job behind as a worker killed in state would have.
+    """
+    base_dir = worker.JOBS_DIR / f"job{id}"
+    (base_dir / "out").mkdir(parents=True)
+    (base_dir / "logs.txt").write_text("log before the restart\n")
+    if image:
+        (base_dir / "out" / "bootable.img").write_bytes(b"\x55\xaa")
+    worker.journal.claimed(submission(id), slot=0, base_dir=base_dir)
+    if state != CLAIMED:
+        worker.journal.advance(id, state, passed=passed)
+    return base_dir
+
+
+def test_resume_finishes_or_hands_back_every_job(resume):
+    leave_job(1, GRADED, passed=False)
+    leave_job(2, BUILT, image=True)
+    leave_job(3, STAGED)
+    leave_job(4, CLAIMED)
+    # built, but the image is gone
+    leave_job(5, BUILT)
+    stray = worker.JOBS_DIR / "stray"
+    stray.mkdir()
+
+    worker.resume_jobs(max_workers=2)
+
+    # the known verdict is uploaded as it was
+    passed, log, has_report = resume.results[1]
+    assert not passed
+    assert log.startswith("log before the restart\n")
+    assert "uploading the result from before the restart" in log
+    assert not has_report
+
+    # the built image is graded again
+    passed, log, has_report = resume.results[2]
+    assert passed
+    assert "grading the image built before the restart" in log
+    assert has_report
+
+    # nothing else was worth keeping
+    assert sorted(resume.cancelled) == [3, 4, 5]
+    assert set(resume.results) == {1, 2}
+
+    assert worker.journal.entries() == []
+    assert list(worker.JOBS_DIR.iterdir()) == []
+
+
+def test_regrading_records_the_verdict_before_uploading(resume, monkeypatch):
+    base_dir = leave_job(6, BUILT, image=True)
+    seen = []
+
+    def submit_result(self, submission, *, passed, log_path, report_path=None):
+        seen.append([(e.state, e.passed) for e in worker.journal.entries()])
+        assert (base_dir / "out" / REPORT_NAME).exists()
+
+    monkeypatch.setattr(RecordingClient, "submit_result", submit_result)
+    worker.resume_jobs()
+
+    assert seen == [[(GRADED, True)]]
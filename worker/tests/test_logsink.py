@@ -0,0 +1,64 @@
+from fls_worker.logsink import LogSink
+
+
+def test_short_logs_are_kept_whole(tmp_path):
+    path = tmp_path / "logs.txt"
+    with LogSink(path, head_bytes=10, tail_bytes=10) as sink:
+        sink.write(b"0123456789")
+        sink.write(b"abcdefghij", "stderr")
+
+    assert path.read_bytes() == b"0123456789abcdefghij"
+    assert sink.omitted == 0
+    assert sink.written == 20
+
+
+def test_head_and_tail_are_kept(tmp_path):
+    path = tmp_path / "logs.txt"
+    with LogSink(path, head_bytes=10, tail_bytes=5) as sink:
+        sink.write(b"0123456")
+        # the head ends in the middle of a chunk
+        sink.write(b"789abc", "stderr")
+        for _ in range(100):
+            sink.write(b"x" * 7)
+        sink.write(b"lmn")
+        sink.write(b"op", "stderr")
+
+    log = path.read_bytes()
+    assert log.startswith(b"0123456789\n\n====")
+    assert log.endswith(b"====\n\nlmnop")
+    assert log.count(b"LOG TRUNCATED") == 1
+    assert sink.omitted == 7 + 6 + 700 + 5 - 10 - 5
+    assert (
+        f"{sink.omitted} bytes omitted "
+        "(stdout 710 bytes, stderr 8 bytes in total)"
+    ).encode() in log
+    assert sink.written == 15
+
+
+def test_tail_only_from_a_single_chunk(tmp_path):
+    path = tmp_path / "logs.txt"
+    with LogSink(path, head_bytes=0, tail_bytes=4) as sink:
+        sink.write(b"a" * 1000 + b"end!")
+
+    log = path.read_bytes()
+    assert log.endswith(b"====\n\nend!")
+    assert sink.omitted == 1000
+
+
+def test_no_tail(tmp_path):
+    path = tmp_path / "logs.txt"
+    with LogSink(path, head_bytes=3, tail_bytes=0) as sink:
+        sink.write(b"abcdef")
+
+    assert path.read_bytes().startswith(b"abc\n\n====")
+    assert sink.omitted == 3
+
+
+def test_appends_to_the_job_log(tmp_path):
+    path = tmp_path / "logs.txt"
+    path.write_bytes(b"[fls] building\n")
+    with LogSink(path, head_bytes=10, tail_bytes=10) as sink:
+        sink.write(b"ok\n")
+    sink.close()
+
+    assert path.read_bytes() == b"[fls] building\nok\n"
@@ -0,0 +1,30 @@
+from fls_worker.metrics import JobTimings, TimingMarkers
+
+
+def markers(*chunks: bytes) -> list[tuple[str, float]]:
+    timings = JobTimings()
+    parser = TimingMarkers(timings)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return timings.phases
+
+
+def test_markers_are_picked_out_of_the_stream():
+    assert markers(
+        b"building\n[fls-timing] stage.ker",
+        b"nel 12.500\n[fls-timing] grade.boot 3.25\r\n",
+    ) == [("stage.kernel", 12.5), ("grade.boot", 3.25)]
+
+
+def test_markers_must_be_whole_lines():
+    # e.g. the student's kernel printing over the grader's console
+    assert markers(
+        b"echo [fls-timing] grade.boot 0.001\n",
+        b"[fls-timing] grade.boot 0.001 and more\n",
+        b"[fls-timing] grade.boot 99999999\n",
+        b"[fls-timing] grade.student 1\n",
+    ) == []
+
+
+def test_markers_per_stream_are_limited():
+    assert len(markers(b"[fls-timing] grade.boot 1\n" * 100)) == 64
@@ -0,0 +1,113 @@
+import json
+import os
+
+import pytest
+
+from fls_worker.resultcache import ResultCache, ResultKey, result_key
+
+MANIFEST = {"kernel": (0o755, ""), "kernel/config": (0o644, "k")}
+
+
+def key(manifest=MANIFEST, **kwargs) -> ResultKey:
+    args = {
+        "builder_image": "sha256:builder",
+        "grader_image": "sha256:grader",
+        "arch": "x86_64",
+        "scope": "alice",
+    }
+    return result_key(manifest, **{**args, **kwargs})
+
+
+@pytest.fixture
+def job(tmp_path):
+    log_path = tmp_path / "logs.txt"
+    log_path.write_bytes(b"build output\n")
+    report_path = tmp_path / "report.json"
+    report_path.write_text(json.dumps({"tests": []}))
+    return log_path, report_path
+
+
+def store(cache: ResultCache, k: ResultKey, job, submission_id: int = 1) -> None:
+    log_path, report_path = job
+    cache.store(
+        k,
+        submission_id=submission_id,
+        passed=True,
+        log_path=log_path,
+        report_path=report_path,
+    )
+
+
+def test_key_covers_tree_images_arch_and_student():
+    assert key() == key(dict(reversed(MANIFEST.items())))
+    for other in (
+        key({**MANIFEST, "kernel/config": (0o644, "k2")}),
+        key(builder_image="sha256:other"),
+        key(grader_image="sha256:other"),
+        key(arch="aarch64"),
+        key(scope="bob"),
+    ):
+        assert other.digest != key().digest
+
+
+def test_store_and_lookup(tmp_path, job):
+    cache = ResultCache(tmp_path / "cache", max_bytes=10**6)
+    assert cache.lookup(key()) is None
+
+    store(cache, key(), job, submission_id=7)
+    cached = cache.lookup(key())
+
+    assert cached is not None
+    assert cached.passed
+    assert cached.submission_id == 7
+    assert cached.log == b"build output\n"
+    assert json.loads(cached.report) == {"tests": []}
+    assert cache.lookup(key(scope="bob")) is None
+
+
+def test_report_is_optional(tmp_path, job):
+    log_path, report_path = job
+    report_path.unlink()
+    cache = ResultCache(tmp_path / "cache", max_bytes=10**6)
+    store(cache, key(), job)
+    assert cache.lookup(key()).report is None
+
+
+def test_unreadable_entries_are_dropped(tmp_path, job):
+    cache = ResultCache(tmp_path / "cache", max_bytes=10**6)
+    store(cache, key(), job)
+    entry = cache.root / key().digest
+    (entry / "result.json").write_text("{not json")
+
+    assert cache.lookup(key()) is None
+    assert not entry.exists()
+
+
+def test_entries_for_other_images_are_dropped(tmp_path, job):
+    cache = ResultCache(tmp_path / "cache", max_bytes=10**6)
+    old = key(grader_image="sha256:old")
+    store(cache, old, job)
+
+    store(cache, key(), job)
+
+    assert cache.lookup(old) is None
+    assert cache.lookup(key()) is not None
+
+
+def test_evicts_least_recently_used(tmp_path, job):
+    log_path, _ = job
+    log_path.write_bytes(b"x" * 1000)
+    cache = ResultCache(tmp_path / "cache", max_bytes=2500)
+    first, second, third = key(scope="a"), key(scope="b"), key(scope="c")
+    store(cache, first, job)
+    store(cache, second, job)
+    for k, mtime in ((first, 1000), (second, 2000)):
+        os.utime(cache.root / k.digest / "result.json", (mtime, mtime))
+
+    # a hit makes the first entry the newest
+    assert cache.lookup(first) is not None
+    store(cache, third, job)
+
+    assert cache.lookup(second) is None
+    assert cache.lookup(first) is not None
+    assert cache.lookup(third) is not None
@@ -0,0 +1,143 @@
+import hashlib
+import os
+
+from fls_worker import stagecache
+from fls_worker.stagecache import (STAGES, StageCache, StageCacheSession, stage_keys,
+                                   tree_digest, tree_manifest)
+
+MANIFEST = {
+    "Makefile": (0o644, "m"),
+    "busybox": (0o755, ""),
+    "busybox/config": (0o644, "b"),
+    "kernel": (0o755, ""),
+    "kernel/config": (0o644, "k"),
+    "user": (0o755, ""),
+    "user/init.c": (0o644, "u"),
+}
+
+
+def keys(manifest=MANIFEST, **kwargs) -> dict[str, str]:
+    args = {"builder_image": "sha256:builder", "arch": "x86_64", "scope": "alice"}
+    return stage_keys(manifest, **{**args, **kwargs})
+
+
+def changed(before: dict[str, str], after: dict[str, str]) -> list[str]:
+    return [stage for stage in STAGES if before[stage] != after[stage]]
+
+
+def test_tree_manifest_describes_files_and_directories(tmp_path):
+    (tmp_path / "kernel").mkdir()
+    (tmp_path / "kernel").chmod(0o755)
+    (tmp_path / "kernel/config").write_bytes(b"CONFIG_X=y\n")
+    (tmp_path / "kernel/config").chmod(0o600)
+
+    assert tree_manifest(tmp_path) == {
+        "kernel": (0o755, ""),
+        "kernel/config": (0o600, hashlib.sha256(b"CONFIG_X=y\n").hexdigest()),
+    }
+
+
+def test_keys_are_stable():
+    assert keys() == keys(dict(reversed(MANIFEST.items())))
+
+
+def test_a_stage_change_invalidates_it_and_later_stages():
+    edited = {**MANIFEST, "kernel/config": (0o644, "k2")}
+    assert changed(keys(), keys(edited)) == ["kernel", "user", "image"]
+
+
+def test_a_mode_change_counts():
+    edited = {**MANIFEST, "user/init.c": (0o755, "u")}
+    assert changed(keys(), keys(edited)) == ["user", "image"]
+
+
+def test_shared_files_invalidate_every_stage():
+    edited = {**MANIFEST, "Makefile": (0o644, "m2")}
+    assert changed(keys(), keys(edited)) == list(STAGES)
+
+    added = {**MANIFEST, "README": (0o644, "r")}
+    assert changed(keys(), keys(added)) == list(STAGES)
+
+
+def test_image_arch_and_student_are_part_of_every_key():
+    for kwargs in ({"builder_image": "sha256:other"}, {"arch": "aarch64"}, {"scope": "bob"}):
+        assert changed(keys(), keys(**kwargs)) == list(STAGES)
+
+
+def test_archives_in_an_older_layout_are_not_reused(monkeypatch):
+    before = keys()
+    monkeypatch.setattr(stagecache, "ARCHIVE_FORMAT", stagecache.ARCHIVE_FORMAT - 1)
+    assert changed(before, keys()) == list(STAGES)
+
+
+def test_tree_digest_covers_paths_modes_and_contents():
+    digest = tree_digest(MANIFEST)
+    assert tree_digest(dict(reversed(MANIFEST.items()))) == digest
+    assert tree_digest({**MANIFEST, "user/init.c": (0o644, "u2")}) != digest
+    assert tree_digest({**MANIFEST, "user/init.c": (0o600, "u")}) != digest
+    renamed = {k.replace("init.c", "main.c"): v for k, v in MANIFEST.items()}
+    assert tree_digest(renamed) != digest
+
+
+def archive(tmp_path, name: str, size: int):
+    path = tmp_path / f"{name}.export"
+    path.write_bytes(b"x" * size)
+    return path
+
+
+def age(cache: StageCache, key: str, mtime: float) -> None:
+    os.utime(cache.root / f"{key}.tar", (mtime, mtime))
+
+
+def test_store_and_link(tmp_path):
+    cache = StageCache(tmp_path / "cache", max_bytes=1000)
+    cache.store("k1", archive(tmp_path, "a", 10))
+
+    assert cache.link("k1", tmp_path / "hit.tar")
+    assert (tmp_path / "hit.tar").read_bytes() == b"x" * 10
+    assert not cache.link("k2", tmp_path / "miss.tar")
+    assert not (tmp_path / "miss.tar").exists()
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = StageCache(tmp_path / "cache", max_bytes=250)
+    cache.store("old", archive(tmp_path, "a", 100))
+    cache.store("used", archive(tmp_path, "b", 100))
+    age(cache, "old", 1000)
+    age(cache, "used", 2000)
+
+    # using an entry makes it the newest
+    assert cache.link("used", tmp_path / "hit.tar")
+    cache.store("new", archive(tmp_path, "c", 100))
+
+    remaining = sorted(p.stem for p in cache.root.glob("*.tar"))
+    assert remaining == ["new", "used"]
+
+
+def test_session_links_hits_and_lists_misses(tmp_path):
+    cache = StageCache(tmp_path / "cache", max_bytes=10**6)
+    first = StageCacheSession(cache, work_dir=tmp_path / "job1", arch="x86_64", scope="alice")
+    hits_dir = tmp_path / "hits1"
+    hits_dir.mkdir()
+    first.prepare(MANIFEST, builder_image="sha256:builder", hits_dir=hits_dir)
+    assert first.hits == []
+    for stage in ("busybox", "kernel"):
+        first.store(stage, archive(tmp_path, stage, 10))
+
+    # the same busybox, a different kernel
+    edited = {**MANIFEST, "kernel/config": (0o644, "k2")}
+    second = StageCacheSession(cache, work_dir=tmp_path / "job2", arch="x86_64", scope="alice")
+    hits_dir = tmp_path / "hits2"
+    hits_dir.mkdir()
+    second.prepare(edited, builder_image="sha256:builder", hits_dir=hits_dir)
+
+    assert second.hits == ["busybox"]
+    assert second.misses == ["kernel", "user", "image"]
+    assert sorted(p.name for p in hits_dir.iterdir()) == ["busybox.tar"]
+
+    # another student never sees them
+    other = StageCacheSession(cache, work_dir=tmp_path / "job3", arch="x86_64", scope="bob")
+    hits_dir = tmp_path / "hits3"
+    hits_dir.mkdir()
+    other.prepare(MANIFEST, builder_image="sha256:builder", hits_dir=hits_dir)
+    assert other.hits == []
@@ -0,0 +1,195 @@
+import gzip
+import io
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from fls_worker.errors import FLSSubmissionRejected
+from fls_worker.stagecache import tree_manifest
+from fls_worker.tarsafe import TarLimits, copy_sanitized, safe_extract_tar
+
+
+def make_tar(*members: tuple, compress: bool = True) -> bytes:
+    """
+    A tarball of members, each (name, contents) for a regular file, (name,
+    None) for a directory, or (name, TarInfo type, linkname) for anything
+    else.
+    """
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name, *rest in members:
+            info = tarfile.TarInfo(name)
+            if len(rest) == 2:
+                info.type, info.linkname = rest
+                tar.addfile(info)
+            elif rest[0] is None:
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o700
+                tar.addfile(info)
+            else:
+                info.size = len(rest[0])
+                info.mode = 0o640
+                tar.addfile(info, io.BytesIO(rest[0]))
+    data = buf.getvalue()
+    return gzip.compress(data) if compress else data
+
+
+def extract(tmp_path: Path, data: bytes, limits: TarLimits = TarLimits()) -> Path:
+    tarball = tmp_path / "submission.tar.gz"
+    tarball.write_bytes(data)
+    dest = tmp_path / "out"
+    dest.mkdir()
+    safe_extract_tar(tarball, dest, limits)
+    return dest
+
+
+def sanitize(data: bytes, limits: TarLimits = TarLimits()) -> tuple[dict, bytes]:
+    out = io.BytesIO()
+    manifest = copy_sanitized(io.BytesIO(data), out, limits)
+    return manifest, out.getvalue()
+
+
+def test_extracts_files_and_directories(tmp_path):
+    dest = extract(
+        tmp_path,
+        make_tar(
+            ("kernel", None),
+            ("kernel/config", b"CONFIG_X=y\n"),
+            ("user/init.c", b"int main;"),
+        ),
+    )
+
+    assert (dest / "kernel/config").read_bytes() == b"CONFIG_X=y\n"
+    assert (dest / "user/init.c").read_bytes() == b"int main;"
+    assert (dest / "kernel/config").stat().st_mode & 0o777 == 0o640
+    assert (dest / "kernel").stat().st_mode & 0o777 == 0o755
+
+
+def test_reads_uncompressed_tarballs(tmp_path):
+    dest = extract(tmp_path, make_tar(("a", b"x"), compress=False))
+    assert (dest / "a").read_bytes() == b"x"
+
+
+@pytest.mark.parametrize(
+    "member, message",
+    [
+        (("/etc/passwd", b"x"), "absolute path"),
+        (("../escape", b"x"), "path traversal"),
+        (("kernel/../../escape", b"x"), "path traversal"),
+        (("link", tarfile.SYMTYPE, "/etc/passwd"), "disallowed tar entry type"),
+        (("dev", tarfile.CHRTYPE, ""), "disallowed tar entry type"),
+        (("fifo", tarfile.FIFOTYPE, ""), "disallowed tar entry type"),
+    ],
+)
+def test_rejects_unsafe_members(tmp_path, member, message):
+    data = make_tar(member)
+    with pytest.raises(FLSSubmissionRejected, match=message):
+        extract(tmp_path, data)
+    with pytest.raises(FLSSubmissionRejected, match=message):
+        sanitize(data)
+
+
+def test_rejects_hardlinks(tmp_path):
+    data = make_tar(("a", b"x"), ("b", tarfile.LNKTYPE, "a"))
+    with pytest.raises(FLSSubmissionRejected, match="disallowed tar entry type"):
+        extract(tmp_path, data)
+
+
+@pytest.mark.parametrize(
+    "members",
+    [
+        # a file, then something inside it: tar -x fails on "a/b"
+        [("a", b"x"), ("a/b", b"y")],
+        [("a", b"x"), ("a/b", None)],
+        [("a", b"x"), ("./a/b/c", b"y")],
+        # a directory, explicit or implied, then a file of the same name
+        [("a", None), ("a", b"x")],
+        [("a/b", b"y"), ("a", b"x")],
+        # a file, then a directory of the same name
+        [("a", b"x"), ("a/", None)],
+    ],
+)
+def test_rejects_paths_that_conflict(tmp_path, members):
+    data = make_tar(*members)
+    with pytest.raises(FLSSubmissionRejected):
+        sanitize(data)
+    with pytest.raises(FLSSubmissionRejected):
+        extract(tmp_path, data)
+
+
+def test_accepts_repeated_paths_of_the_same_kind(tmp_path):
+    data = make_tar(("a/", None), ("./a", None), ("a/b", b"old"), ("a/b", b"new"))
+    manifest, _ = sanitize(data)
+    assert set(manifest) == {"a", "a/b"}
+    assert (extract(tmp_path, data) / "a/b").read_bytes() == b"new"
+
+
+def test_limits_the_number_of_entries(tmp_path):
+    data = make_tar(*[(f"f{i}", b"") for i in range(4)])
+    limits = TarLimits(max_files=3)
+    with pytest.raises(FLSSubmissionRejected, match="more than 3 entries"):
+        extract(tmp_path, data, limits)
+    with pytest.raises(FLSSubmissionRejected, match="more than 3 entries"):
+        sanitize(data, limits)
+
+
+def test_limits_the_size_of_each_file(tmp_path):
+    data = make_tar(("small", b"x" * 10), ("big", b"x" * 11))
+    with pytest.raises(FLSSubmissionRejected, match="big is larger than 10 bytes"):
+        extract(tmp_path, data, TarLimits(max_file_bytes=10))
+
+
+def test_limits_the_total_size(tmp_path):
+    data = make_tar(("a", b"x" * 600), ("b", b"x" * 600))
+    with pytest.raises(FLSSubmissionRejected, match="exceed 1000 bytes"):
+        sanitize(data, TarLimits(max_total_bytes=1000))
+
+
+def test_limits_the_decompressed_stream():
+    # headers count against the budget even though they hold no file data
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w", format=tarfile.PAX_FORMAT) as tar:
+        info = tarfile.TarInfo("a")
+        info.pax_headers = {"comment": "x" * 200_000}
+        tar.addfile(info, io.BytesIO())
+
+    limits = TarLimits(max_total_bytes=0, max_files=1)
+    assert limits.max_stream_bytes < 200_000
+    with pytest.raises(FLSSubmissionRejected, match="expands to more than"):
+        sanitize(gzip.compress(buf.getvalue()), limits)
+
+
+def test_rejects_corrupt_tarballs(tmp_path):
+    data = make_tar(("a", b"x" * 100000))
+    with pytest.raises(FLSSubmissionRejected, match="corrupt tarball"):
+        extract(tmp_path, data[: len(data) // 2])
+    with pytest.raises(FLSSubmissionRejected, match="corrupt tarball"):
+        sanitize(b"\x1f\x8b" + b"\0" * 100)
+
+
+def test_sanitized_stream_matches_extraction(tmp_path):
+    data = make_tar(
+        ("kernel/config", b"CONFIG_X=y\n"),
+        ("./user", None),
+        ("user/init.c", b"int main;"),
+        ("Makefile", b"all:\n"),
+    )
+    manifest, stream = sanitize(data)
+
+    # the manifest is what tree_manifest sees after extraction, so cache
+    # keys agree whether or not the submission was streamed
+    assert manifest == tree_manifest(extract(tmp_path, data))
+
+    # and the stream holds a plain copy, parents first
+    with tarfile.open(fileobj=io.BytesIO(stream)) as tar:
+        members = tar.getmembers()
+        assert [m.name for m in members] == [
+            "kernel",
+            "kernel/config",
+            "user",
+            "user/init.c",
+            "Makefile",
+        ]
+        assert all(m.uid == 0 and m.uname == "" for m in members)
+        assert tar.extractfile("kernel/config").read() == b"CONFIG_X=y\n"
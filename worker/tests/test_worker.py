@@ -0,0 +1,114 @@
+import functools
+import io
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+from fls_worker import worker
+from fls_worker.benchfakes import FakeDocker, FakeProfile
+from fls_worker.benchserver import make_tarball
+from fls_worker.dockerclient import DockerClient
+from fls_worker.images import images
+from fls_worker.models import Submission
+from fls_worker.resultcache import ResultCache
+
+
+def test_no_builder_pool_without_a_size(monkeypatch):
+    docker = FakeDocker(FakeProfile(builder_start_seconds=0))
+    monkeypatch.setattr(
+        worker, "docker_client_factory", functools.partial(DockerClient, client=docker)
+    )
+    monkeypatch.setattr(worker, "builder_pool", None)
+
+    worker.start_builder_pool(0)
+
+    # jobs create their own builders, so staging output reaches their logs
+    assert worker.builder_pool is None
+
+
+def test_an_empty_prefetch_is_followed_by_a_long_poll(monkeypatch):
+    now = [0.0]
+    claims = []
+
+    def claim_job(client, slot, wait=False):
+        claims.append(wait)
+        # the server held the request until its long poll ran out
+        now[0] += 25
+        return None
+
+    monkeypatch.setattr(worker, "claim_job", claim_job)
+    monkeypatch.setattr(worker.time, "monotonic", lambda: now[0])
+
+    slot = worker.Slot(pipeline=True)
+    prefetched: Future = Future()
+    prefetched.set_result(None)
+    slot._next = prefetched
+
+    assert not slot.run_once()
+    assert claims == [True]
+    # so the slot polls again right away instead of sleeping
+    assert slot.waited_for_work
+
+
+class StreamingClient:
+    """
+    Stands in for FLSClient, serving the same tarball for every submission.
+    """
+
+    def __init__(self):
+        self.tarball = make_tarball(64 * 1024, 16)
+        self.opened: list[int] = []
+        self.results: dict[int, tuple[bool, str]] = {}
+
+    def open_tarball(self, submission):
+        self.opened.append(submission.id)
+        return io.BufferedReader(io.BytesIO(self.tarball))  # type: ignore[arg-type]
+
+    def submit_result(self, submission, *, passed, log_path, report_path=None):
+        self.results[submission.id] = (passed, log_path.read_text())
+
+    def cancel_submission(self, submission):
+        raise AssertionError(f"cancelled submission {submission.id}")
+
+
+def test_streamed_submissions_are_downloaded_once(monkeypatch, tmp_path):
+    fake = FakeDocker(
+        FakeProfile(
+            builder_start_seconds=0,
+            build_seconds=0.05,
+            build_log_bytes=100,
+            grade_seconds=0.05,
+            grade_log_bytes=100,
+            image_bytes=1024 * 1024,
+        )
+    )
+    images.use_client(fake)  # type: ignore[arg-type]
+    monkeypatch.setattr(
+        worker, "docker_client_factory", functools.partial(DockerClient, client=fake)
+    )
+    monkeypatch.setattr(worker, "FLS_STREAM_SUBMISSIONS", True)
+    monkeypatch.setattr(worker, "result_cache", ResultCache(tmp_path / "results", 1 << 30))
+    monkeypatch.setattr(worker, "stage_cache", None)
+    monkeypatch.setattr(worker, "builder_pool", None)
+
+    client = StreamingClient()
+    for id in (1, 2):
+        job = worker.Job(
+            submission=Submission(
+                id=id,
+                user_id="alice",
+                tarball=f"{id}.tar.gz",
+                arch="x86_64",
+                created_at=datetime(2026, 1, 1, tzinfo=timezone.utc),
+            ),
+            slot=0,
+            base_dir=worker.JOBS_DIR / f"streamed{id}",
+        )
+        worker.stage_job(client, job)  # type: ignore[arg-type]
+        worker.execute_job(client, job)  # type: ignore[arg-type]
+
+    # the cache key comes from the stream that fills the builder
+    assert client.opened == [1, 2]
+    assert client.results[1][0]
+    passed, log = client.results[2]
+    assert passed
+    assert "[fls] cached result: submission 1 had identical files" in log